@@ -5,9 +5,132 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 REF_VOICE_PATH = os.path.join(BASE_DIR, "tts", "assets", "ref_voice.wav")
 
+# Dati locali persistenti (cache LLM, coda di pre-render, storage su filesystem, cache audio locale).
+# DATA_DIR permette di spostarli fuori dal repository (es. test e load test in una cartella temporanea)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(BASE_DIR), "data"))
+
+# Latenti di condizionamento pre-calcolati (uno per voce di riferimento)
+VOICE_PROFILE_DIR = os.path.join(BASE_DIR, "tts", "assets", "profiles")
+
 # --- MINIO CONFIG ---
 MINIO_ENDPOINT = "localhost:9000"
 MINIO_ACCESS_KEY = "admin"
 MINIO_SECRET_KEY = "password123"
 MINIO_BUCKET = "audio-tours"
-SECURE_URL = False # False in locale
\ No newline at end of file
+SECURE_URL = False # False in locale
+STORAGE_MAX_WORKERS = 8 # Upload/controlli concorrenti verso MinIO (endpoint batch)
+
+# Backend dello storage audio: "minio" oppure "filesystem" (sviluppo, test e benchmark senza MinIO)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "minio")
+STORAGE_POOL_SIZE = 32 # Connessioni HTTP riusate verso MinIO (≥ STORAGE_EXECUTOR_WORKERS x parti parallele)
+STORAGE_CONNECT_TIMEOUT = 3 # secondi
+STORAGE_READ_TIMEOUT = 30 # secondi
+STORAGE_RETRIES = 3 # Tentativi sugli errori di connessione / 5xx
+STORAGE_PART_SIZE = 5 * 1024 * 1024 # Oltre questa dimensione l'upload è multipart (minimo S3: 5 MiB)
+STORAGE_PARALLEL_PARTS = 4 # Parti caricate in parallelo per singolo upload multipart
+STORAGE_FS_ROOT = os.path.join(DATA_DIR, "objects")
+STORAGE_FS_BASE_URL = os.getenv("STORAGE_FS_BASE_URL", "/files") # Vuoto -> URL file://
+
+# Cache locale su disco davanti a MinIO (nodi edge sul sito): gli audio caldi vengono serviti direttamente dall'API
+LOCAL_CACHE_ENABLED = os.getenv("LOCAL_CACHE_ENABLED", "0") == "1"
+LOCAL_CACHE_DIR = os.path.join(DATA_DIR, "audio_cache")
+LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", str(2 * 1024 ** 3))) # 2 GiB
+LOCAL_CACHE_URL = "/audio" # Percorso da cui l'API serve i file in cache
+
+# Indice in memoria degli oggetti noti e degli URL firmati (evita stat_object/presign ad ogni cache hit)
+OBJECT_INDEX_MAX_ITEMS = 100_000
+OBJECT_INDEX_TTL = 6 * 3600 # secondi
+PRESIGNED_URL_EXPIRES = 24 * 3600 # validità degli URL firmati, secondi
+PRESIGNED_URL_MARGIN = 600 # gli URL in cache vengono rigenerati 10 minuti prima della scadenza
+
+# --- XTTS CONFIG ---
+# Politica di residenza del modello in memoria:
+#   "always"       -> caricato all'avvio, mai rilasciato
+#   "idle_timeout" -> caricato alla prima richiesta, rilasciato dopo XTTS_IDLE_TIMEOUT secondi di inattività
+#   "per_request"  -> caricato e rilasciato ad ogni generazione (comportamento storico)
+XTTS_MODEL_POLICY = "idle_timeout"
+XTTS_IDLE_TIMEOUT = 300 # secondi
+TTS_CHUNK_MAX_CHARS = 180 # Limite per chunk: oltre, la sintesi XTTS diventa lenta e degrada
+TTS_CHUNK_MIN_CHARS = 40 # Frammenti più corti vengono uniti al vicino
+# Micro-batching: frasi diverse richieste insieme vengono sintetizzate in un unico passaggio del modello
+# Frasi per batch (1 = nessun batching, latenza minima per richiesta). Disattivato finché check_batch_of_one
+# di experiments/tts_benchmarks/batching_benchmark.py non passa sul modello in produzione: l'audio in batch
+# finisce in cache con la stessa chiave di quello sintetizzato da solo, quindi deve essere equivalente.
+XTTS_BATCH_MAX_SIZE = 1
+XTTS_BATCH_MAX_WAIT_MS = 10 # Attesa massima per riempire un batch quando il motore è libero (più alta = più throughput)
+XTTS_BATCH_MAX_PENDING = 32 # Frasi in attesa di un batch oltre le quali si risponde 503
+XTTS_STREAM_CHUNK_SIZE = 20 # Token GPT per blocco audio in /stream-audio (più piccolo = primo audio prima)
+
+# --- MOTORI TTS (selezionabili per richiesta) ---
+TTS_DEFAULT_ENGINE = "xtts"
+TTS_QUALITY_ENGINES = {"fast": "piper", "high": "xtts"} # Campo "quality" di AudioGenerationRequest
+TTS_ENABLE_PIPER = True # Se il modello Piper manca, il nodo serve solo XTTS
+PIPER_MODE = "resident" # "resident" = sessione ONNX Runtime in processo, "subprocess" = `python -m piper` per frase
+PIPER_INTRA_OP_THREADS = 2 # Thread ONNX Runtime della sessione residente (una sintesi alla volta, vedi PiperEngine._lock)
+PIPER_INTER_OP_THREADS = 1
+# Audio "fast" servito subito, poi rigenerato con XTTS in background (coda di pre-render):
+# le richieste "fast" successive ricevono direttamente la versione XTTS
+TTS_UPGRADE_FAST_AUDIO = True
+TTS_UPGRADE_PRIORITY = -1 # Dopo i tour da pre-generare
+
+# --- CHIAVE DI CACHE AUDIO (vedi app/tts/cache_key.py) ---
+AUDIO_CACHE_KEY_VERSION = 1 # Da incrementare se cambia la derivazione della chiave
+AUDIO_CACHE_PREFIX = "audio"
+
+# --- PIPELINE AUDIO ---
+# "memory": tensore -> pipe ffmpeg -> put_object da BytesIO (nessun file temporaneo)
+# "file":   WAV temporaneo -> MP3 su disco -> fput_object (percorso storico, fallback)
+AUDIO_PIPELINE = "memory"
+AUDIO_FORMAT = "mp3" # "mp3" oppure "opus" (solo pipeline "memory")
+AUDIO_OUTPUT_RATE = 44100 # 24000 = frequenza nativa XTTS, salta il ricampionamento
+
+
+# --- POOL DI PROCESSI TTS (nodi senza GPU) ---
+# 0 = un solo XttsEngine nel processo dell'API (GPU o sviluppo).
+# K > 0 = K processi, ognuno con il suo modello residente e TTS_WORKER_THREADS thread PyTorch.
+# Regola pratica: TTS_PROCESS_WORKERS x TTS_WORKER_THREADS ≈ core fisici (es. 8 core -> 4 x 2 oppure 2 x 4).
+# Ogni worker tiene in RAM un modello completo (~2 GB).
+TTS_PROCESS_WORKERS = int(os.getenv("TTS_PROCESS_WORKERS", "0"))
+TTS_WORKER_THREADS = int(os.getenv("TTS_WORKER_THREADS", "2"))
+TTS_WORKER_PIN_CORES = True # Solo Linux: ogni worker su core dedicati
+TTS_WORKER_RESTART_DELAY = 2 # secondi di attesa prima di riavviare un worker morto
+TTS_WORKER_START_TIMEOUT = 600 # secondi per caricare il modello in un worker (il primo avvio può scaricarlo)
+TTS_WORKER_MAX_START_FAILURES = 3 # Avvii falliti di fila oltre i quali, senza worker pronti, i lavori in coda falliscono
+TTS_JOB_TIMEOUT = 300 # secondi: attesa massima di un lavoro del pool (coda + sintesi)
+
+
+# --- EXECUTOR (lavoro bloccante fuori dall'event loop) ---
+# Oltre WORKERS + MAX_QUEUE richieste pendenti si risponde 503/429
+TTS_EXECUTOR_WORKERS = max(1, TTS_PROCESS_WORKERS) # Un thread per worker TTS: ognuno attende il suo processo
+TTS_EXECUTOR_MAX_QUEUE = 8
+FAST_TTS_EXECUTOR_WORKERS = 2 # Motori veloci (Piper): non aspettano dietro a XTTS. Con Piper residente la sintesi è serializzata, il secondo thread codifica
+FAST_TTS_EXECUTOR_MAX_QUEUE = 16
+STORAGE_EXECUTOR_WORKERS = 16
+STORAGE_EXECUTOR_MAX_QUEUE = 256
+
+
+
+# --- PRE-RENDER (cache audio riscaldata prima dei visitatori) ---
+PRERENDER_DB_PATH = os.path.join(DATA_DIR, "prerender_queue.sqlite")
+PRERENDER_MAX_ATTEMPTS = 3 # Tentativi per frase prima di segnarla "failed"
+PRERENDER_IDLE_POLL = 0.5 # secondi: ogni quanto il worker ricontrolla se il TTS è libero dalle richieste on-demand
+PRERENDER_ON_OPTIMIZE = True # Accoda automaticamente i tts_chunks di ogni descrizione ottimizzata
+PRERENDER_OPTIMIZE_PRIORITY = 1 # Priorità dei chunk appena scritti in authoring (i tour accodati a mano hanno 0 di default)
+PRERENDER_RETENTION = 7 * 24 * 3600 # secondi: i job "done"/"failed" più vecchi vengono cancellati (la tabella non cresce all'infinito)
+
+
+# --- CACHE LLM ---
+LLM_CACHE_PATH = os.path.join(DATA_DIR, "llm_cache.sqlite")
+LLM_CACHE_MAX_ENTRIES = 20_000
+
+
+# --- OLLAMA ---
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_NUM_PARALLEL = 2 # Deve coincidere con OLLAMA_NUM_PARALLEL del server Ollama
+OLLAMA_MAX_QUEUE = 16 # Richieste in attesa oltre le quali si risponde 429
+OLLAMA_KEEP_ALIVE = "30m" # Il modello resta in memoria tra una sessione di authoring e l'altra
+OLLAMA_TIMEOUT = 180 # secondi, per una generazione completa
+OLLAMA_CONNECT_TIMEOUT = 5
+OLLAMA_RETRIES = 2
+OLLAMA_RETRY_BACKOFF = 1.0 # secondi, raddoppia ad ogni tentativo
+LLM_REPAIR_ATTEMPTS = 1 # Richieste di correzione al modello se la risposta non rispetta lo schema
\ No newline at end of file
@@ -0,0 +1,98 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import (
+    TTS_EXECUTOR_WORKERS, TTS_EXECUTOR_MAX_QUEUE,
+    FAST_TTS_EXECUTOR_WORKERS, FAST_TTS_EXECUTOR_MAX_QUEUE,
+    STORAGE_EXECUTOR_WORKERS, STORAGE_EXECUTOR_MAX_QUEUE,
+)
+
+
+class ExecutorSaturated(Exception):
+    """Coda dell'executor piena: la richiesta va respinta (back-pressure)"""
+
+    def __init__(self, name: str, status_code: int, retry_after: int):
+        super().__init__(f"Executor '{name}' saturo, riprovare più tardi")
+        self.name = name
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Thread pool con limite sulla profondità della coda.
+    Esegue codice bloccante fuori dall'event loop di asyncio; oltre max_workers + max_queue
+    lavori pendenti rifiuta subito la richiesta con ExecutorSaturated invece di accodarla all'infinito.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, status_code: int = 503, retry_after: int = 5):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._pending = 0 # In esecuzione + in coda
+        self.rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def pending(self) -> int:
+        """Lavori in esecuzione + in coda"""
+        with self._lock:
+            return self._pending
+
+    async def run(self, fn, *args, **kwargs):
+        """Esegue fn(*args, **kwargs) nel pool e ne attende il risultato senza bloccare l'event loop"""
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise ExecutorSaturated(self.name, self.status_code, self.retry_after)
+            self._pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = self._pending
+        return {
+            "workers": self.max_workers,
+            "running": min(pending, self.max_workers),
+            "queued": max(0, pending - self.max_workers),
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- EXECUTOR GLOBALI ---
+# TTS: pochi slot (il modello è uno solo), se la coda è piena il servizio è sovraccarico -> 503
+tts_executor = BoundedExecutor("tts", TTS_EXECUTOR_WORKERS, TTS_EXECUTOR_MAX_QUEUE, status_code=503, retry_after=10)
+# TTS veloce (Piper): pool separato, la bassa latenza non deve dipendere dalla coda XTTS
+fast_tts_executor = BoundedExecutor("tts-fast", FAST_TTS_EXECUTOR_WORKERS, FAST_TTS_EXECUTOR_MAX_QUEUE, status_code=503, retry_after=2)
+# Storage: chiamate brevi a MinIO, pool separato così i cache hit non aspettano il TTS
+# (l'LLM non usa thread: il client Ollama è asincrono, vedi app/llm/client.py)
+storage_executor = BoundedExecutor("storage", STORAGE_EXECUTOR_WORKERS, STORAGE_EXECUTOR_MAX_QUEUE, status_code=429, retry_after=1)
+
+
+def executors_stats() -> dict:
+    return {e.name: e.stats() for e in (tts_executor, fast_tts_executor, storage_executor)}
+
+
+def shutdown_executors():
+    for executor in (tts_executor, fast_tts_executor, storage_executor):
+        executor.shutdown()
@@ -0,0 +1,123 @@
+import time
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from ollama import AsyncClient, ResponseError
+
+from app.config import (
+    OLLAMA_HOST, OLLAMA_NUM_PARALLEL, OLLAMA_MAX_QUEUE, OLLAMA_KEEP_ALIVE,
+    OLLAMA_TIMEOUT, OLLAMA_CONNECT_TIMEOUT, OLLAMA_RETRIES, OLLAMA_RETRY_BACKOFF
+)
+from app.executors import ExecutorSaturated
+from app.metrics import observe_llm_response
+
+
+class OllamaClient:
+    """
+    Client Ollama asincrono condiviso da tutti i servizi LLM.
+    - Pool di connessioni HTTP keep-alive (un solo httpx.AsyncClient per processo).
+    - Semaforo sul numero di richieste parallele, allineato a OLLAMA_NUM_PARALLEL del server.
+    - Oltre max_queue richieste in attesa risponde subito 429 (stessa back-pressure degli executor).
+    - keep_alive esplicito, timeout e retry con backoff sugli errori transitori.
+    """
+
+    def __init__(self, host: str = OLLAMA_HOST, max_concurrency: int = OLLAMA_NUM_PARALLEL, max_queue: int = OLLAMA_MAX_QUEUE,
+                 keep_alive=OLLAMA_KEEP_ALIVE, timeout: float = OLLAMA_TIMEOUT, retries: int = OLLAMA_RETRIES):
+        self.host = host
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.retries = retries
+
+        self._client = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending = 0 # In esecuzione + in attesa del semaforo
+        self.rejected = 0
+        self.retried = 0
+
+    def _get_client(self) -> AsyncClient:
+        """Crea il client HTTP al primo utilizzo (dentro l'event loop che lo userà)"""
+        if self._client is None:
+            self._client = AsyncClient(
+                host=self.host,
+                timeout=httpx.Timeout(self.timeout, connect=OLLAMA_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.max_concurrency * 2, max_keepalive_connections=self.max_concurrency),
+            )
+        return self._client
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        """Errori per cui ha senso riprovare: rete, timeout, server occupato o in errore"""
+        if isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, ResponseError):
+            return error.status_code == 429 or error.status_code >= 500
+        return False
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Ammissione (o 429 se la coda è piena) e attesa di uno slot del semaforo"""
+        if self._pending >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise ExecutorSaturated("llm", 429, 5)
+
+        self._pending += 1
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self._pending -= 1
+
+    async def chat(self, model: str, messages: list, **kwargs):
+        """Come ollama.chat, con limiti di concorrenza, keep_alive e retry"""
+        async with self._slot():
+            attempt = 0
+            while True:
+                try:
+                    start = time.perf_counter()
+                    response = await self._get_client().chat(model=model, messages=messages, keep_alive=self.keep_alive, **kwargs)
+                    observe_llm_response(model, response, time.perf_counter() - start)
+                    return response
+                except Exception as e:
+                    if attempt >= self.retries or not self._is_transient(e):
+                        raise
+                    attempt += 1
+                    self.retried += 1
+                    delay = OLLAMA_RETRY_BACKOFF * 2 ** (attempt - 1)
+                    print(f"Ollama: errore transitorio ({e}), tentativo {attempt}/{self.retries} tra {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    async def chat_stream(self, model: str, messages: list, **kwargs) -> AsyncIterator:
+        """
+        Come ollama.chat(stream=True): produce i frammenti della risposta man mano che arrivano.
+        Lo slot resta occupato per tutta la durata dello stream. Nessun retry: i token già emessi non si possono ritirare.
+        """
+        async with self._slot():
+            start = time.perf_counter()
+            stream = await self._get_client().chat(model=model, messages=messages, keep_alive=self.keep_alive, stream=True, **kwargs)
+            async for part in stream:
+                if part.get("done"):
+                    # L'ultimo frammento porta i conteggi di token e i tempi
+                    observe_llm_response(model, part, time.perf_counter() - start)
+                yield part
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": min(self._pending, self.max_concurrency),
+            "queued": max(0, self._pending - self.max_concurrency),
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "retried": self.retried,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+# Istanza condivisa dai servizi LLM
+ollama_client = OllamaClient()
@@ -0,0 +1,144 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Optional
+
+from app.config import LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES
+from app.executors import BoundedExecutor, ExecutorSaturated, storage_executor
+
+
+class LLMResponseCache:
+    """
+    Cache persistente (SQLite) delle risposte LLM già validate.
+    Chiave: modello + versione del template di prompt + input normalizzato.
+    Oltre max_entries vengono eliminate le voci usate meno di recente.
+    Il database viene aperto dal lifespan (init), non all'import; le query girano nello storage_executor.
+    Finché non è aperta (o se l'executor è saturo) la cache si comporta come vuota.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 executor: BoundedExecutor = storage_executor):
+        self.path = path
+        self.max_entries = max_entries
+        self.executor = executor
+
+        # Una sola connessione condivisa tra i thread dell'executor, protetta da lock
+        self._lock = threading.Lock()
+        self._conn = None
+        self.entries = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def init(self):
+        """Apre (o crea) il database: chiamata dal lifespan"""
+        await self.executor.run(self._init_sync)
+
+    def _init_sync(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                service TEXT NOT NULL,
+                model TEXT NOT NULL,
+                template_version TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        conn.commit()
+        with self._lock:
+            self._conn = conn
+            self.entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def normalize_input(text: str) -> str:
+        """Spazi multipli/a capo collassati e bordi rimossi: stesse parole -> stessa chiave"""
+        return re.sub(r"\s+", " ", text).strip()
+
+    @classmethod
+    def make_key(cls, service: str, model: str, template_version: str, text: str) -> str:
+        raw = "\x1f".join((service, model, template_version, cls.normalize_input(text)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, service: str, model: str, template_version: str, text: str) -> Optional[dict]:
+        if self._conn is None:
+            return None
+        key = self.make_key(service, model, template_version, text)
+        try:
+            return await self.executor.run(self._get_sync, key)
+        except ExecutorSaturated:
+            return None
+
+    async def set(self, service: str, model: str, template_version: str, text: str, response: dict):
+        if self._conn is None:
+            return
+        key = self.make_key(service, model, template_version, text)
+        try:
+            await self.executor.run(self._set_sync, key, service, model, template_version, response)
+        except ExecutorSaturated:
+            print(f"Cache LLM: executor saturo, risposta non salvata ({service})")
+
+    def _get_sync(self, key: str) -> Optional[dict]:
+        with self._lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def _set_sync(self, key: str, service: str, model: str, template_version: str, response: dict):
+        now = time.time()
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, service, model, template_version, json.dumps(response, ensure_ascii=False), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Tiene al massimo max_entries voci, eliminando le meno usate di recente"""
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            count = self.max_entries
+        self.entries = count
+
+    def stats(self) -> dict:
+        """Contatori in memoria: non tocca il database (chiamata anche dall'event loop, es. /metrics)"""
+        total = self.hits + self.misses
+        return {
+            "entries": self.entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# Istanza condivisa dai servizi LLM (il database viene aperto nel lifespan dell'app)
+llm_cache = LLMResponseCache()
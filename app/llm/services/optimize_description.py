@@ -1,11 +1,37 @@
-import ollama
-import json
 from app.schemas import DescriptionResponse
+from app.llm.response_cache import llm_cache
+from app.llm.structured import output_schema, structured_chat, parse_structured, parse_stats, JsonArrayStreamParser
+from app.llm.client import ollama_client
+from app.executors import ExecutorSaturated
+from app.metrics import LLM_PARSE_FAILURES
+from app.tts.sentence_chunker import SentenceChunker
 
 MODEL_NAME = "qwen2.5:7b" 
+PROMPT_VERSION = "description-v4" # Da incrementare ad ogni modifica del prompt (o del chunking): invalida la cache
+
+# Schema per il decoding vincolato, derivato da DescriptionResponse
+DESCRIPTION_SCHEMA = output_schema(DescriptionResponse, ["full_text_optimized", "tts_chunks"])
+# In streaming i chunk vengono generati PRIMA del testo completo, così arrivano subito al client
+STREAM_SCHEMA = output_schema(DescriptionResponse, ["tts_chunks", "full_text_optimized"])
+
+# Garantisce il limite di 180 caratteri anche se l'LLM non lo rispetta
+chunker = SentenceChunker()
+
+def build_description(data: dict, chunks: list = None) -> DescriptionResponse:
+    """
+    Valida l'output dell'LLM (solleva eccezione se non è utilizzabile) e ri-divide i chunk fuori limite.
+    chunks: chunk già validati (streaming), usati al posto di quelli in data.
+    """
+    if not data["full_text_optimized"].strip() or not data["tts_chunks"]:
+        raise ValueError("full_text_optimized e tts_chunks non possono essere vuoti")
+    return DescriptionResponse(
+        full_text_optimized=data["full_text_optimized"],
+        tts_chunks=chunks if chunks else chunker.rechunk(data["tts_chunks"])
+    )
+
+def build_prompt(original_text: str) -> str:
+    """Prompt completo (condiviso dalla versione normale e da quella in streaming)"""
 
-def generate_optimized_description(original_text: str) -> DescriptionResponse:
-    
     # --- PERSONA & STILE --- Pattern Persona ed Audience
     system_role = (
         "Sei un Divulgatore Culturale esperto e carismatico (stile Alberto Angela). "
@@ -70,23 +96,94 @@ def generate_optimized_description(original_text: str) -> DescriptionResponse:
     Rispondi SOLO col JSON.
     """
 
-    try:
-        response = ollama.chat(model=MODEL_NAME, messages=[{'role': 'user', 'content': prompt}])
-        raw_content = response['message']['content']
-        
-        # Pulizia JSON da possibili refusi
-        clean_json = raw_content.replace("```json", "").replace("```", "").strip()
-        data = json.loads(clean_json)
-        
-        return DescriptionResponse(
-            full_text_optimized=data["full_text_optimized"],
-            tts_chunks=data["tts_chunks"]
-        )
+    return prompt
+
+async def generate_optimized_description(original_text: str) -> DescriptionResponse:
+
+    # --- CACHE: stesso modello, stesso prompt, stesso input -> stessa risposta ---
+    cached = await llm_cache.get("description", MODEL_NAME, PROMPT_VERSION, original_text)
+    if cached is not None:
+        return DescriptionResponse(cached=True, **cached)
 
+    prompt = build_prompt(original_text)
+
+    try:
+        # Output vincolato allo schema, con riparazione limitata se il JSON non è valido
+        result = await structured_chat("description", MODEL_NAME, prompt, DESCRIPTION_SCHEMA, build_description)
+    except ExecutorSaturated:
+        # Back-pressure: meglio un 429 che un fallback
+        raise
     except Exception as e:
         print(f"Errore LLM Descrizione: {e}")
-        # Fallback sicuro: restituisce il testo originale diviso grossolanamente
-        return DescriptionResponse(
-            full_text_optimized=original_text,
-            tts_chunks=[original_text] #evita crash
-        )
\ No newline at end of file
+        result = None
+
+    if result is not None:
+        # Solo le risposte valide finiscono in cache (mai il fallback)
+        await llm_cache.set("description", MODEL_NAME, PROMPT_VERSION, original_text, result.model_dump(exclude={"cached"}))
+        return result
+
+    # Fallback sicuro: restituisce il testo originale diviso in chunk entro il limite
+    return DescriptionResponse(
+        full_text_optimized=original_text,
+        tts_chunks=chunker.split_text(original_text)
+    )
+
+async def stream_optimized_description(original_text: str):
+    """
+    Versione in streaming: produce eventi (dict) man mano che l'LLM scrive.
+      {"type": "chunk", "index": i, "text": "..."}  appena una frase di tts_chunks è completa
+      {"type": "done", ...DescriptionResponse}       alla fine, con la risposta completa
+    """
+    cached = await llm_cache.get("description", MODEL_NAME, PROMPT_VERSION, original_text)
+    if cached is not None:
+        for index, chunk in enumerate(cached["tts_chunks"]):
+            yield {"type": "chunk", "index": index, "text": chunk}
+        yield {"type": "done", **DescriptionResponse(cached=True, **cached).model_dump()}
+        return
+
+    parse_stats["calls"]["description_stream"] += 1
+    parser = JsonArrayStreamParser("tts_chunks")
+    # Stessa validazione di chunker.rechunk, un passo alla volta: l'ultimo chunk resta in sospeso
+    # finché non arriva il successivo, perché un frammento minuscolo potrebbe ancora unirsi a lui.
+    # Così i chunk emessi (e messi in cache) sono identici a quelli dell'endpoint non in streaming.
+    merged = []
+    chunks = []
+
+    try:
+        async for part in ollama_client.chat_stream(
+            model=MODEL_NAME, messages=[{'role': 'user', 'content': build_prompt(original_text)}], format=STREAM_SCHEMA
+        ):
+            for llm_chunk in parser.feed(part['message']['content']):
+                for piece in chunker.split_chunk(llm_chunk):
+                    chunker.merge_next(merged, piece)
+                # Tutti i chunk tranne l'ultimo sono definitivi
+                while len(chunks) < len(merged) - 1:
+                    yield {"type": "chunk", "index": len(chunks), "text": merged[len(chunks)]}
+                    chunks.append(merged[len(chunks)])
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        print(f"Errore LLM Descrizione (stream): {e}")
+
+    # Fine dello stream: anche l'ultimo chunk è definitivo
+    while len(chunks) < len(merged):
+        yield {"type": "chunk", "index": len(chunks), "text": merged[len(chunks)]}
+        chunks.append(merged[len(chunks)])
+
+    try:
+        result = build_description(parse_structured(parser.buffer, STREAM_SCHEMA), chunks)
+        await llm_cache.set("description", MODEL_NAME, PROMPT_VERSION, original_text, result.model_dump(exclude={"cached"}))
+    except Exception as e:
+        parse_stats["parse_failures"]["description_stream"] += 1
+        LLM_PARSE_FAILURES.inc(service="description_stream")
+        print(f"Errore parsing JSON (description_stream): {e}")
+        parse_stats["fallbacks"]["description_stream"] += 1
+        # Fallback: i chunk già emessi restano validi; altrimenti il testo originale
+        if chunks:
+            result = DescriptionResponse(full_text_optimized=" ".join(chunks), tts_chunks=chunks)
+        else:
+            result = DescriptionResponse(full_text_optimized=original_text, tts_chunks=chunker.split_text(original_text))
+            for index, chunk in enumerate(result.tts_chunks):
+                yield {"type": "chunk", "index": index, "text": chunk}
+
+    yield {"type": "done", **result.model_dump()}
\ No newline at end of file
@@ -1,10 +1,25 @@
-import ollama
-import json
 from app.schemas import TitleResponse
+from app.llm.response_cache import llm_cache
+from app.llm.structured import output_schema, structured_chat
 
 MODEL_NAME = "qwen2.5:7b"
+PROMPT_VERSION = "title-v2" # Da incrementare ad ogni modifica del prompt: invalida la cache
 
-def generate_optimized_title(original_title: str) -> TitleResponse:
+# Schema per il decoding vincolato, derivato da TitleResponse
+TITLE_SCHEMA = output_schema(TitleResponse, ["options", "best_option"])
+
+def build_title(original_title: str, data: dict) -> TitleResponse:
+    """Valida l'output dell'LLM (solleva eccezione se non è utilizzabile)"""
+    if not data["options"] or not data["best_option"]:
+        raise ValueError("options e best_option non possono essere vuoti")
+    return TitleResponse(original=original_title, **data)
+
+async def generate_optimized_title(original_title: str) -> TitleResponse:
+
+    # --- CACHE: stesso modello, stesso prompt, stesso input -> stessa risposta ---
+    cached = await llm_cache.get("title", MODEL_NAME, PROMPT_VERSION, original_title)
+    if cached is not None:
+        return TitleResponse(original=original_title, cached=True, **cached)
     
     # --- 1. PATTERN: PERSONA ---
     persona = (
@@ -53,29 +68,17 @@ def generate_optimized_title(original_title: str) -> TitleResponse:
 
     print(f" Chiamata a {MODEL_NAME} per ottimizzazione titoli...")
 
-    # Chiamata a Ollama
-    response = ollama.chat(model=MODEL_NAME, messages=[
-        {'role': 'user', 'content': full_prompt},
-    ])
+    # Chiamata a Ollama con output vincolato allo schema (niente più pulizia di stringhe)
+    result = await structured_chat("title", MODEL_NAME, full_prompt, TITLE_SCHEMA, lambda data: build_title(original_title, data))
 
-    raw_content = response['message']['content']
-    
-    # Parsing del JSON (Pulizia nel caso di refusi)
-    try:
-        # pulizia ```json ... ```,
-        clean_json = raw_content.replace("```json", "").replace("```", "").strip()
-        data = json.loads(clean_json)
-        
-        return TitleResponse(
-            original=original_title,
-            options=data["options"],
-            best_option=data["best_option"]
-        )
-    except Exception as e:
-        print(f" Errore parsing JSON: {e}")
-        # Fallback in caso di errore
-        return TitleResponse(
-            original=original_title,
-            options=[original_title], 
-            best_option=original_title
-        )
\ No newline at end of file
+    if result is not None:
+        # Solo le risposte valide finiscono in cache (mai il fallback)
+        await llm_cache.set("title", MODEL_NAME, PROMPT_VERSION, original_title, result.model_dump(include={"options", "best_option"}))
+        return result
+
+    # Fallback in caso di errore
+    return TitleResponse(
+        original=original_title,
+        options=[original_title], 
+        best_option=original_title
+    )
\ No newline at end of file
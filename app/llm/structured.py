@@ -0,0 +1,131 @@
+import json
+from collections import Counter
+from typing import Callable, Optional, Sequence, Type, TypeVar
+
+from pydantic import BaseModel
+
+from app.config import LLM_REPAIR_ATTEMPTS
+from app.llm.client import ollama_client
+from app.metrics import LLM_PARSE_FAILURES
+
+T = TypeVar("T")
+
+# Metriche di parsing per servizio (esposte da /llm/status)
+parse_stats = {
+    "calls": Counter(),
+    "parse_failures": Counter(),  # Risposte non valide (JSON rotto o schema non rispettato)
+    "repairs": Counter(),         # Risposte valide ottenute dopo almeno un tentativo di riparazione
+    "fallbacks": Counter(),       # Tentativi esauriti: il servizio usa il fallback
+}
+
+
+def output_schema(model: Type[BaseModel], fields: Sequence[str]) -> dict:
+    """
+    JSON schema per il decoding vincolato di Ollama (parametro format), derivato dal modello di risposta.
+    Si tengono solo i campi che deve generare l'LLM (es. non "original" o "cached").
+    """
+    schema = model.model_json_schema()
+    return {
+        "type": "object",
+        "properties": {name: schema["properties"][name] for name in fields},
+        "required": list(fields),
+        "additionalProperties": False,
+    }
+
+
+def parse_structured(content: str, schema: dict) -> dict:
+    # Con format lo JSON è garantito, ma togliamo comunque eventuali ``` residui
+    clean_json = content.replace("```json", "").replace("```", "").strip()
+    data = json.loads(clean_json)
+    return {name: data[name] for name in schema["properties"]}
+
+
+async def structured_chat(service: str, model_name: str, prompt: str, schema: dict,
+                          build: Callable[[dict], T]) -> Optional[T]:
+    """
+    Chiamata LLM con output vincolato allo schema.
+    build(data) costruisce la risposta e solleva eccezione se i dati non sono validi.
+    Se il parsing fallisce si chiede al modello di correggere la propria risposta (al massimo LLM_REPAIR_ATTEMPTS volte).
+    Ritorna None se anche le riparazioni falliscono.
+    """
+    parse_stats["calls"][service] += 1
+    messages = [{'role': 'user', 'content': prompt}]
+
+    for attempt in range(LLM_REPAIR_ATTEMPTS + 1):
+        response = await ollama_client.chat(model=model_name, messages=messages, format=schema)
+        raw_content = response['message']['content']
+
+        try:
+            result = build(parse_structured(raw_content, schema))
+            if attempt > 0:
+                parse_stats["repairs"][service] += 1
+            return result
+        except Exception as e:
+            parse_stats["parse_failures"][service] += 1
+            LLM_PARSE_FAILURES.inc(service=service)
+            print(f"Errore parsing JSON ({service}, tentativo {attempt + 1}): {e}")
+
+            # Riparazione: il modello vede la sua risposta e l'errore, e la corregge
+            messages = messages[:1] + [
+                {'role': 'assistant', 'content': raw_content},
+                {'role': 'user', 'content': (
+                    f"La risposta non è valida ({e}). "
+                    f"Correggila e rispondi SOLO con un oggetto JSON conforme a questo schema: {json.dumps(schema, ensure_ascii=False)}"
+                )},
+            ]
+
+    parse_stats["fallbacks"][service] += 1
+    return None
+
+
+def structured_stats() -> dict:
+    return {name: dict(counter) for name, counter in parse_stats.items()}
+
+
+class JsonArrayStreamParser:
+    """
+    Parser incrementale per lo stream di token di una risposta JSON.
+    Estrae le stringhe dell'array `key` (es. "tts_chunks") appena sono complete, senza aspettare la fine della risposta.
+    """
+
+    def __init__(self, key: str):
+        self._key_token = f'"{key}"'
+        self._decoder = json.JSONDecoder()
+        self.buffer = ""
+        self._pos = None   # Posizione di lettura dentro l'array (None = array non ancora iniziato)
+        self.finished = False
+
+    def feed(self, text: str) -> list:
+        """Aggiunge token al buffer e ritorna le nuove stringhe complete dell'array"""
+        self.buffer += text
+        items = []
+
+        if self._pos is None:
+            key_at = self.buffer.find(self._key_token)
+            if key_at < 0:
+                return items
+            bracket_at = self.buffer.find("[", key_at + len(self._key_token))
+            if bracket_at < 0:
+                return items
+            self._pos = bracket_at + 1
+
+        while not self.finished:
+            # Salta spazi e virgole tra un elemento e l'altro
+            while self._pos < len(self.buffer) and self.buffer[self._pos] in " \t\r\n,":
+                self._pos += 1
+            if self._pos >= len(self.buffer):
+                break
+
+            if self.buffer[self._pos] == "]":
+                self.finished = True
+                break
+
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self._pos)
+            except json.JSONDecodeError:
+                break # Stringa non ancora completa: aspettiamo altri token
+            if isinstance(value, str):
+                items.append(value)
+            self._pos = end
+
+        return items
\ No newline at end of file
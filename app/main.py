@@ -1,40 +1,293 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import os
-import hashlib
+import json
+import time
+import asyncio
+from pathlib import Path
+from typing import List, Optional, Tuple
 import uvicorn
 
 # Schemas aggiornati
 from app.schemas import (
     TitleRequest, TitleResponse, 
     DescriptionRequest, DescriptionResponse,
-    AudioGenerationRequest, AudioGenerationResponse
+    AudioGenerationRequest, AudioGenerationResponse,
+    BatchAudioGenerationRequest, BatchAudioGenerationResponse,
+    PrerenderRequest, PrerenderResponse, PrerenderProgress
 )
 
 # Services
 from app.llm.services.optimize_title import generate_optimized_title
-from app.llm.services.optimize_description import generate_optimized_description
+from app.llm.services.optimize_description import generate_optimized_description, stream_optimized_description
+from app.llm.client import ollama_client
+from app.llm.response_cache import llm_cache
+from app.llm.structured import structured_stats
 from app.tts.coqui_engine import XttsEngine 
-from app.storage import check_file_exists, get_file_url, upload_file
+from app.tts.process_pool import TtsProcessPool
+from app.tts.piper_engine import PiperEngine
+from app.tts.engines import EngineRegistry, UnknownEngine
+from app.tts.cache_key import AudioCacheKey, AudioCacheKeyBuilder
+from app.utils.audio_converter import AudioConverter, StreamingEncoder
+from app.utils.disk_cache import DiskLRUCache
+from app.config import (
+    AUDIO_PIPELINE, AUDIO_FORMAT, AUDIO_OUTPUT_RATE, TTS_EXECUTOR_WORKERS, TTS_PROCESS_WORKERS,
+    PRERENDER_ON_OPTIMIZE, PRERENDER_OPTIMIZE_PRIORITY,
+    TTS_ENABLE_PIPER, TTS_UPGRADE_FAST_AUDIO, TTS_UPGRADE_PRIORITY,
+    LOCAL_CACHE_ENABLED, LOCAL_CACHE_DIR, LOCAL_CACHE_MAX_BYTES, LOCAL_CACHE_URL
+)
+from app.storage import storage, FilesystemStorage
+from app.singleflight import SingleFlight
+from app.micro_batcher import MicroBatcher
+from app.prerender import PrerenderWorker, prerender_queue
+from app.executors import (
+    ExecutorSaturated, tts_executor, fast_tts_executor, storage_executor,
+    executors_stats, shutdown_executors
+)
+from app.metrics import metrics, stage_timer
 
 # --- VARIABILI GLOBALI ---
-tts_engine = None
+tts_engine = None # Motore XTTS (in processo o pool di processi)
+engines = EngineRegistry() # Tutti i motori attivi, selezionabili per richiesta
+cache_keys = AudioCacheKeyBuilder()
+prerender_worker = None
+audio_batcher = None # Micro-batching delle richieste on-demand concorrenti (pipeline in memoria)
+audio_flights = SingleFlight() # Sintesi in corso, per hash della frase
+background_tasks = set()
+
+# Cache a due livelli: disco locale (LRU, servito dall'API) -> MinIO -> sintesi
+local_cache = DiskLRUCache(LOCAL_CACHE_DIR, LOCAL_CACHE_MAX_BYTES) if LOCAL_CACHE_ENABLED else None
+local_fills = set() # Oggetti in copia da MinIO verso la cache locale
+remote_tier = {"hits": 0, "misses": 0} # Esiti su MinIO dopo un miss locale
+
+# Il percorso su file produce sempre MP3, quello in memoria il formato configurato
+USE_MEMORY_PIPELINE = AUDIO_PIPELINE == "memory"
+OUTPUT_FORMAT = AUDIO_FORMAT if USE_MEMORY_PIPELINE else "mp3"
 
 # --- LIFESPAN ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global tts_engine
+    global tts_engine, prerender_worker, audio_batcher
     print("Avvio Backend...")
 
     # Carichiamo XTTS solo se abbiamo intenzione di servire audio
-    tts_engine = XttsEngine() 
+    # Su CPU: K processi con un modello ciascuno, altrimenti un solo motore in questo processo
+    tts_engine = TtsProcessPool() if TTS_PROCESS_WORKERS > 0 else XttsEngine()
+    engines.register(tts_engine, tts_executor)
     print("XTTS Ready.")
+
+    # Piper: percorso veloce opzionale (se il modello non c'è si serve solo XTTS)
+    if TTS_ENABLE_PIPER:
+        try:
+            engines.register(PiperEngine(), fast_tts_executor)
+            print("Piper Ready.")
+        except Exception as e:
+            print(f"Piper non disponibile: {e}")
+
+    # Frasi diverse richieste nello stesso momento vengono sintetizzate in un unico batch
+    audio_batcher = MicroBatcher(
+        lambda texts: tts_executor.run(tts_engine.generate_batch_bytes, texts, OUTPUT_FORMAT),
+        max_concurrent_batches=TTS_EXECUTOR_WORKERS
+    )
+
+    # Storage: bucket creato qui (non all'import), poi indice degli oggetti già in cache:
+    # i cache hit "caldi" non toccano più MinIO
+    try:
+        await storage.init()
+        await storage.warm_index()
+    except Exception as e:
+        print(f"Inizializzazione storage fallita: {e}")
+
+    if local_cache is not None:
+        try:
+            await storage_executor.run(local_cache.load)
+        except Exception as e:
+            print(f"Caricamento cache audio locale fallito: {e}")
+
+    # Cache delle risposte LLM: se il database non si apre, i servizi LLM funzionano senza cache
+    try:
+        await llm_cache.init()
+    except Exception as e:
+        print(f"Apertura cache LLM fallita: {e}")
+
+    # Pre-render in background: riusa lo stesso motore (resta caldo finché la coda non si svuota)
+    # e cede il passo alle richieste on-demand. Riprende da solo i job rimasti dal riavvio precedente.
+    await prerender_queue.init()
+    prerender_worker = PrerenderWorker(prerender_queue, get_or_create_audio, is_busy=tts_busy)
+    prerender_worker.start()
     
     yield
     print("Shutdown.")
+    await prerender_worker.stop()
+    engines.shutdown()
+    shutdown_executors()
+    storage.close()
+    llm_cache.close()
+    prerender_queue.close()
+    await ollama_client.close()
 
 app = FastAPI(title="XRTourGuide API", lifespan=lifespan)
 
+# Storage su disco: gli audio vengono serviti direttamente dall'app
+if isinstance(storage, FilesystemStorage) and storage.base_url.startswith("/"):
+    app.mount(storage.base_url, StaticFiles(directory=storage.root, check_dir=False), name="files")
+
+# --- METRICHE (/metrics) ---
+HTTP_REQUESTS = metrics.counter("xrtour_http_requests_total", "Richieste HTTP servite", ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "xrtour_http_request_seconds", "Durata delle richieste HTTP (fino all'invio degli header per gli stream)", ("route",)
+)
+
+def queue_depths() -> dict:
+    depths = {(executor.name,): executor.pending for executor in (tts_executor, fast_tts_executor, storage_executor)}
+    depths[("tts-batch",)] = audio_batcher.pending if audio_batcher is not None else 0
+    depths[("prerender",)] = prerender_queue.pending
+    llm = ollama_client.stats()
+    depths[("llm",)] = llm["running"] + llm["queued"]
+    return depths
+
+def cache_hit_ratios() -> dict:
+    storage_stats = storage.stats()
+    ratios = {
+        ("storage_index",): storage_stats["objects"]["hit_ratio"],
+        ("storage_urls",): storage_stats["urls"]["hit_ratio"],
+        ("remote",): tier_stats()["remote"]["hit_ratio"],
+        ("llm",): llm_cache.stats()["hit_ratio"],
+    }
+    if local_cache is not None:
+        ratios[("local",)] = local_cache.stats()["hit_ratio"]
+    return ratios
+
+metrics.gauge("xrtour_queue_depth", "Lavori in esecuzione o in attesa per coda", ("queue",), callback=queue_depths)
+metrics.gauge(
+    "xrtour_tts_model_loaded", "1 se il modello del motore TTS è residente in memoria", ("engine",),
+    callback=lambda: {(name,): stats.get("model_loaded") for name, stats in engines.stats().items()}
+)
+metrics.gauge("xrtour_cache_hit_ratio", "Hit ratio per cache / livello", ("cache",), callback=cache_hit_ratios)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Template della rotta (es. /prerender/{tour_id}), non il percorso: etichette a cardinalità limitata
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route)
+    HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    return response
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    """Back-pressure: coda piena -> 503/429 con Retry-After, invece di bloccare il worker"""
+    print(f"BACK-PRESSURE: {exc}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+def start_background(coro) -> asyncio.Task:
+    """Avvia un task in background tenendone un riferimento (altrimenti il GC potrebbe interromperlo)"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def tts_busy() -> bool:
+    """True se ci sono sintesi on-demand in corso o in attesa di un batch"""
+    return tts_executor.pending > 0 or (audio_batcher is not None and audio_batcher.pending > 0)
+
+async def enqueue_prerender(tour_id: str, chunks: List[str], priority: int = 0, language: str = "it") -> int:
+    """Accoda le frasi per il pre-render e sveglia il worker"""
+    queued = await prerender_queue.enqueue(tour_id, chunks, priority, language)
+    if queued and prerender_worker is not None:
+        prerender_worker.notify()
+    return queued
+
+def cache_key_for(text: str, engine: str = XttsEngine.name, language: str = "it", variant: str = None) -> AudioCacheKey:
+    """
+    Chiave di cache della frase: testo normalizzato + lingua + motore + voce e parametri di sintesi.
+    key.object_name è il nome dell'oggetto MinIO (es. audio/v1/ab/cd/abcd....mp3).
+    variant distingue audio prodotti da una pipeline diversa (es. "stream") da quello della pipeline normale
+    """
+    with stage_timer("hash"):
+        fingerprint = engines.get(engine).cache_fingerprint()
+        if variant is not None:
+            fingerprint = {**fingerprint, "variant": variant}
+        return cache_keys.build(text, language, engine, fingerprint, OUTPUT_FORMAT)
+
+def local_url(object_name: str) -> Optional[str]:
+    """
+    URL dell'API per un oggetto nella cache locale, None se non c'è (o la cache è disattivata).
+    Non conta hit: l'hit locale viene contato quando il file viene servito (serve_cached_audio)
+    """
+    if local_cache is not None and object_name in local_cache:
+        return f"{LOCAL_CACHE_URL}/{object_name}"
+    return None
+
+async def cached_audio_url(object_name: str) -> Optional[str]:
+    """URL di un audio già generato: prima il disco locale, poi MinIO (copiandolo in locale in background)"""
+    url = local_url(object_name)
+    if url is not None:
+        return url
+    if local_cache is not None:
+        local_cache.record_miss()
+    return await remote_audio_url(object_name)
+
+async def remote_audio_url(object_name: str) -> Optional[str]:
+    """URL MinIO di un audio già generato (None se non esiste), con copia in locale in background"""
+    with stage_timer("storage_stat"):
+        exists = await storage.exists(object_name)
+    if not exists:
+        remote_tier["misses"] += 1
+        return None
+    remote_tier["hits"] += 1
+    if local_cache is not None and object_name not in local_fills:
+        local_fills.add(object_name)
+        start_background(fill_local_cache(object_name))
+    return await storage.url(object_name)
+
+async def fill_local_cache(object_name: str):
+    """Copia un oggetto da MinIO alla cache locale: dalla prossima richiesta viene servito da qui"""
+    try:
+        data = await storage.get_bytes(object_name)
+        await storage_executor.run(local_cache.put_bytes, object_name, data)
+    except Exception as e:
+        print(f"Copia in cache locale fallita per {object_name}: {e}")
+    finally:
+        local_fills.discard(object_name)
+
+async def store_audio(data: bytes, key: AudioCacheKey) -> str:
+    """Salva l'audio generato su MinIO e (write-through) nella cache locale. Ritorna l'URL da dare al client"""
+    upload = storage.put_bytes(data, key.object_name, AudioConverter.content_type_for(OUTPUT_FORMAT), key.metadata)
+    with stage_timer("upload"):
+        if local_cache is None:
+            await upload
+        else:
+            await asyncio.gather(upload, storage_executor.run(local_cache.put_bytes, key.object_name, data))
+    if local_cache is not None:
+        return f"{LOCAL_CACHE_URL}/{key.object_name}"
+    return await storage.url(key.object_name)
+
+def tier_stats() -> dict:
+    """Hit ratio per livello: locale su tutte le richieste, MinIO sui soli miss locali"""
+    remote_total = remote_tier["hits"] + remote_tier["misses"]
+    return {
+        "local": local_cache.stats() if local_cache is not None else None,
+        "remote": {
+            **remote_tier,
+            "hit_ratio": round(remote_tier["hits"] / remote_total, 3) if remote_total else 0.0,
+        },
+    }
+
+def resolve_engine(request: AudioGenerationRequest) -> str:
+    """Motore richiesto (engine / quality) -> nome nel registro, 400 se non esiste su questo nodo"""
+    try:
+        return engines.resolve(request.engine, request.quality)
+    except UnknownEngine as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # --- ENDPOINTS ---
 
 @app.get("/")
@@ -45,6 +298,82 @@ def root():
         "service": "XRTourGuide TTS", 
     }
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """Metriche in formato Prometheus: latenza per fase, LLM, code, modelli residenti, hit ratio"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/tts/status")
+def tts_status():
+    """Stato del modello XTTS: politica di residenza, tempi di caricamento e time-to-first-audio"""
+    if tts_engine is None:
+        raise HTTPException(status_code=503, detail="Servizio TTS non attivo")
+    return {
+        **tts_engine.get_stats(),
+        "engines": {name: stats for name, stats in engines.stats().items() if name != XttsEngine.name},
+        "executors": executors_stats(),
+        "singleflight": audio_flights.stats(),
+        "batcher": audio_batcher.stats() if audio_batcher is not None else None,
+        "storage": storage.stats(),
+        "cache_tiers": tier_stats(),
+    }
+
+@app.post("/prerender", response_model=PrerenderResponse)
+async def prerender_tour(request: PrerenderRequest):
+    """
+    Admin: accoda tutti i chunk di un tour per generarne l'audio in anticipo,
+    così il primo visitatore trova già tutto in cache.
+    """
+    if not request.chunks:
+        raise HTTPException(status_code=400, detail="La lista dei chunk non può essere vuota")
+
+    queued = await enqueue_prerender(request.tour_id, request.chunks, request.priority, request.language)
+    return PrerenderResponse(queued=queued, progress=PrerenderProgress(**await prerender_queue.progress(request.tour_id)))
+
+@app.get("/prerender", response_model=PrerenderProgress)
+async def prerender_status():
+    """Avanzamento dell'intera coda di pre-render"""
+    return PrerenderProgress(**await prerender_queue.progress())
+
+@app.get("/prerender/{tour_id}", response_model=PrerenderProgress)
+async def prerender_tour_status(tour_id: str):
+    """Avanzamento del pre-render di un tour"""
+    progress = await prerender_queue.progress(tour_id)
+    if progress["total"] == 0:
+        raise HTTPException(status_code=404, detail="Nessun pre-render per questo tour")
+    return PrerenderProgress(**progress)
+
+@app.get("/llm/status")
+def llm_status():
+    """Stato dei servizi LLM: client Ollama, cache delle risposte, errori di parsing"""
+    return {
+        "client": ollama_client.stats(),
+        "cache": llm_cache.stats(),
+        "structured_output": structured_stats(),
+    }
+
+@app.get(LOCAL_CACHE_URL + "/{object_name:path}")
+async def serve_cached_audio(object_name: str, request: Request):
+    """
+    Audio dalla cache locale, servito direttamente (sendfile quando il server lo supporta) con supporto Range.
+    ETag = hash della chiave: l'oggetto è immutabile, quindi il client può tenerlo per sempre.
+    Se l'oggetto non è (più) in locale si reindirizza a MinIO.
+    """
+    # get() conta l'hit (o il miss) e rilegge lo stat: un file appena rimosso dall'LRU diventa un redirect, non un 500
+    entry = local_cache.get(object_name) if local_cache is not None else None
+    if entry is None:
+        audio_url = await remote_audio_url(object_name)
+        if audio_url is None:
+            raise HTTPException(status_code=404, detail="Audio non trovato")
+        return RedirectResponse(audio_url, status_code=307)
+    path, stat_result = entry
+
+    etag = f'"{Path(object_name).stem}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") in (etag, f"W/{etag}"):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers, stat_result=stat_result)
+
 @app.post("/generate-audio", response_model=AudioGenerationResponse)
 async def generate_audio_ondemand(request: AudioGenerationRequest):
     """
@@ -52,48 +381,276 @@ async def generate_audio_ondemand(request: AudioGenerationRequest):
     Input: Una frase di testo.
     Output: URL MP3 (Generato al volo o recuperato da Cache MinIO).
     """
-    global tts_engine
-    
     if tts_engine is None:
         raise HTTPException(status_code=503, detail="Servizio TTS non attivo")
 
-    # 1. Calcolo Hash (Impronta digitale della frase)
-    text_hash = hashlib.md5(request.text.encode('utf-8')).hexdigest()
-    
-    # 2. Definizione Percorso MinIO (es:a1b2c3d4.mp3)
+    engine = resolve_engine(request)
+
+    if request.quality == "fast" and engine != engines.default:
+        # Se la versione di qualità è già pronta (upgrade completato) costa come quella veloce: serviamo quella
+        quality_object = cache_key_for(request.text, engines.default, request.language).object_name
+        audio_url = await cached_audio_url(quality_object)
+        if audio_url is not None:
+            return AudioGenerationResponse(audio_url=audio_url, cached=True, engine=engines.default)
+
+        audio_url, cached = await get_or_create_audio(request.text, engine, request.language)
+        # Upgrade in background: la coda di pre-render la rigenera con il motore di default
+        if TTS_UPGRADE_FAST_AUDIO:
+            await enqueue_prerender("upgrade", [request.text], TTS_UPGRADE_PRIORITY, request.language)
+        return AudioGenerationResponse(audio_url=audio_url, cached=cached, engine=engine)
+
+    audio_url, cached = await get_or_create_audio(request.text, engine, request.language)
+    return AudioGenerationResponse(audio_url=audio_url, cached=cached, engine=engine)
+
 
-    object_name = f"{text_hash}.mp3"
+async def get_or_create_audio(text: str, engine: str = XttsEngine.name, language: str = "it"):
+    """Cache (disco locale, MinIO) o nuova sintesi (single-flight). Ritorna (url, cached)"""
+    # 1-2. Chiave della frase e percorso MinIO (es: audio/v1/ab/cd/abcd....mp3)
+    key = cache_key_for(text, engine, language)
+    object_name = key.object_name
     
     # 3. STRATEGIA CACHE: Controllo se esiste già
-    if check_file_exists(object_name):
+    audio_url = await cached_audio_url(object_name)
+    if audio_url is not None:
         print(f"CACHE HIT: {object_name}")
-        return AudioGenerationResponse(
-            audio_url=get_file_url(object_name),
-            cached=True
-        )
+        return audio_url, True
     
     # 4. GENERAZIONE (Se non esiste)
-    print(f"NEW TTS: Generazione per '{request.text:20}'...")
+    # Richieste concorrenti per la stessa frase attendono un'unica sintesi e ricevono lo stesso URL
+    audio_url = await audio_flights.do(
+        object_name, lambda: synthesize_and_upload(text, key, engine)
+    )
+    return audio_url, False
+
+
+async def synthesize_and_upload(text: str, key: AudioCacheKey, engine: str = XttsEngine.name) -> str:
+    """Sintesi TTS -> Upload MinIO -> URL. Eseguita una sola volta per frase grazie al single-flight"""
+    print(f"NEW TTS ({engine}): Generazione per '{text:20}'...")
+    executor = engines.executor(engine)
+
+    if USE_MEMORY_PIPELINE:
+        # Tensore -> byte codificati -> put_object, senza file temporanei.
+        # XTTS passa dal micro-batcher: frasi diverse richieste insieme condividono un passaggio del modello
+        if engine == XttsEngine.name:
+            data = await audio_batcher.submit(text)
+        else:
+            data = await executor.run(engines.get(engine).generate_audio_bytes, text, OUTPUT_FORMAT)
+        if not data:
+            raise HTTPException(status_code=500, detail="Fallimento generazione audio")
+        return await store_audio(data, key)
     
-    local_temp = f"temp_{text_hash}.mp3"
+    local_temp = f"temp_{key.digest}.mp3"
     
-    # XTTS Engine (Genera WAV -> Converte MP3)
-    success = tts_engine.generate_audio(request.text, local_temp)
+    # Motore TTS (Genera WAV -> Converte MP3), nell'executor dedicato
+    success = await executor.run(engines.get(engine).generate_audio, text, local_temp)
     
     if not success or not os.path.exists(local_temp):
         raise HTTPException(status_code=500, detail="Fallimento generazione audio")
     
-    # Upload su MinIO
-    upload_file(local_temp, object_name)
-    
-    # Pulizia locale
-    os.remove(local_temp)
+    try:
+        # Upload su MinIO (e copia nella cache locale)
+        with stage_timer("upload"):
+            await storage.put_file(local_temp, key.object_name, key.metadata)
+            if local_cache is not None:
+                await storage_executor.run(local_cache.put_file, key.object_name, local_temp)
+    finally:
+        # Pulizia locale
+        os.remove(local_temp)
     
     # Ritorna URL
-    return AudioGenerationResponse(
-        audio_url=get_file_url(object_name),
-        cached=False
-    )
+    return local_url(key.object_name) or await storage.url(key.object_name)
+
+
+@app.post("/stream-audio")
+async def stream_audio(request: AudioGenerationRequest):
+    """
+    Come /generate-audio, ma su cache miss restituisce l'audio in streaming (risposta chunked)
+    mentre XTTS lo produce. Gli stessi byte vengono salvati su MinIO a fine sintesi, sotto una chiave
+    dedicata (variante "stream"): l'audio in streaming non è identico a quello della pipeline normale
+    (pitch e normalizzazione applicati da ffmpeg a blocchi), quindi non va servito al suo posto.
+    Su cache hit (pipeline normale o streaming, o se la frase è già in sintesi altrove) reindirizza all'URL MinIO con 303.
+    I motori senza streaming (Piper, già a bassa latenza) generano la frase intera e reindirizzano.
+    """
+    if tts_engine is None:
+        raise HTTPException(status_code=503, detail="Servizio TTS non attivo")
+
+    engine = resolve_engine(request)
+    if engine != XttsEngine.name:
+        audio_url, _ = await get_or_create_audio(request.text, engine, request.language)
+        return RedirectResponse(audio_url, status_code=303)
+
+    # Prima la versione della pipeline normale (se già generata), poi quella di uno streaming precedente
+    key = cache_key_for(request.text, engine, request.language, variant="stream")
+    for object_name in (cache_key_for(request.text, engine, request.language).object_name, key.object_name):
+        audio_url = await cached_audio_url(object_name)
+        if audio_url is not None:
+            print(f"CACHE HIT (stream): {object_name}")
+            return RedirectResponse(audio_url, status_code=303)
+
+    queue = asyncio.Queue()
+    task, is_leader = audio_flights.start(key.object_name, lambda: stream_and_cache(request.text, key, queue))
+    if not is_leader:
+        # Un'altra richiesta sta già generando questa frase: attendiamo il suo URL
+        return RedirectResponse(await asyncio.shield(task), status_code=303)
+
+    # Attendiamo il primo frame prima di rispondere: se la sintesi fallisce subito
+    # (errore o executor saturo) il client riceve lo status corretto invece di uno stream vuoto
+    first = await queue.get()
+    if first is None:
+        await asyncio.shield(task)
+        raise HTTPException(status_code=500, detail="Fallimento generazione audio")
+
+    async def body():
+        data = first
+        while data is not None:
+            yield data
+            data = await queue.get()
+
+    return StreamingResponse(body(), media_type=AudioConverter.content_type_for(OUTPUT_FORMAT))
+
+
+async def stream_and_cache(text: str, key: AudioCacheKey, queue: asyncio.Queue) -> str:
+    """Sintesi in streaming: ogni frame codificato va al client (queue) e nel buffer da caricare su MinIO"""
+    print(f"NEW TTS (stream): Generazione per '{text:20}'...")
+    loop = asyncio.get_running_loop()
+    buffer = bytearray()
+
+    def on_data(data: bytes):
+        # Chiamato dal thread lettore di ffmpeg
+        buffer.extend(data)
+        loop.call_soon_threadsafe(queue.put_nowait, data)
+
+    def run_stream() -> bool:
+        encoder = StreamingEncoder(24000, OUTPUT_FORMAT, on_data, output_rate=AUDIO_OUTPUT_RATE, pitch_steps=XttsEngine.PITCH_STEPS)
+        try:
+            success = tts_engine.stream_audio(text, encoder.write)
+        except Exception:
+            encoder.abort()
+            raise
+        return encoder.close() and success
+
+    try:
+        success = await tts_executor.run(run_stream)
+    finally:
+        # Fine stream per il client (anche in caso di errore: la risposta è già partita)
+        queue.put_nowait(None)
+
+    if not success or not buffer:
+        raise HTTPException(status_code=500, detail="Fallimento generazione audio")
+
+    # Tee verso la cache (chiave della variante "stream"): le richieste successive saranno cache hit
+    return await store_audio(bytes(buffer), key)
+
+
+@app.post("/generate-audio/batch", response_model=BatchAudioGenerationResponse)
+async def generate_audio_batch(request: BatchAudioGenerationRequest):
+    """
+    Genera l'audio di tutti i tts_chunks di una descrizione in una sola chiamata.
+    1. Risolve tutti i cache hit in un'unica passata.
+    2. Sintetizza solo i miss in una sola sessione di modello caldo (una per motore richiesto).
+    3. Carica i nuovi MP3 in parallelo.
+    Output: URL nello stesso ordine degli items.
+    """
+    if tts_engine is None:
+        raise HTTPException(status_code=503, detail="Servizio TTS non attivo")
+
+    item_engines = [resolve_engine(item) for item in request.items]
+    keys = [cache_key_for(item.text, engine, item.language) for item, engine in zip(request.items, item_engines)]
+    names = [key.object_name for key in keys]
+
+    # 1. Cache: un solo controllo per oggetto distinto, prima sul disco locale e poi su MinIO
+    local_urls = {object_name: local_url(object_name) for object_name in dict.fromkeys(names)}
+    existing = await storage.exists_many([object_name for object_name, url in local_urls.items() if url is None])
+    if local_cache is not None:
+        local_cache.record_miss(len(existing))
+    remote_tier["hits"] += sum(existing.values())
+    remote_tier["misses"] += len(existing) - sum(existing.values())
+    existing.update({object_name: True for object_name, url in local_urls.items() if url is not None})
+
+    # 2. Miss (deduplicati: la stessa frase ripetuta, anche con spazi o markdown diversi, si genera una volta sola)
+    misses = {}
+    for item, engine, key in zip(request.items, item_engines, keys):
+        if not existing[key.object_name] and key.object_name not in misses:
+            misses[key.object_name] = (engine, item.text, key)
+
+    if misses:
+        print(f"BATCH TTS: {len(misses)} nuove frasi su {len(request.items)}")
+
+        # Single-flight anche per il batch: le frasi già in sintesi altrove vengono solo attese,
+        # le altre vengono registrate come in corso e generate qui in un'unica sessione
+        async def wait_batch(engine: str):
+            await batch_tasks[engine]
+
+        flights = []
+        own_jobs = {}
+        for object_name, (engine, text, key) in misses.items():
+            task, is_leader = audio_flights.start(object_name, lambda engine=engine: wait_batch(engine))
+            flights.append(task)
+            if is_leader:
+                own_jobs.setdefault(engine, []).append((key, text, f"temp_{key.digest}.mp3"))
+
+        batch_tasks = {
+            engine: asyncio.ensure_future(synthesize_batch_and_upload(jobs, engine))
+            for engine, jobs in own_jobs.items()
+        }
+        await asyncio.gather(*[asyncio.shield(task) for task in flights])
+
+    urls = [
+        f"{LOCAL_CACHE_URL}/{object_name}" if local_cache is not None and object_name in local_cache else None
+        for object_name in names
+    ]
+    remote_urls = iter(await storage.urls([object_name for object_name, url in zip(names, urls) if url is None]))
+    urls = [url or next(remote_urls) for url in urls]
+    results = [
+        AudioGenerationResponse(audio_url=url, cached=existing[object_name], engine=engine)
+        for url, engine, object_name in zip(urls, item_engines, names)
+    ]
+    return BatchAudioGenerationResponse(results=results)
+
+
+async def synthesize_batch_and_upload(jobs: List[Tuple[AudioCacheKey, str, str]], engine: str = XttsEngine.name):
+    """Sintesi di più frasi in una sola sessione del motore, poi upload concorrente. jobs: (chiave, testo, file temporaneo)"""
+    if not jobs:
+        return
+
+    executor = engines.executor(engine)
+    tts = engines.get(engine)
+
+    if USE_MEMORY_PIPELINE:
+        blobs = await executor.run(tts.generate_batch_bytes, [text for _, text, _ in jobs], OUTPUT_FORMAT)
+        if not all(blobs):
+            raise HTTPException(status_code=500, detail="Fallimento generazione audio")
+        content_type = AudioConverter.content_type_for(OUTPUT_FORMAT)
+        with stage_timer("upload"):
+            await asyncio.gather(
+                storage.put_many([(data, key.object_name, content_type, key.metadata) for data, (key, _, _) in zip(blobs, jobs)]),
+                *[storage_executor.run(local_cache.put_bytes, key.object_name, data)
+                  for data, (key, _, _) in zip(blobs, jobs) if local_cache is not None]
+            )
+        return
+
+    outcomes = await executor.run(tts.generate_batch, [(text, local_temp) for _, text, local_temp in jobs])
+
+    generated = []
+    try:
+        for (key, _, local_temp), success in zip(jobs, outcomes):
+            if not success or not os.path.exists(local_temp):
+                raise HTTPException(status_code=500, detail="Fallimento generazione audio")
+            generated.append((local_temp, key.object_name, key.metadata))
+
+        # Upload concorrente (e copia nella cache locale)
+        with stage_timer("upload"):
+            await storage.put_files(generated)
+            if local_cache is not None:
+                await asyncio.gather(*[
+                    storage_executor.run(local_cache.put_file, object_name, local_temp)
+                    for local_temp, object_name, _ in generated
+                ])
+    finally:
+        # Pulizia locale
+        for _, _, local_temp in jobs:
+            if os.path.exists(local_temp):
+                os.remove(local_temp)
 
 
 @app.post("/optimize/title", response_model=TitleResponse)
@@ -106,7 +663,7 @@ async def optimize_title_endpoint(request: TitleRequest):
         raise HTTPException(status_code=400, detail="Il titolo non può essere vuoto")
         
     # Chiamata al servizio LLM
-    result = generate_optimized_title(request.original_title)
+    result = await generate_optimized_title(request.original_title)
     
     return result
 
@@ -121,9 +678,81 @@ async def optimize_description_endpoint(request: DescriptionRequest):
         raise HTTPException(status_code=400, detail="Il testo non può essere vuoto")
     
     # Chiamata al servizio
-    result = generate_optimized_description(request.original_text)
+    result = await generate_optimized_description(request.original_text)
+
+    # Le frasi appena scritte verranno ascoltate presto: generiamone l'audio in background
+    if PRERENDER_ON_OPTIMIZE:
+        await enqueue_prerender("authoring", result.tts_chunks, PRERENDER_OPTIMIZE_PRIORITY)
     
     return result
 
+@app.post("/optimize/description/stream")
+async def optimize_description_stream_endpoint(request: DescriptionRequest, synthesize: bool = False):
+    """
+    Come /optimize/description, ma in streaming NDJSON (un evento JSON per riga):
+      {"type": "chunk", "index": i, "text": "..."}                    appena una frase è pronta
+      {"type": "audio", "index": i, "audio_url": "...", "cached": b}  se synthesize=true, quando il suo audio è pronto
+      {"type": "done", "full_text_optimized": "...", "tts_chunks": [...], "cached": b}
+    Così l'interfaccia di authoring può ascoltare le prime frasi mentre l'LLM scrive le successive.
+    """
+    if not request.original_text:
+        raise HTTPException(status_code=400, detail="Il testo non può essere vuoto")
+
+    if synthesize and tts_engine is None:
+        raise HTTPException(status_code=503, detail="Servizio TTS non attivo")
+
+    queue = asyncio.Queue()
+    # Una sintesi alla volta per stream: i chunk vanno in coda al TTS senza saturarne l'executor
+    tts_slot = asyncio.Semaphore(1)
+
+    async def synthesize_chunk(index: int, text: str):
+        try:
+            async with tts_slot:
+                audio_url, cached = await get_or_create_audio(text)
+            await queue.put({"type": "audio", "index": index, "audio_url": audio_url, "cached": cached})
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            await queue.put({"type": "audio_error", "index": index, "detail": detail})
+
+    # Risolto al primo evento: fino ad allora un errore (es. LLM saturo) diventa la risposta HTTP (429/503)
+    # invece di un evento "error" dentro un 200
+    started = asyncio.get_running_loop().create_future()
+
+    async def produce():
+        audio_tasks = []
+        try:
+            async for event in stream_optimized_description(request.original_text):
+                if not started.done():
+                    started.set_result(None)
+                if synthesize and event["type"] == "chunk":
+                    audio_tasks.append(asyncio.create_task(synthesize_chunk(event["index"], event["text"])))
+                await queue.put(event)
+                if not synthesize and PRERENDER_ON_OPTIMIZE and event["type"] == "done":
+                    await enqueue_prerender("authoring", event["tts_chunks"], PRERENDER_OPTIMIZE_PRIORITY)
+            await asyncio.gather(*audio_tasks)
+        except Exception as e:
+            if isinstance(e, ExecutorSaturated) and not started.done():
+                started.set_exception(e)
+            else:
+                await queue.put({"type": "error", "detail": str(e)})
+        finally:
+            if not started.done():
+                started.set_result(None)
+            await queue.put(None)
+
+    # Se il client si disconnette il producer prosegue: le sintesi avviate finiscono comunque in cache
+    start_background(produce())
+    # Solleva ExecutorSaturated se l'LLM rifiuta la richiesta prima di emettere qualcosa
+    await started
+
+    async def body():
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,234 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class _Metric:
+    """Metrica con etichette, esportata nel formato testuale di Prometheus. Thread-safe"""
+
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {} # valori delle etichette (tupla) -> valore
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: etichette attese {self.labelnames}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {_format_value(value)}" for key, value in items]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Valore istantaneo: impostato con set() oppure letto al momento dell'export da callback
+    (callback() -> numero, o dizionario {tupla di etichette: numero}). Una callback che fallisce non esporta nulla.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), callback: Callable = None):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> List[str]:
+        if self.callback is None:
+            return super()._samples()
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{self._format_labels(tuple(str(v) for v in key))} {_format_value(value)}"
+            for key, value in values.items() if value is not None
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Conteggi per bucket (non cumulativi) + somma + totale
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class MetricsRegistry:
+    """Insieme delle metriche del processo, esposte da /metrics"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metrica già registrata: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), callback: Callable = None) -> Gauge:
+        return self._register(Gauge(name, help, labelnames, callback))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+# --- REGISTRO GLOBALE E METRICHE CONDIVISE ---
+metrics = MetricsRegistry()
+
+# Fasi della pipeline audio: hash, storage_stat, model_load, normalize, synthesis, postprocess, encode, upload
+AUDIO_STAGE_SECONDS = metrics.histogram(
+    "xrtour_audio_stage_seconds", "Durata di ogni fase della generazione audio", ("stage",)
+)
+
+# Chiamate LLM (Ollama)
+LLM_REQUEST_SECONDS = metrics.histogram(
+    "xrtour_llm_request_seconds", "Durata totale delle chiamate Ollama", ("model",)
+)
+LLM_PROMPT_TOKENS = metrics.histogram(
+    "xrtour_llm_prompt_tokens", "Token del prompt per chiamata", ("model",),
+    buckets=(32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+)
+LLM_EVAL_TOKENS = metrics.counter(
+    "xrtour_llm_eval_tokens_total", "Token generati", ("model",)
+)
+LLM_EVAL_TOKENS_PER_SECOND = metrics.histogram(
+    "xrtour_llm_eval_tokens_per_second", "Velocità di generazione riportata da Ollama", ("model",),
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200)
+)
+LLM_PARSE_FAILURES = metrics.counter(
+    "xrtour_llm_parse_failures_total", "Risposte LLM non valide (JSON rotto o schema non rispettato)", ("service",)
+)
+
+
+# --- FASI AUDIO (anche dai processi worker del pool TTS) ---
+# Di default le osservazioni vanno nell'istogramma; nei worker del pool vengono raccolte e rimandate
+# al processo principale insieme al risultato (vedi app/tts/process_pool.py)
+_stage_buffer: Optional[list] = None
+
+def observe_stage(stage: str, seconds: float):
+    if _stage_buffer is not None:
+        _stage_buffer.append((stage, seconds))
+    else:
+        AUDIO_STAGE_SECONDS.observe(seconds, stage=stage)
+
+@contextmanager
+def stage_timer(stage: str):
+    """with stage_timer("synthesis"): ... -> osservazione in xrtour_audio_stage_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+def buffer_stages() -> list:
+    """Da qui in poi le fasi vengono accumulate nella lista ritornata invece che nell'istogramma (processi worker)"""
+    global _stage_buffer
+    _stage_buffer = []
+    return _stage_buffer
+
+def observe_llm_response(model: str, response, seconds: float):
+    """Metriche di una risposta Ollama (completa, o ultimo frammento di uno stream): token e velocità"""
+    LLM_REQUEST_SECONDS.observe(seconds, model=model)
+    prompt_tokens = response.get("prompt_eval_count")
+    if prompt_tokens is not None:
+        LLM_PROMPT_TOKENS.observe(prompt_tokens, model=model)
+    eval_tokens, eval_duration = response.get("eval_count"), response.get("eval_duration")
+    if eval_tokens:
+        LLM_EVAL_TOKENS.inc(eval_tokens, model=model)
+        if eval_duration:
+            LLM_EVAL_TOKENS_PER_SECOND.observe(eval_tokens / (eval_duration / 1e9), model=model)
\ No newline at end of file
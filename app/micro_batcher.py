@@ -0,0 +1,112 @@
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, List
+
+from app.config import XTTS_BATCH_MAX_SIZE, XTTS_BATCH_MAX_WAIT_MS, XTTS_BATCH_MAX_PENDING
+from app.executors import ExecutorSaturated
+
+
+class MicroBatcher:
+    """
+    Scheduler di micro-batching davanti al motore TTS.
+    Le richieste concorrenti vengono raccolte e spedite insieme a run_batch:
+    - subito, se ci sono max_batch_size richieste in attesa;
+    - dopo max_wait_ms dalla più vecchia, se il motore è libero;
+    - appena il motore si libera, se era occupato (sotto carico i batch si riempiono da soli).
+    Ogni chiamante riceve il risultato della propria richiesta.
+    """
+
+    def __init__(self, run_batch: Callable[[List], Awaitable[List]], max_batch_size: int = XTTS_BATCH_MAX_SIZE,
+                 max_wait_ms: float = XTTS_BATCH_MAX_WAIT_MS, max_pending: int = XTTS_BATCH_MAX_PENDING,
+                 max_concurrent_batches: int = 1, name: str = "tts-batch"):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending = max_pending
+        self.max_concurrent_batches = max_concurrent_batches
+        self.name = name
+
+        self._waiting = [] # (item, future, istante di arrivo)
+        self._active = 0   # Batch in esecuzione
+        self._running = 0  # Richieste dentro i batch in esecuzione
+        self._timer = None
+
+        # Metriche
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self.batch_sizes = Counter()
+
+    @property
+    def pending(self) -> int:
+        """Richieste in attesa di un batch + in esecuzione"""
+        return len(self._waiting) + self._running
+
+    async def submit(self, item):
+        """Accoda una richiesta e ne attende il risultato"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ExecutorSaturated(self.name, 503, 10)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiting.append((item, future, loop.time()))
+        self._schedule()
+        return await future
+
+    def _schedule(self):
+        """Spedisce i batch pronti, oppure programma il timer della finestra di attesa"""
+        loop = asyncio.get_running_loop()
+        while self._waiting and self._active < self.max_concurrent_batches:
+            waited = loop.time() - self._waiting[0][2]
+            if len(self._waiting) < self.max_batch_size and waited < self.max_wait:
+                if self._timer is None:
+                    self._timer = loop.call_later(self.max_wait - waited, self._on_timer)
+                return
+            self._dispatch()
+
+    def _on_timer(self):
+        self._timer = None
+        self._schedule()
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch = self._waiting[:self.max_batch_size]
+        self._waiting = self._waiting[self.max_batch_size:]
+        self._active += 1
+        self._running += len(batch)
+        asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: list):
+        try:
+            results = await self.run_batch([item for item, _, _ in batch])
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._active -= 1
+            self._running -= len(batch)
+            self.batches += 1
+            self.items += len(batch)
+            self.batch_sizes[len(batch)] += 1
+            # Il motore è libero: le richieste arrivate nel frattempo partono subito
+            self._schedule()
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "waiting": len(self._waiting),
+            "running": self._running,
+            "batches": self.batches,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "rejected": self.rejected,
+        }
\ No newline at end of file
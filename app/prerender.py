@@ -0,0 +1,277 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import Awaitable, Callable, List, Optional
+
+from app.config import PRERENDER_DB_PATH, PRERENDER_MAX_ATTEMPTS, PRERENDER_IDLE_POLL, PRERENDER_RETENTION
+from app.executors import BoundedExecutor, storage_executor
+
+
+class PrerenderQueue:
+    """
+    Coda persistente (SQLite) delle frasi da pre-generare.
+    Sopravvive ai riavvii: i job rimasti "running" tornano "pending" alla riapertura.
+    Riaccodare una frase già "done"/"failed" la rimette "pending" (es. dopo un cambio di voce o parametri:
+    se l'audio è ancora in cache il worker la chiude subito). I job chiusi da più di retention secondi vengono cancellati.
+    Il database viene aperto dal lifespan (init), non all'import; le query girano nello storage_executor.
+    """
+
+    def __init__(self, path: str = PRERENDER_DB_PATH, max_attempts: int = PRERENDER_MAX_ATTEMPTS,
+                 retention: float = PRERENDER_RETENTION, executor: BoundedExecutor = storage_executor):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.executor = executor
+        self.pending = 0 # Job in attesa, aggiornato ad ogni scrittura (letto da /metrics senza toccare il database)
+
+        self._lock = threading.Lock()
+        self._conn = None
+
+    # --- API ASINCRONA ---
+
+    async def init(self):
+        """Apre (o crea) il database e riprende i job interrotti: chiamata dal lifespan"""
+        await self.executor.run(self._init_sync)
+
+    async def enqueue(self, tour_id: str, texts: List[str], priority: int = 0, language: str = "it") -> int:
+        """
+        Accoda le frasi: quelle già "done"/"failed" tornano "pending" con i tentativi azzerati,
+        quelle già in coda o in corso vengono ignorate. Ritorna quante sono state aggiunte o rimesse in coda
+        """
+        return await self.executor.run(self._enqueue_sync, tour_id, texts, priority, language)
+
+    async def claim_next(self) -> Optional[sqlite3.Row]:
+        """Prende il job pendente a priorità più alta (a parità, il più vecchio) e lo segna "running\""""
+        return await self.executor.run(self._claim_next_sync)
+
+    async def mark_done(self, job_id: int):
+        await self.executor.run(self._mark_done_sync, job_id)
+
+    async def mark_failed(self, job_id: int, error: str):
+        """Errore: il job torna in coda finché non esaurisce i tentativi"""
+        await self.executor.run(self._mark_failed_sync, job_id, error)
+
+    async def progress(self, tour_id: str = None) -> dict:
+        """Conteggi per stato (di un tour o dell'intera coda)"""
+        return await self.executor.run(self._progress_sync, tour_id)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- PRIMITIVE BLOCCANTI (storage_executor) ---
+
+    def _init_sync(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+
+        # Migrazione dei database creati senza la colonna language: la lingua entra nella chiave univoca,
+        # che in SQLite non si può modificare, quindi la tabella va ricreata (i job esistenti erano tutti "it")
+        columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if columns and "language" not in columns:
+            conn.execute("ALTER TABLE jobs RENAME TO jobs_old")
+            self._create_table(conn)
+            conn.execute(
+                "INSERT INTO jobs (id, tour_id, text, priority, status, attempts, error, created_at, updated_at) "
+                "SELECT id, tour_id, text, priority, status, attempts, error, created_at, updated_at FROM jobs_old"
+            )
+            conn.execute("DROP TABLE jobs_old")
+            print("Pre-render: coda migrata (colonna language)")
+
+        self._create_table(conn)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_next ON jobs(status, priority DESC, id)")
+
+        # Ripresa dopo un riavvio: un job interrotto a metà va rifatto
+        resumed = conn.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'").rowcount
+        self._prune(conn)
+        conn.commit()
+        if resumed:
+            print(f"Pre-render: {resumed} job ripresi dopo il riavvio")
+
+        with self._lock:
+            self._conn = conn
+            self._update_pending()
+
+    @staticmethod
+    def _create_table(conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tour_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                language TEXT NOT NULL DEFAULT 'it',
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (tour_id, text, language)
+            )
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            raise RuntimeError("Coda di pre-render non aperta (init non chiamato)")
+        return self._conn
+
+    def _prune(self, conn: sqlite3.Connection):
+        """Cancella i job chiusi da più di retention secondi (il commit è a carico del chiamante)"""
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - self.retention,)
+        )
+
+    def _update_pending(self):
+        self.pending = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()[0]
+
+    def _enqueue_sync(self, tour_id: str, texts: List[str], priority: int, language: str) -> int:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            self._prune(conn)
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT INTO jobs (tour_id, text, language, priority, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (tour_id, text, language) DO UPDATE SET status = 'pending', attempts = 0, error = NULL, "
+                "priority = excluded.priority, updated_at = excluded.updated_at "
+                "WHERE jobs.status IN ('done', 'failed')",
+                [(tour_id, text, language, priority, now, now) for text in dict.fromkeys(texts) if text.strip()]
+            )
+            conn.commit()
+            self._update_pending()
+            return conn.total_changes - before
+
+    def _claim_next_sync(self) -> Optional[sqlite3.Row]:
+        with self._lock:
+            conn = self._connection()
+            job = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'pending' ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if job is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (time.time(), job["id"])
+                )
+                conn.commit()
+                self._update_pending()
+            return job
+
+    def _mark_done_sync(self, job_id: int):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE jobs SET status = 'done', error = NULL, updated_at = ? WHERE id = ?", (time.time(), job_id))
+            conn.commit()
+
+    def _mark_failed_sync(self, job_id: int, error: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, updated_at = ? WHERE id = ?",
+                (self.max_attempts, error, time.time(), job_id)
+            )
+            conn.commit()
+            self._update_pending()
+
+    def _progress_sync(self, tour_id: str = None) -> dict:
+        query = "SELECT status, COUNT(*) FROM jobs"
+        params = ()
+        if tour_id is not None:
+            query += " WHERE tour_id = ?"
+            params = (tour_id,)
+        with self._lock:
+            rows = self._connection().execute(query + " GROUP BY status", params).fetchall()
+
+        counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+        counts.update({status: count for status, count in rows})
+        total = sum(counts.values())
+        return {
+            "tour_id": tour_id,
+            "total": total,
+            **counts,
+            "percent": round(100 * (counts["done"] + counts["failed"]) / total, 1) if total else 100.0,
+        }
+
+
+class PrerenderWorker:
+    """
+    Worker asincrono che svuota la coda una frase alla volta.
+    Cede sempre il passo alle richieste on-demand: finché is_busy() è vero non prende nuovi job,
+    quindi un turista aspetta al massimo la frase di pre-render già in corso.
+    """
+
+    def __init__(self, queue: PrerenderQueue, render: Callable[..., Awaitable], is_busy: Callable[[], bool]):
+        self.queue = queue
+        self.render = render
+        self.is_busy = is_busy
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.current = None
+
+    def notify(self):
+        """Sveglia il worker (nuovi job in coda)"""
+        self._wakeup.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        print("Pre-render worker avviato.")
+        while True:
+            # Priorità alle richieste on-demand
+            if self.is_busy():
+                await asyncio.sleep(PRERENDER_IDLE_POLL)
+                continue
+
+            try:
+                job = await self.queue.claim_next()
+            except Exception as e:
+                # Es. storage_executor saturo: riproviamo tra poco
+                print(f"Pre-render: lettura della coda fallita: {e}")
+                await asyncio.sleep(PRERENDER_IDLE_POLL)
+                continue
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=60)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.current = job["text"]
+            try:
+                await self.render(job["text"], language=job["language"])
+                await self.queue.mark_done(job["id"])
+            except asyncio.CancelledError:
+                # Shutdown: il job resta "running" e verrà ripreso al prossimo avvio
+                raise
+            except Exception as e:
+                print(f"Pre-render fallito (job {job['id']}): {e}")
+                try:
+                    await self.queue.mark_failed(job["id"], str(e))
+                except Exception as db_error:
+                    # Il job resta "running": verrà ripreso al prossimo avvio
+                    print(f"Pre-render: aggiornamento del job {job['id']} fallito: {db_error}")
+                # Se il TTS è saturo o in errore, non martelliamolo
+                await asyncio.sleep(PRERENDER_IDLE_POLL)
+            finally:
+                self.current = None
+
+
+# --- CODA GLOBALE (database aperto e worker avviato nel lifespan dell'app) ---
+prerender_queue = PrerenderQueue()
\ No newline at end of file
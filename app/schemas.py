@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
     #--- TITOLI ---
 
@@ -10,6 +10,7 @@ class TitleResponse(BaseModel):
     original: str
     options: List[str] # Restituiremo 3 varianti
     best_option: str
+    cached: bool = False # True se la risposta arriva dalla cache LLM
 
 
     # --- DESCRIZIONI ---
@@ -21,12 +22,43 @@ class DescriptionRequest(BaseModel):
 class DescriptionResponse(BaseModel):
     full_text_optimized: str  # Testo intero da mostrare a schermo (UI)
     tts_chunks: List[str]     # Lista di frasi <180char per il motore audio
+    cached: bool = False      # True se la risposta arriva dalla cache LLM
 
     # --- AUDIO ON DEMAND ---
 class AudioGenerationRequest(BaseModel):
     text: str          # La singola frase da leggere
     language: str = "it"
+    engine: Optional[str] = None  # "xtts" o "piper" (default: TTS_DEFAULT_ENGINE)
+    quality: Optional[str] = None # In alternativa a engine: "fast" (Piper, subito) o "high" (XTTS)
 
 class AudioGenerationResponse(BaseModel):
     audio_url: str     # L'URL di MinIO da suonare
-    cached: bool       # Debug: ci dice se era già pronto o no
\ No newline at end of file
+    cached: bool       # Debug: ci dice se era già pronto o no
+    engine: str = "xtts" # Motore che ha prodotto l'audio
+
+    # --- AUDIO BATCH (tutti i tts_chunks di una descrizione) ---
+class BatchAudioGenerationRequest(BaseModel):
+    items: List[AudioGenerationRequest]
+
+class BatchAudioGenerationResponse(BaseModel):
+    results: List[AudioGenerationResponse] # Stesso ordine di items
+
+    # --- PRE-RENDER (audio di un tour generato in anticipo) ---
+class PrerenderRequest(BaseModel):
+    tour_id: str
+    chunks: List[str]  # Tutti i tts_chunks del tour
+    priority: int = 0  # Più alta = prima (le richieste on-demand hanno sempre la precedenza)
+    language: str = "it"
+
+class PrerenderProgress(BaseModel):
+    tour_id: Optional[str] = None # None = intera coda
+    total: int
+    pending: int
+    running: int
+    done: int
+    failed: int
+    percent: float
+
+class PrerenderResponse(BaseModel):
+    queued: int        # Frasi aggiunte o rimesse in coda (quelle già in attesa vengono ignorate)
+    progress: PrerenderProgress
\ No newline at end of file
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """
+    Registro dei lavori in corso (single-flight).
+    Richieste concorrenti con la stessa chiave condividono un unico lavoro e ne ricevono lo stesso risultato.
+    Il lavoro gira in un task proprio: se il client che l'ha avviato si disconnette, gli altri continuano ad attenderlo.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Task] = {}
+        self.leaders = 0    # Lavori effettivamente avviati
+        self.coalesced = 0  # Richieste accodate a un lavoro già in corso
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    def start(self, key: str, fn: Callable[[], Awaitable]) -> Tuple[asyncio.Task, bool]:
+        """
+        Avvia fn() se non c'è già un lavoro per la chiave, senza attenderlo.
+        Ritorna (task, is_leader): is_leader è False se ci si è accodati a un lavoro esistente.
+        """
+        task = self._flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task, False
+
+        self.leaders += 1
+        task = asyncio.ensure_future(fn())
+        self._flights[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return task, True
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        """Esegue fn() una sola volta per chiave tra le richieste concorrenti"""
+        task, _ = self.start(key, fn)
+        # shield: la cancellazione di un singolo chiamante non cancella il lavoro condiviso
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Evita il warning "exception was never retrieved" se tutti i chiamanti sono andati via
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -1,30 +1,307 @@
+import io
+import os
+import abc
+import json
+import asyncio
+import shutil
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import urllib3
 from minio import Minio
 from minio.error import S3Error
-from app.config import MINIO_ENDPOINT, MINIO_ACCESS_KEY, MINIO_SECRET_KEY, MINIO_BUCKET, SECURE_URL
 
-client = Minio(
-    MINIO_ENDPOINT,
-    access_key=MINIO_ACCESS_KEY,
-    secret_key=MINIO_SECRET_KEY,
-    secure=SECURE_URL
+from app.config import (
+    MINIO_ENDPOINT, MINIO_ACCESS_KEY, MINIO_SECRET_KEY, MINIO_BUCKET, SECURE_URL, STORAGE_MAX_WORKERS,
+    OBJECT_INDEX_MAX_ITEMS, OBJECT_INDEX_TTL, PRESIGNED_URL_EXPIRES, PRESIGNED_URL_MARGIN,
+    STORAGE_BACKEND, STORAGE_POOL_SIZE, STORAGE_CONNECT_TIMEOUT, STORAGE_READ_TIMEOUT, STORAGE_RETRIES,
+    STORAGE_PART_SIZE, STORAGE_PARALLEL_PARTS, STORAGE_FS_ROOT, STORAGE_FS_BASE_URL
 )
+from app.executors import BoundedExecutor, storage_executor
+from app.utils.lru_cache import TTLLRUCache
+
+
+class ObjectStorage(abc.ABC):
+    """
+    Storage asincrono degli audio generati.
+    I backend implementano le primitive bloccanti (_*_sync, astratte: un backend incompleto fallisce già alla costruzione),
+    eseguite nello storage_executor;
+    questa classe aggiunge l'indice in memoria (oggetti noti, URL) e le operazioni concorrenti sui batch.
+    """
+
+    def __init__(self, executor: BoundedExecutor = storage_executor, max_concurrency: int = STORAGE_MAX_WORKERS):
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        # Oggetti di cui conosciamo l'esistenza (solo risultati positivi: un oggetto non si "disesiste" da solo)
+        self.known_objects = TTLLRUCache(max_items=OBJECT_INDEX_MAX_ITEMS, ttl=OBJECT_INDEX_TTL)
+        # URL degli oggetti, tenuti fino a poco prima della loro scadenza
+        self.urls_cache = TTLLRUCache(max_items=OBJECT_INDEX_MAX_ITEMS, ttl=PRESIGNED_URL_EXPIRES - PRESIGNED_URL_MARGIN)
+
+    # --- PRIMITIVE BLOCCANTI (backend) ---
+
+    @abc.abstractmethod
+    def _init_sync(self):
+        ...
+
+    @abc.abstractmethod
+    def _list_sync(self) -> Iterable[str]:
+        ...
+
+    @abc.abstractmethod
+    def _exists_sync(self, object_name: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def _url_sync(self, object_name: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def _get_bytes_sync(self, object_name: str) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def _put_bytes_sync(self, data: bytes, object_name: str, content_type: str, metadata: dict):
+        ...
+
+    @abc.abstractmethod
+    def _put_file_sync(self, file_path: str, object_name: str, content_type: str, metadata: dict):
+        ...
+
+    def _close_sync(self):
+        pass
+
+    # --- API ASINCRONA ---
 
-if not client.bucket_exists(MINIO_BUCKET):
-    client.make_bucket(MINIO_BUCKET)
+    async def init(self):
+        """Inizializzazione lazy (es. creazione del bucket): chiamata dal lifespan, non all'import"""
+        await self.executor.run(self._init_sync)
 
-def check_file_exists(object_name: str) -> bool:
-    """Controlla se un file esiste già su MinIO"""
-    try:
-        client.stat_object(MINIO_BUCKET, object_name)
-        return True
-    except S3Error:
+    async def warm_index(self, limit: int = OBJECT_INDEX_MAX_ITEMS) -> int:
+        """Popola l'indice con gli oggetti già presenti. Ritorna quanti ne ha letti"""
+        def warm() -> int:
+            count = 0
+            for object_name in self._list_sync():
+                if count >= limit:
+                    break
+                self.known_objects.set(object_name, True)
+                count += 1
+            return count
+
+        count = await self.executor.run(warm)
+        print(f"Indice storage: {count} oggetti noti")
+        return count
+
+    async def exists(self, object_name: str) -> bool:
+        """Controlla se un oggetto esiste già (gli oggetti indicizzati non passano dall'executor)"""
+        if object_name in self.known_objects:
+            return True
+        if await self.executor.run(self._exists_sync, object_name):
+            self.known_objects.set(object_name, True)
+            return True
         return False
 
-def get_file_url(object_name: str) -> str:
-    """Genera solo l'URL per un file esistente"""
-    return client.get_presigned_url("GET", MINIO_BUCKET, object_name)
+    async def exists_many(self, object_names: List[str]) -> Dict[str, bool]:
+        """Controlla in parallelo l'esistenza di più oggetti"""
+        unique_names = list(dict.fromkeys(object_names))
+        results = await self._gather(self.exists(name) for name in unique_names)
+        return dict(zip(unique_names, results))
+
+    async def url(self, object_name: str) -> str:
+        """URL di un oggetto esistente"""
+        url = self.urls_cache.get(object_name)
+        if url is None:
+            url = await self.executor.run(self._url_sync, object_name)
+            self.urls_cache.set(object_name, url)
+        return url
+
+    async def urls(self, object_names: List[str]) -> List[str]:
+        return await self._gather(self.url(name) for name in object_names)
+
+    async def get_bytes(self, object_name: str) -> bytes:
+        """Contenuto di un oggetto esistente (es. per riempire la cache locale)"""
+        return await self.executor.run(self._get_bytes_sync, object_name)
+
+    async def put_bytes(self, data: bytes, object_name: str, content_type: str = "audio/mpeg", metadata: dict = None):
+        """Carica un oggetto già in memoria (nessun passaggio su disco)"""
+        await self.executor.run(self._put_bytes_sync, data, object_name, content_type, metadata)
+        self.known_objects.set(object_name, True)
+
+    async def put_file(self, file_path: str, object_name: str, metadata: dict = None):
+        content_type = "audio/mpeg" if file_path.endswith(".mp3") else "audio/wav"
+        await self.executor.run(self._put_file_sync, file_path, object_name, content_type, metadata)
+        self.known_objects.set(object_name, True)
+
+    async def put_many(self, blobs: List[Tuple]):
+        """Carica in parallelo più oggetti in memoria: lista di (dati, nome oggetto, content-type[, metadati])"""
+        await self._gather(self.put_bytes(*blob) for blob in blobs)
+
+    async def put_files(self, files: List[Tuple]):
+        """Carica in parallelo più file: lista di (percorso locale, nome oggetto[, metadati])"""
+        await self._gather(self.put_file(*f) for f in files)
+
+    async def _gather(self, coros) -> list:
+        """asyncio.gather con al massimo max_concurrency operazioni in volo (un batch non monopolizza l'executor)"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
+
+        return await asyncio.gather(*[bounded(coro) for coro in coros])
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__, "objects": self.known_objects.stats(), "urls": self.urls_cache.stats()}
+
+    def close(self):
+        self._close_sync()
+
+
+class MinioStorage(ObjectStorage):
+    """
+    Backend MinIO/S3. Il client condivide un pool HTTP dimensionato sugli executor (connessioni riusate,
+    timeout e retry espliciti); il costruttore non fa chiamate di rete.
+    """
+
+    def __init__(self, bucket: str = MINIO_BUCKET, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket = bucket
+        self.http = urllib3.PoolManager(
+            num_pools=4,
+            maxsize=STORAGE_POOL_SIZE,
+            block=True, # Oltre maxsize si attende una connessione libera invece di aprirne di usa e getta
+            timeout=urllib3.Timeout(connect=STORAGE_CONNECT_TIMEOUT, read=STORAGE_READ_TIMEOUT),
+            retries=urllib3.Retry(total=STORAGE_RETRIES, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+        )
+        self.client = Minio(
+            MINIO_ENDPOINT,
+            access_key=MINIO_ACCESS_KEY,
+            secret_key=MINIO_SECRET_KEY,
+            secure=SECURE_URL,
+            http_client=self.http,
+        )
+
+    def _init_sync(self):
+        if not self.client.bucket_exists(self.bucket):
+            self.client.make_bucket(self.bucket)
+
+    def _list_sync(self) -> Iterable[str]:
+        # list_objects pagina da solo
+        for obj in self.client.list_objects(self.bucket, recursive=True):
+            yield obj.object_name
+
+    def _exists_sync(self, object_name: str) -> bool:
+        try:
+            self.client.stat_object(self.bucket, object_name)
+            return True
+        except S3Error:
+            return False
+
+    def _url_sync(self, object_name: str) -> str:
+        return self.client.get_presigned_url(
+            "GET", self.bucket, object_name, expires=timedelta(seconds=PRESIGNED_URL_EXPIRES)
+        )
+
+    def _get_bytes_sync(self, object_name: str) -> bytes:
+        response = self.client.get_object(self.bucket, object_name)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def _put_bytes_sync(self, data: bytes, object_name: str, content_type: str, metadata: dict):
+        # Oltre STORAGE_PART_SIZE l'upload diventa multipart, con STORAGE_PARALLEL_PARTS parti in parallelo
+        self.client.put_object(
+            self.bucket, object_name, io.BytesIO(data), length=len(data), content_type=content_type, metadata=metadata,
+            part_size=STORAGE_PART_SIZE, num_parallel_uploads=STORAGE_PARALLEL_PARTS
+        )
+
+    def _put_file_sync(self, file_path: str, object_name: str, content_type: str, metadata: dict):
+        self.client.fput_object(
+            self.bucket, object_name, file_path, content_type=content_type, metadata=metadata,
+            part_size=STORAGE_PART_SIZE, num_parallel_uploads=STORAGE_PARALLEL_PARTS
+        )
+
+    def _close_sync(self):
+        self.http.clear()
+
+
+class FilesystemStorage(ObjectStorage):
+    """
+    Backend su disco locale, al posto di MinIO in sviluppo, test e benchmark.
+    Gli oggetti sono file sotto root (scritti in modo atomico); content-type e metadati in un file .meta.json accanto.
+    Gli URL puntano a base_url (servito dall'app, vedi main.py) oppure a file:// se base_url è vuoto.
+    """
+
+    META_SUFFIX = ".meta.json"
+
+    def __init__(self, root: str = STORAGE_FS_ROOT, base_url: str = STORAGE_FS_BASE_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip("/")
+
+    def path_for(self, object_name: str) -> Path:
+        path = (self.root / object_name).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f"Nome oggetto non valido: {object_name}")
+        return path
+
+    def _init_sync(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _list_sync(self) -> Iterable[str]:
+        for path in self.root.rglob("*"):
+            if path.is_file() and not path.name.endswith(self.META_SUFFIX) and not path.name.startswith("."):
+                yield path.relative_to(self.root).as_posix()
+
+    def _exists_sync(self, object_name: str) -> bool:
+        return self.path_for(object_name).is_file()
+
+    def _url_sync(self, object_name: str) -> str:
+        if self.base_url:
+            return f"{self.base_url}/{object_name}"
+        return self.path_for(object_name).as_uri()
+
+    def _write_atomic(self, path: Path, write):
+        """Scrive su un file temporaneo nella stessa cartella e lo rinomina: mai oggetti letti a metà"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".upload_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def _write_meta(self, path: Path, content_type: str, metadata: dict):
+        meta = json.dumps({"content_type": content_type, "metadata": metadata or {}}).encode("utf-8")
+        self._write_atomic(path.with_name(path.name + self.META_SUFFIX), lambda f: f.write(meta))
+
+    def _get_bytes_sync(self, object_name: str) -> bytes:
+        return self.path_for(object_name).read_bytes()
+
+    def _put_bytes_sync(self, data: bytes, object_name: str, content_type: str, metadata: dict):
+        path = self.path_for(object_name)
+        self._write_meta(path, content_type, metadata)
+        self._write_atomic(path, lambda f: f.write(data))
+
+    def _put_file_sync(self, file_path: str, object_name: str, content_type: str, metadata: dict):
+        path = self.path_for(object_name)
+        self._write_meta(path, content_type, metadata)
+        with open(file_path, "rb") as source:
+            self._write_atomic(path, lambda f: shutil.copyfileobj(source, f))
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> ObjectStorage:
+    if backend == "minio":
+        return MinioStorage()
+    if backend == "filesystem":
+        return FilesystemStorage()
+    raise ValueError(f"Backend di storage non valido: {backend} (ammessi: minio, filesystem)")
+
 
-def upload_file(file_path: str, object_name: str):
-    """Carica il file (senza ritornare l'URL, lo facciamo separato)"""
-    content_type = "audio/mpeg" if file_path.endswith(".mp3") else "audio/wav"
-    client.fput_object(MINIO_BUCKET, object_name, file_path, content_type=content_type)
\ No newline at end of file
+# --- STORAGE GLOBALE (il bucket viene creato nel lifespan dell'app, non all'import) ---
+storage = create_storage()
\ No newline at end of file
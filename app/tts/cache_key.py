@@ -0,0 +1,62 @@
+import json
+import hashlib
+from urllib.parse import quote
+
+from app.config import AUDIO_CACHE_KEY_VERSION, AUDIO_CACHE_PREFIX
+from app.tts.text_normalizer import TextNormalizer
+from app.utils.audio_converter import AudioConverter
+
+
+class AudioCacheKey:
+    """
+    Chiave content-addressed di un audio: SHA-256 di tutto ciò che determina i campioni prodotti.
+    - Testo normalizzato (post-TextNormalizer): spazi in più, markdown o emoji non cambiano la chiave.
+    - Lingua, motore, hash della voce e parametri di sintesi: cambiando la voce o un parametro
+      cambia la chiave, quindi non si serve mai audio vecchio e non serve svuotare il bucket.
+    - Versione dello schema della chiave, nel prefisso: permette di cambiare la derivazione in futuro.
+    Oggetto: audio/v1/ab/cd/abcd....mp3 (prefisso a shard, così nessuna "cartella" diventa enorme).
+    """
+
+    def __init__(self, normalized_text: str, language: str, engine: str, fingerprint: dict, audio_format: str):
+        self.normalized_text = normalized_text
+        self.language = language
+        self.engine = engine
+        self.fingerprint = fingerprint
+        self.audio_format = audio_format
+
+        canonical = json.dumps({
+            "version": AUDIO_CACHE_KEY_VERSION,
+            "text": normalized_text,
+            "language": language,
+            "engine": engine,
+            "fingerprint": fingerprint,
+            "format": audio_format,
+        }, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        self.digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @property
+    def object_name(self) -> str:
+        extension = AudioConverter.extension_for(self.audio_format)
+        return f"{AUDIO_CACHE_PREFIX}/v{AUDIO_CACHE_KEY_VERSION}/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}{extension}"
+
+    @property
+    def metadata(self) -> dict:
+        """Metadati dell'oggetto (header x-amz-meta-*, solo ASCII: il testo viene codificato)"""
+        return {
+            "key-version": str(AUDIO_CACHE_KEY_VERSION),
+            "engine": self.engine,
+            "language": self.language,
+            "voice": str(self.fingerprint.get("voice", ""))[:16],
+            "params": quote(json.dumps(self.fingerprint, sort_keys=True)),
+            "text": quote(self.normalized_text[:512]),
+        }
+
+
+class AudioCacheKeyBuilder:
+    """Costruisce le chiavi con la stessa normalizzazione usata dai motori prima della sintesi"""
+
+    def __init__(self):
+        self.normalizer = TextNormalizer()
+
+    def build(self, text: str, language: str, engine: str, fingerprint: dict, audio_format: str) -> AudioCacheKey:
+        return AudioCacheKey(self.normalizer.clean_text(text).strip(), language, engine, fingerprint, audio_format)
\ No newline at end of file
@@ -1,17 +1,29 @@
 import os
 import torch
 import torchaudio
-import torchaudio.transforms as T
+import torch.nn.functional as F
 import gc 
+import math
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+import numpy as np
 from TTS.api import TTS
 from TTS.tts.configs.xtts_config import XttsConfig
 from TTS.tts.models.xtts import Xtts
 
-from app.config import REF_VOICE_PATH
+from app.config import (
+    REF_VOICE_PATH, XTTS_MODEL_POLICY, XTTS_IDLE_TIMEOUT, XTTS_STREAM_CHUNK_SIZE, XTTS_BATCH_MAX_SIZE, AUDIO_OUTPUT_RATE
+)
 from app.tts.text_normalizer import TextNormalizer
+from app.tts.voice_profile import VoiceProfileStore
+from app.tts.postprocess import AudioPostProcessor
 from app.utils.audio_converter import AudioConverter
+from app.metrics import observe_stage, stage_timer
 
 class XttsEngine:
+    name = "xtts"
+
     # Parametri Audio
     GEN_SPEED = 1.1        
     PITCH_STEPS = -0.5     
@@ -21,21 +33,87 @@ class XttsEngine:
     TOP_K = 60
     TOP_P = 0.8
 
-    def __init__(self):
-        print("Inizializzazione XTTS Engine (Modalità Lazy)...")
+    # Politiche di residenza del modello
+    POLICY_ALWAYS = "always"
+    POLICY_IDLE_TIMEOUT = "idle_timeout"
+    POLICY_PER_REQUEST = "per_request"
+    POLICIES = (POLICY_ALWAYS, POLICY_IDLE_TIMEOUT, POLICY_PER_REQUEST)
+
+    _ref_voice_hash = None # Hash del WAV di riferimento, calcolato una volta
+    # Da incrementare quando cambia l'audio prodotto a parità di parametri (es. calcolo dei latenti, post-processing)
+    RENDER_REVISION = 2
+
+    @classmethod
+    def cache_fingerprint(cls) -> dict:
+        """Voce e parametri che determinano l'audio prodotto (entrano nella chiave di cache, vedi app/tts/cache_key.py)"""
+        if cls._ref_voice_hash is None:
+            cls._ref_voice_hash = VoiceProfileStore.hash_file(REF_VOICE_PATH)
+        return {
+            "voice": cls._ref_voice_hash,
+            "revision": cls.RENDER_REVISION,
+            "gpt_cond_len": cls.GPT_COND_LEN,
+            "speed": cls.GEN_SPEED,
+            "pitch": cls.PITCH_STEPS,
+            "temperature": cls.TEMP,
+            "repetition_penalty": cls.REP_PENALTY,
+            "top_k": cls.TOP_K,
+            "top_p": cls.TOP_P,
+            "output_rate": AUDIO_OUTPUT_RATE,
+        }
+
+    def __init__(self, policy: str = XTTS_MODEL_POLICY, idle_timeout: float = XTTS_IDLE_TIMEOUT,
+                 max_batch_size: int = XTTS_BATCH_MAX_SIZE):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Politica XTTS non valida: {policy} (ammesse: {', '.join(self.POLICIES)})")
+
+        print(f"Inizializzazione XTTS Engine (Politica: {policy})...")
         
         self.normalizer = TextNormalizer()
+        self.policy = policy
+        self.idle_timeout = idle_timeout
+        self.max_batch_size = max(1, max_batch_size)
         
         # Inizializzazione a None per risparmiare memoria
         self.model = None
         self.config = None
 
+        # Profilo voce: letto da disco all'avvio (se già calcolato), altrimenti calcolato al primo caricamento
+        self.voice_store = VoiceProfileStore()
+        self.voice_profile = self.voice_store.load(REF_VOICE_PATH, self.GPT_COND_LEN)
+        self._device_profile = None # Copia dei latenti sul device del modello
+
+        # Pitch shift, ricampionamento e normalizzazione: costruiti una volta, riusati per ogni frase
+        self.postprocessor = AudioPostProcessor(pitch_steps=self.PITCH_STEPS)
+
+        # Il modello non è thread-safe: un lock protegge caricamento, generazione e rilascio
+        self._lock = threading.RLock()
+        self._idle_timer = None
+        self._last_used = 0.0
+
+        # Metriche (esposte da get_stats)
+        self.load_count = 0
+        self.last_load_seconds = 0.0
+        self.total_load_seconds = 0.0
+        self.request_count = 0
+        self.cold_request_count = 0
+        self.last_ttfa_seconds = 0.0
+        self.total_ttfa_seconds = 0.0
+        self.batch_count = 0          # Passaggi batch (più frasi insieme nel GPT e nel vocoder)
+        self.batched_requests = 0     # Frasi generate dentro un batch
+        self.batch_fallbacks = 0      # Batch falliti e rigenerati frase per frase
+
+        # Con "always" il modello è caldo già dall'avvio
+        if self.policy == self.POLICY_ALWAYS:
+            with self._lock:
+                self._load_model()
+
     def _load_model(self):
         """Carica il modello SOLO se non è già presente"""
         if self.model is not None:
             return
 
-        print("Caricamento XTTS v2 in VRAM (Lazy Load)...")
+        print("Caricamento XTTS v2 in VRAM...")
+        start = time.perf_counter()
         app_data = os.getenv('LOCALAPPDATA')
         model_path = os.path.join(app_data, "tts", "tts_models--multilingual--multi-dataset--xtts_v2")
         
@@ -55,6 +133,78 @@ class XttsEngine:
         else:
             print("XTTS su CPU")
 
+        # Latenti della voce di riferimento: calcolati una volta e riusati per ogni frase,
+        # con gli stessi parametri di condizionamento che Xtts.synthesize prende dalla config
+        settings = VoiceProfileStore.conditioning_settings(self.config)
+        if self.voice_profile is None or self.voice_profile.settings != settings:
+            self.voice_profile = self.voice_store.get_or_compute(self.model, REF_VOICE_PATH, self.GPT_COND_LEN, settings)
+        self._device_profile = self.voice_profile.to(self.model.device)
+        self.postprocessor.to(self.model.device)
+
+        elapsed = time.perf_counter() - start
+        observe_stage("model_load", elapsed)
+        self.load_count += 1
+        self.last_load_seconds = elapsed
+        self.total_load_seconds += elapsed
+        print(f"XTTS caricato in {elapsed:.2f}s")
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _schedule_idle_release(self):
+        """(Ri)avvia il timer che rilascia il modello dopo idle_timeout secondi senza richieste"""
+        self._cancel_idle_timer()
+        self._idle_timer = threading.Timer(self.idle_timeout, self._release_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _release_if_idle(self):
+        with self._lock:
+            # Una richiesta potrebbe essere arrivata mentre il timer scattava
+            if time.monotonic() - self._last_used >= self.idle_timeout:
+                print(f"XTTS inattivo da {self.idle_timeout}s")
+                self.release_memory()
+            self._idle_timer = None
+
+    def _after_request(self):
+        """Applica la politica di residenza al termine di una generazione"""
+        self._last_used = time.monotonic()
+        if self.policy == self.POLICY_PER_REQUEST:
+            self.release_memory()
+        elif self.policy == self.POLICY_IDLE_TIMEOUT:
+            self._schedule_idle_release()
+
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    def get_stats(self) -> dict:
+        """Metriche di caricamento e time-to-first-audio"""
+        return {
+            "policy": self.policy,
+            "idle_timeout": self.idle_timeout,
+            "model_loaded": self.is_loaded(),
+            "voice_profile": self.voice_profile.voice_hash[:16] if self.voice_profile else None,
+            "load_count": self.load_count,
+            "last_load_seconds": round(self.last_load_seconds, 3),
+            "total_load_seconds": round(self.total_load_seconds, 3),
+            "request_count": self.request_count,
+            "cold_request_count": self.cold_request_count,
+            "last_ttfa_seconds": round(self.last_ttfa_seconds, 3),
+            "avg_ttfa_seconds": round(self.total_ttfa_seconds / self.request_count, 3) if self.request_count else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "batch_count": self.batch_count,
+            "avg_batch_size": round(self.batched_requests / self.batch_count, 2) if self.batch_count else 0.0,
+            "batch_fallbacks": self.batch_fallbacks,
+        }
+
+    def shutdown(self):
+        """Ferma il timer di inattività e scarica il modello"""
+        with self._lock:
+            self._cancel_idle_timer()
+            self.release_memory()
+
     def release_memory(self):
         """Scarica il modello per liberare spazio"""
         if self.model is not None:
@@ -63,63 +213,229 @@ class XttsEngine:
             del self.model
             self.model = None
             self.config = None
+            self._device_profile = None
             
             gc.collect()
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
 
     def generate_audio(self, text: str, output_filename: str) -> bool:
-        """Ciclo completo: Carica -> Genera -> Scarica"""
-        
-        # 1. CARICAMENTO FORZATO (Questo risolve l'errore 'NoneType')
+        """Ciclo completo: Carica (se serve) -> Genera -> Applica politica di residenza"""
+        return self.generate_batch([(text, output_filename)])[0]
+
+    def generate_audio_bytes(self, text: str, audio_format: str = "mp3") -> Optional[bytes]:
+        """Come generate_audio, ma l'audio codificato resta in memoria (nessun file temporaneo)"""
+        return self.generate_batch_bytes([text], audio_format)[0]
+
+    def generate_batch(self, jobs: List[Tuple[str, str]]) -> List[bool]:
+        """
+        Genera più frasi in un'unica sessione di modello caldo.
+        jobs: lista di (testo, file di output). Ritorna l'esito di ogni job, nello stesso ordine.
+        Il modello viene caricato al massimo una volta e la politica di residenza applicata solo alla fine.
+        """
+        return self._run_session(jobs, lambda job: self._generate_file(*job))
+
+    def generate_batch_bytes(self, texts: List[str], audio_format: str = "mp3") -> List[Optional[bytes]]:
+        """
+        Versione in memoria di generate_batch: ritorna i byte codificati (o None se fallisce) per ogni frase.
+        Le frasi vengono sintetizzate a gruppi di max_batch_size in un unico passaggio del modello (batch "paddati").
+        """
+        groups = [texts[start:start + self.max_batch_size] for start in range(0, len(texts), self.max_batch_size)]
+        results = self._run_session(groups, lambda group: self._generate_bytes_group(group, audio_format))
+        return [data for group in results for data in group]
+
+    def _run_session(self, items: list, generate) -> list:
+        with self._lock:
+            self._cancel_idle_timer()
+            try:
+                return [generate(item) for item in items]
+            finally:
+                self._after_request()
+
+    def _render_locked(self, text: str) -> torch.Tensor:
+        """Testo -> forma d'onda finale (1 x N, float32, postprocessor.output_rate, su CPU). Da chiamare con il lock acquisito"""
+        request_start = time.perf_counter()
+        self.request_count += 1
+
+        # 1. CARICAMENTO (solo se il modello non è già residente)
+        if self.model is None:
+            self.cold_request_count += 1
         self._load_model()
         
-        clean_text = self.normalizer.clean_text(text)
+        with stage_timer("normalize"):
+            clean_text = self.normalizer.clean_text(text)
+
+        # Controllo paranoico
+        if self.model is None:
+            raise Exception("CRITICO: Il modello è ancora None")
+
+        # 2. Generazione
+        with torch.no_grad(), stage_timer("synthesis"):
+            # inference() salta il condizionamento: i latenti della voce sono già pronti
+            outputs = self.model.inference(
+                clean_text,
+                "it",
+                self._device_profile.gpt_cond_latent,
+                self._device_profile.speaker_embedding,
+                speed=self.GEN_SPEED,
+                temperature=self.TEMP,
+                repetition_penalty=self.REP_PENALTY,
+                top_k=self.TOP_K,
+                top_p=self.TOP_P,
+                enable_text_splitting=False,
+                do_sample=True
+            )
+
+            # Time-to-first-audio: dalla richiesta al primo campione disponibile
+            ttfa = time.perf_counter() - request_start
+            self.last_ttfa_seconds = ttfa
+            self.total_ttfa_seconds += ttfa
+
+        # 3. Post-Processing (trasformazioni in cache)
+        with stage_timer("postprocess"):
+            return self.postprocessor(outputs["wav"])
+
+    def _render_batch_locked(self, texts: List[str]) -> List[torch.Tensor]:
+        """Come _render_locked, ma per più frasi in un solo passaggio di GPT e vocoder. Da chiamare con il lock acquisito"""
+        request_start = time.perf_counter()
+        self.request_count += len(texts)
+
+        if self.model is None:
+            self.cold_request_count += len(texts)
+        self._load_model()
+
+        with torch.no_grad(), stage_timer("synthesis"):
+            wavs = self._infer_batch(texts)
+
+            # Ogni frase del batch riceve il suo audio solo a fine batch
+            ttfa = time.perf_counter() - request_start
+            self.last_ttfa_seconds = ttfa
+            self.total_ttfa_seconds += ttfa * len(texts)
+
+        self.batch_count += 1
+        self.batched_requests += len(texts)
+        with stage_timer("postprocess"):
+            return [self.postprocessor(wav) for wav in wavs]
+
+    def _infer_batch(self, texts: List[str]) -> List[torch.Tensor]:
+        """
+        Equivalente batch di Xtts.inference (senza text splitting).
+        - GPT: i testi sono allineati a destra con lo stop token, come nei batch di training, e generati insieme;
+          la lunghezza di ogni sequenza di codici arriva al suo primo stop token.
+        - Vocoder: i latenti (zero-padding in coda) passano insieme da HiFi-GAN; ogni forma d'onda
+          viene poi ritagliata alla lunghezza che il decoder produce per i suoi latenti (_decoded_length).
+        """
+        model = self.model
+        gpt = model.gpt
+        device = model.device
+        batch_size = len(texts)
+
+        with stage_timer("normalize"):
+            clean_texts = [self.normalizer.clean_text(text).strip().lower() for text in texts]
+        tokens = [model.tokenizer.encode(clean_text, lang="it") for clean_text in clean_texts]
+        if max(len(t) for t in tokens) >= model.args.gpt_max_text_tokens:
+            raise ValueError("Frase troppo lunga per XTTS")
+
+        text_lengths = torch.tensor([len(t) for t in tokens], device=device)
+        text_tokens = torch.full((batch_size, int(text_lengths.max())), gpt.stop_text_token, dtype=torch.int32, device=device)
+        for i, t in enumerate(tokens):
+            text_tokens[i, :len(t)] = torch.tensor(t, dtype=torch.int32, device=device)
+
+        cond_latents = self._device_profile.gpt_cond_latent.expand(batch_size, -1, -1)
+        speaker_embedding = self._device_profile.speaker_embedding.expand(batch_size, -1, -1)
+
+        # 1. GPT autoregressivo: codici audio per tutte le frasi insieme
+        gpt_codes = gpt.generate(
+            cond_latents=cond_latents,
+            text_inputs=text_tokens,
+            input_tokens=None,
+            do_sample=True,
+            top_p=self.TOP_P,
+            top_k=self.TOP_K,
+            temperature=self.TEMP,
+            num_return_sequences=1,
+            num_beams=1,
+            length_penalty=1.0,
+            repetition_penalty=self.REP_PENALTY,
+            output_attentions=False,
+        )
+
+        # Le sequenze finite prima delle altre sono riempite con lo stop token: lunghezza = primo stop incluso
+        is_stop = gpt_codes == gpt.stop_audio_token
+        code_lengths = torch.where(
+            is_stop.any(dim=1), is_stop.int().argmax(dim=1) + 1, torch.full_like(text_lengths, gpt_codes.shape[-1])
+        )
+        max_codes = int(code_lengths.max())
+        gpt_codes = gpt_codes[:, :max_codes]
+
+        # 2. Latenti GPT (passaggio teacher-forced, gestisce già i batch con lunghezze diverse)
+        gpt_latents = gpt(
+            text_tokens,
+            text_lengths,
+            gpt_codes,
+            code_lengths * gpt.code_stride_len,
+            cond_latents=cond_latents,
+            return_attentions=False,
+            return_latent=True,
+        )
+
+        length_scale = 1.0 / max(self.GEN_SPEED, 0.05)
+        latents = []
+        for i in range(batch_size):
+            latent = gpt_latents[i:i + 1, :gpt_latents.shape[1] - (max_codes - int(code_lengths[i]))]
+            if length_scale != 1.0:
+                latent = F.interpolate(latent.transpose(1, 2), scale_factor=length_scale, mode="linear").transpose(1, 2)
+            latents.append(latent)
+
+        # 3. Vocoder in batch
+        max_frames = max(latent.shape[1] for latent in latents)
+        padded = torch.cat([F.pad(latent, (0, 0, 0, max_frames - latent.shape[1])) for latent in latents])
+        wavs = model.hifigan_decoder(padded, g=speaker_embedding).cpu().reshape(batch_size, -1)
+
+        return [wavs[i, :self._decoded_length(latent.shape[1])] for i, latent in enumerate(latents)]
+
+    def _decoded_length(self, frames: int) -> int:
+        """
+        Campioni prodotti da HiFi-GAN per `frames` latenti GPT, con gli stessi passaggi di HifiDecoder.forward:
+        interpolazione latenti -> mel (ar_mel_length_compression / output_hop_length), eventuale cambio di
+        frequenza (output_sample_rate / input_sample_rate), poi output_hop_length campioni per frame mel.
+        """
+        decoder = self.model.hifigan_decoder
+        mel_frames = math.floor(frames * decoder.ar_mel_length_compression / decoder.output_hop_length)
+        if decoder.output_sample_rate != decoder.input_sample_rate:
+            mel_frames = math.floor(mel_frames * decoder.output_sample_rate / decoder.input_sample_rate)
+        return mel_frames * decoder.output_hop_length
+
+    def _generate_bytes_group(self, texts: List[str], audio_format: str) -> List[Optional[bytes]]:
+        """Un gruppo di frasi in un solo batch; se il batch fallisce si ripiega sulla generazione frase per frase"""
+        if len(texts) == 1:
+            return [self._generate_bytes(texts[0], audio_format)]
+
+        try:
+            wavs = self._render_batch_locked(texts)
+        except Exception as e:
+            print(f"Errore XTTS (batch da {len(texts)}): {e}, generazione frase per frase")
+            self.batch_fallbacks += 1
+            return [self._generate_bytes(text, audio_format) for text in texts]
+
+        with stage_timer("encode"):
+            return [AudioConverter.encode_samples(wav.squeeze(0).numpy(), self.postprocessor.output_rate, audio_format) for wav in wavs]
+
+    def _generate_file(self, text: str, output_filename: str) -> bool:
+        """Percorso su file (fallback): WAV temporaneo -> MP3 via AudioConverter"""
         is_mp3 = output_filename.endswith(".mp3")
         wav_temp = output_filename.replace(".mp3", ".wav") if is_mp3 else output_filename
         
         success = False
         
         try:
-            # Controllo paranoico
-            if self.model is None:
-                raise Exception("CRITICO: Il modello è ancora None")
-
-            # 2. Generazione
-            with torch.no_grad():
-                outputs = self.model.synthesize(
-                    clean_text,
-                    self.config,
-                    speaker_wav=REF_VOICE_PATH,
-                    language="it",
-                    gpt_cond_len=self.GPT_COND_LEN,
-                    speed=self.GEN_SPEED,
-                    temperature=self.TEMP,
-                    repetition_penalty=self.REP_PENALTY,
-                    top_k=self.TOP_K,
-                    top_p=self.TOP_P,
-                    enable_text_splitting=False,
-                    do_sample=True
-                )
-
-                # 3. Post-Processing
-                wav_tensor = torch.tensor(outputs["wav"]).unsqueeze(0)
-
-                if self.PITCH_STEPS != 0:
-                    pitch_shifter = T.PitchShift(sample_rate=24000, n_steps=self.PITCH_STEPS)
-                    wav_tensor = pitch_shifter(wav_tensor)
-
-                max_val = torch.abs(wav_tensor).max()
-                if max_val > 0: wav_tensor = wav_tensor / max_val * 0.95
-
-                resampler = T.Resample(orig_freq=24000, new_freq=44100, dtype=torch.float32)
-                wav_hq = resampler(wav_tensor)
-                
-                torchaudio.save(wav_temp, wav_hq.detach().cpu(), 44100, bits_per_sample=32)
+            wav_hq = self._render_locked(text)
+            torchaudio.save(wav_temp, wav_hq, self.postprocessor.output_rate, bits_per_sample=32)
 
             # 4. Conversione
             if is_mp3:
-                AudioConverter.convert_wav_to_mp3(wav_temp)
+                with stage_timer("encode"):
+                    AudioConverter.convert_wav_to_mp3(wav_temp)
                 success = os.path.exists(output_filename)
             else:
                 success = True
@@ -131,7 +447,69 @@ class XttsEngine:
                 except: pass
             success = False
         
-        finally:
-            self.release_memory()
-        
-        return success
\ No newline at end of file
+        return success
+
+    def _generate_bytes(self, text: str, audio_format: str) -> Optional[bytes]:
+        """Percorso in memoria: tensore -> pipe ffmpeg -> byte MP3/Opus"""
+        try:
+            wav_hq = self._render_locked(text)
+        except Exception as e:
+            print(f"Errore XTTS: {e}")
+            return None
+
+        with stage_timer("encode"):
+            return AudioConverter.encode_samples(wav_hq.squeeze(0).numpy(), self.postprocessor.output_rate, audio_format)
+
+    def stream_audio(self, text: str, on_samples: Callable[[np.ndarray], None]) -> bool:
+        """
+        Sintesi in streaming: on_samples riceve blocchi mono float32 a 24 kHz appena il modello li produce.
+        Niente pitch/normalizzazione/ricampionamento qui: su blocchi parziali li fa StreamingEncoder (ffmpeg).
+        Il risultato differisce da generate_audio_bytes: in cache va sotto una chiave dedicata (variante "stream").
+        """
+        with self._lock:
+            self._cancel_idle_timer()
+            try:
+                request_start = time.perf_counter()
+                self.request_count += 1
+                if self.model is None:
+                    self.cold_request_count += 1
+                self._load_model()
+
+                with stage_timer("normalize"):
+                    clean_text = self.normalizer.clean_text(text)
+                first_chunk = True
+
+                with torch.no_grad():
+                    chunks = self.model.inference_stream(
+                        clean_text,
+                        "it",
+                        self._device_profile.gpt_cond_latent,
+                        self._device_profile.speaker_embedding,
+                        stream_chunk_size=XTTS_STREAM_CHUNK_SIZE,
+                        speed=self.GEN_SPEED,
+                        temperature=self.TEMP,
+                        repetition_penalty=self.REP_PENALTY,
+                        top_k=self.TOP_K,
+                        top_p=self.TOP_P,
+                        enable_text_splitting=False,
+                        do_sample=True
+                    )
+                    for chunk in chunks:
+                        if first_chunk:
+                            # In streaming il primo audio arriva dopo il primo blocco, non a fine frase
+                            ttfa = time.perf_counter() - request_start
+                            self.last_ttfa_seconds = ttfa
+                            self.total_ttfa_seconds += ttfa
+                            first_chunk = False
+
+                        samples = chunk.detach().cpu().numpy().astype(np.float32)
+                        on_samples(np.clip(samples, -0.95, 0.95))
+
+                return True
+
+            except Exception as e:
+                print(f"Errore XTTS (streaming): {e}")
+                return False
+
+            finally:
+                self._after_request()
\ No newline at end of file
@@ -0,0 +1,75 @@
+from typing import Dict, List, Optional, Protocol, Tuple, runtime_checkable
+
+from app.config import TTS_DEFAULT_ENGINE, TTS_QUALITY_ENGINES
+from app.executors import BoundedExecutor
+
+
+@runtime_checkable
+class TtsEngine(Protocol):
+    """
+    Interfaccia comune dei motori TTS (XttsEngine, TtsProcessPool, PiperEngine).
+    Metodi bloccanti: vanno chiamati dall'executor associato al motore nel registro.
+    """
+
+    name: str
+
+    def generate_audio(self, text: str, output_filename: str) -> bool: ...
+
+    def generate_audio_bytes(self, text: str, audio_format: str = "mp3") -> Optional[bytes]: ...
+
+    def generate_batch(self, jobs: List[Tuple[str, str]]) -> List[bool]: ...
+
+    def generate_batch_bytes(self, texts: List[str], audio_format: str = "mp3") -> List[Optional[bytes]]: ...
+
+    def cache_fingerprint(self) -> dict: ...
+
+    def get_stats(self) -> dict: ...
+
+    def shutdown(self): ...
+
+
+class UnknownEngine(ValueError):
+    """Motore o qualità richiesti non esistono (o non sono attivi su questo nodo)"""
+
+
+class EngineRegistry:
+    """
+    Motori TTS disponibili, selezionabili per richiesta per nome ("xtts", "piper") o per qualità ("fast", "high").
+    Ogni motore ha il suo executor: la sintesi veloce non resta in coda dietro a quella di qualità.
+    """
+
+    def __init__(self, default: str = TTS_DEFAULT_ENGINE, qualities: Dict[str, str] = TTS_QUALITY_ENGINES):
+        self.default = default
+        self.qualities = qualities
+        self._engines: Dict[str, Tuple[TtsEngine, BoundedExecutor]] = {}
+
+    def register(self, engine: TtsEngine, executor: BoundedExecutor):
+        self._engines[engine.name] = (engine, executor)
+
+    def available(self, name: str) -> bool:
+        return name in self._engines
+
+    def resolve(self, engine: Optional[str] = None, quality: Optional[str] = None) -> str:
+        """Nome del motore da usare: esplicito > qualità richiesta > default"""
+        if engine is None and quality is not None:
+            if quality not in self.qualities:
+                raise UnknownEngine(f"Qualità non valida: {quality} (ammesse: {', '.join(self.qualities)})")
+            engine = self.qualities[quality]
+        engine = engine or self.default
+        if engine not in self._engines:
+            raise UnknownEngine(f"Motore TTS non disponibile: {engine} (attivi: {', '.join(self._engines)})")
+        return engine
+
+    def get(self, name: str) -> TtsEngine:
+        return self._engines[name][0]
+
+    def executor(self, name: str) -> BoundedExecutor:
+        return self._engines[name][1]
+
+    def stats(self) -> dict:
+        return {name: engine.get_stats() for name, (engine, _) in self._engines.items()}
+
+    def shutdown(self):
+        for engine, _ in self._engines.values():
+            engine.shutdown()
+        self._engines.clear()
\ No newline at end of file
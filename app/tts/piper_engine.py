@@ -1,11 +1,33 @@
 import subprocess
 import os
 import sys
+import json
+import time
+import hashlib
+import threading
+import wave
+from typing import List, Optional, Tuple
+import numpy as np
+from app.config import PIPER_MODE, PIPER_INTRA_OP_THREADS, PIPER_INTER_OP_THREADS
 from app.tts.text_normalizer import TextNormalizer
+from app.utils.audio_converter import AudioConverter
+from app.metrics import stage_timer
 
 class PiperEngine:
-    def __init__(self):
-        print("Inizializzazione Piper TTS...")
+    """Motore veloce (qualità "fast"): latenza bassa su CPU, voce meno naturale di XTTS"""
+    name = "piper"
+
+    LEAD_SILENCE = 0.2 # secondi di silenzio iniziale (come adelay=200 nel percorso su file)
+    SENTENCE_SILENCE = 0.5
+
+    # Modalità
+    MODE_RESIDENT = "resident"     # Modello ONNX caricato una volta in questo processo
+    MODE_SUBPROCESS = "subprocess" # `python -m piper` per ogni frase (comportamento storico)
+
+    WARMUP_TEXT = "Prova." # Sintesi di controllo al caricamento del modello residente
+
+    def __init__(self, mode: str = PIPER_MODE):
+        print(f"Inizializzazione Piper TTS (Modalità: {mode})...")
         
         # 1. Calcolo Percorsi Assoluti
         # Cartella corrente: .../XRTourGuide/app/tts
@@ -18,6 +40,19 @@ class PiperEngine:
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"ERRORE CRITICO: Modello non trovato in: {self.model_path}")
 
+        # Frequenza di campionamento e parametri di inferenza della voce (dal file di configurazione accanto al modello)
+        with open(f"{self.model_path}.json", encoding="utf-8") as f:
+            model_config = json.load(f)
+        self.sample_rate = model_config["audio"]["sample_rate"]
+        self.inference_params = model_config.get("inference", {})
+
+        # Hash del modello: un'altra voce (o un modello aggiornato) cambia la chiave di cache
+        digest = hashlib.sha256()
+        with open(self.model_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        self.voice_hash = digest.hexdigest()
+
         # 3. Percorso FFmpeg (Conversione MP3)
         # Cerca in XRTourGuide/bin/ffmpeg.exe
         self.ffmpeg_path = os.path.join(project_root, "bin", "ffmpeg.exe")
@@ -30,7 +65,171 @@ class PiperEngine:
 
         self.normalizer = TextNormalizer()
 
+        # Metriche (esposte da get_stats), aggiornate da più thread del fast_tts_executor
+        self.request_count = 0
+        self.total_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+        # Il PiperVoice residente è condiviso dai thread del fast_tts_executor, ma il fonemizzatore (espeak-ng)
+        # non è thread-safe: una sintesi alla volta, il parallelismo viene dai thread intra-op di ONNX Runtime.
+        # La codifica (ffmpeg) resta fuori dal lock.
+        self._lock = threading.Lock()
+
+        # 4. Modello residente: niente avvio dell'interprete né ricaricamento del modello ad ogni frase.
+        # Usa l'API di piper-tts 1.2 (vedi requirements.txt): se manca o è diversa, una frase di prova
+        # fallisce già qui e si ripiega sulla modalità subprocess invece di sbagliare ad ogni richiesta
+        self.voice = None
+        if mode == self.MODE_RESIDENT:
+            try:
+                self.voice = self._load_voice()
+                # Oltre al silenzio iniziale deve esserci audio
+                if self._synthesize_resident(self.WARMUP_TEXT).size <= int(self.sample_rate * self.LEAD_SILENCE):
+                    raise RuntimeError("sintesi di prova vuota")
+            except Exception as e:
+                print(f"Piper residente non disponibile ({type(e).__name__}: {e}): uso la modalità subprocess")
+                self.voice = None
+        self.mode = self.MODE_RESIDENT if self.voice is not None else self.MODE_SUBPROCESS
+
+    def _load_voice(self):
+        """Sessione ONNX Runtime con thread limitati: gira accanto a XTTS senza rubargli tutti i core"""
+        import onnxruntime
+        from piper.voice import PiperVoice
+        from piper.config import PiperConfig
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = PIPER_INTRA_OP_THREADS
+        options.inter_op_num_threads = PIPER_INTER_OP_THREADS
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        start = time.perf_counter()
+        with open(f"{self.model_path}.json", encoding="utf-8") as f:
+            config = PiperConfig.from_dict(json.load(f))
+        session = onnxruntime.InferenceSession(self.model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        print(f"Piper caricato in {time.perf_counter() - start:.2f}s")
+        return PiperVoice(session=session, config=config)
+
+    def _synthesize_resident(self, text: str) -> np.ndarray:
+        """Testo -> campioni int16 (con silenzio iniziale e tra le frasi), tutto in memoria"""
+        text = self.normalizer.clean_text(text)
+        with self._lock:
+            raw = b"".join(self.voice.synthesize_stream_raw(text, sentence_silence=self.SENTENCE_SILENCE))
+        lead = np.zeros(int(self.sample_rate * self.LEAD_SILENCE), dtype=np.int16)
+        return np.concatenate([lead, np.frombuffer(raw, dtype=np.int16)])
+
+    def _record(self, seconds: float):
+        with self._stats_lock:
+            self.request_count += 1
+            self.total_seconds += seconds
+
+    def _piper_env(self) -> dict:
+        my_env = os.environ.copy()
+        my_env["PYTHONUTF8"] = "1"
+        my_env["PYTHONIOENCODING"] = "utf-8"
+        return my_env
+
+    def generate_audio(self, text: str, output_filename: str) -> bool:
+        """Interfaccia comune dei motori (vedi app/tts/engines.py)"""
+        return self.genera_audio(text, output_filename)
+
+    def generate_audio_bytes(self, text: str, audio_format: str = "mp3") -> Optional[bytes]:
+        """Percorso in memoria: PCM di Piper (sessione residente o stdout del processo) -> pipe ffmpeg, senza file temporanei"""
+        start = time.perf_counter()
+
+        if self.voice is not None:
+            try:
+                with stage_timer("synthesis"):
+                    samples = self._synthesize_resident(text)
+            except Exception as e:
+                print(f"Errore Piper: {e}")
+                return None
+            self._record(time.perf_counter() - start)
+            with stage_timer("encode"):
+                return AudioConverter.encode_samples(samples.astype(np.float32) / 32768.0, self.sample_rate, audio_format)
+
+        comando_piper = [
+            sys.executable, "-m", "piper",
+            "--model", self.model_path,
+            "--output-raw",
+            "--sentence_silence", str(self.SENTENCE_SILENCE)
+        ]
+
+        try:
+            with stage_timer("synthesis"):
+                result = subprocess.run(
+                    comando_piper,
+                    input=self.normalizer.clean_text(text).encode('utf-8'),
+                    env=self._piper_env(),
+                    check=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                )
+        except subprocess.CalledProcessError as e:
+            print(f"Errore Processo: {e.stderr.decode('utf-8', errors='ignore')}")
+            return None
+
+        samples = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+        if samples.size == 0:
+            return None
+        samples = np.concatenate([np.zeros(int(self.sample_rate * self.LEAD_SILENCE), dtype=np.float32), samples])
+
+        self._record(time.perf_counter() - start)
+        with stage_timer("encode"):
+            return AudioConverter.encode_samples(samples, self.sample_rate, audio_format)
+
+    def generate_batch(self, jobs: List[Tuple[str, str]]) -> List[bool]:
+        return [self.generate_audio(text, output_filename) for text, output_filename in jobs]
+
+    def generate_batch_bytes(self, texts: List[str], audio_format: str = "mp3") -> List[Optional[bytes]]:
+        return [self.generate_audio_bytes(text, audio_format) for text in texts]
+
+    def cache_fingerprint(self) -> dict:
+        """Voce e parametri che determinano l'audio prodotto (entrano nella chiave di cache, vedi app/tts/cache_key.py)"""
+        return {
+            "voice": self.voice_hash,
+            "inference": self.inference_params,
+            "sentence_silence": self.SENTENCE_SILENCE,
+            "lead_silence": self.LEAD_SILENCE,
+        }
+
+    def get_stats(self) -> dict:
+        return {
+            "engine": self.name,
+            "mode": self.mode,
+            "model": os.path.basename(self.model_path),
+            "model_loaded": self.voice is not None,
+            "sample_rate": self.sample_rate,
+            "request_count": self.request_count,
+            "avg_seconds": round(self.total_seconds / self.request_count, 3) if self.request_count else 0.0,
+        }
+
+    def shutdown(self):
+        self.voice = None
+
+    def _genera_audio_resident(self, testo: str, output_filename: str) -> bool:
+        """Percorso su file in modalità residente: MP3 codificato in memoria, oppure WAV 16 bit"""
+        try:
+            if output_filename.endswith(".mp3"):
+                data = self.generate_audio_bytes(testo, "mp3")
+                if not data:
+                    return False
+                with open(output_filename, "wb") as f:
+                    f.write(data)
+            else:
+                samples = self._synthesize_resident(testo)
+                with wave.open(output_filename, "wb") as wav_file:
+                    wav_file.setnchannels(1)
+                    wav_file.setsampwidth(2)
+                    wav_file.setframerate(self.sample_rate)
+                    wav_file.writeframes(samples.tobytes())
+            return os.path.exists(output_filename)
+        except Exception as e:
+            print(f"Errore Generico: {e}")
+            return False
+
     def genera_audio(self, testo, output_filename):
+        if self.voice is not None:
+            return self._genera_audio_resident(testo, output_filename)
 
         # --- NORMALIZZAZIONE ---
         # Il testo grezzo diventa "testo fonetico"
@@ -43,19 +242,15 @@ class PiperEngine:
             sys.executable, "-m", "piper",
             "--model", self.model_path,
             "--output_file", wav_temp,
-            "--sentence_silence", "0.5"
+            "--sentence_silence", str(self.SENTENCE_SILENCE)
         ]
 
-        my_env = os.environ.copy()
-        my_env["PYTHONUTF8"] = "1"
-        my_env["PYTHONIOENCODING"] = "utf-8"
-
         try:
             # 1. Genera WAV
             subprocess.run(
                 comando_piper, 
                 input=testo_processato.encode('utf-8'),
-                env=my_env,
+                env=self._piper_env(),
                 check=True,
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.PIPE
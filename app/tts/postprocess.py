@@ -0,0 +1,53 @@
+import torch
+import torchaudio.transforms as T
+
+from app.config import AUDIO_OUTPUT_RATE
+
+
+class AudioPostProcessor:
+    """
+    Post-processing XTTS costruito UNA volta per motore: pitch shift -> normalizzazione di picco -> ricampionamento
+    (stesso ordine, e quindi stesso audio, del post-processing storico).
+    Le trasformazioni (e i loro kernel) restano in cache sul device del modello invece di essere ricreate ad ogni frase.
+    Con output_rate uguale a input_rate il ricampionamento viene saltato (codifica a 24 kHz nativi).
+    """
+
+    def __init__(self, input_rate: int = 24000, pitch_steps: float = 0.0, output_rate: int = AUDIO_OUTPUT_RATE,
+                 peak: float = 0.95, device="cpu"):
+        self.input_rate = input_rate
+        self.output_rate = output_rate or input_rate
+        self.peak = peak
+        self.device = torch.device(device)
+
+        self.pitch_shifter = T.PitchShift(sample_rate=input_rate, n_steps=pitch_steps) if pitch_steps != 0 else None
+        self.resampler = None
+        if self.output_rate != input_rate:
+            self.resampler = T.Resample(orig_freq=input_rate, new_freq=self.output_rate, dtype=torch.float32)
+
+        self.to(self.device)
+
+    def to(self, device) -> "AudioPostProcessor":
+        """Sposta le trasformazioni sul device indicato (no-op se ci sono già)"""
+        self.device = torch.device(device)
+        for transform in (self.pitch_shifter, self.resampler):
+            if transform is not None:
+                transform.to(self.device)
+        return self
+
+    def __call__(self, wav) -> torch.Tensor:
+        """Forma d'onda grezza (numpy/tensore, 1D) -> tensore 1 x N float32 su CPU, pronto per la codifica"""
+        with torch.inference_mode():
+            wav_tensor = torch.as_tensor(wav, dtype=torch.float32, device=self.device).reshape(1, -1)
+
+            if self.pitch_shifter is not None:
+                wav_tensor = self.pitch_shifter(wav_tensor)
+
+            # Normalizzazione di picco in un'unica operazione in-place
+            max_val = wav_tensor.abs().max()
+            if max_val > 0:
+                wav_tensor.mul_(self.peak / max_val)
+
+            if self.resampler is not None:
+                wav_tensor = self.resampler(wav_tensor)
+
+            return wav_tensor.cpu()
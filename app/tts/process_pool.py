@@ -0,0 +1,296 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import (
+    TTS_PROCESS_WORKERS, TTS_WORKER_THREADS, TTS_WORKER_PIN_CORES, TTS_WORKER_RESTART_DELAY,
+    TTS_WORKER_START_TIMEOUT, TTS_WORKER_MAX_START_FAILURES, TTS_JOB_TIMEOUT
+)
+from app.metrics import buffer_stages, observe_stage
+
+
+def _worker_main(conn, index: int, threads: int, pin_cores: bool):
+    """
+    Processo worker: un modello XTTS residente con un budget fisso di thread.
+    Riceve (metodo, argomenti) dalla pipe e risponde con ("result", valore, stats, fasi) o ("error", messaggio, stats, fasi),
+    dove fasi sono le durate (fase, secondi) misurate durante il lavoro, da registrare nelle metriche del processo principale.
+    In streaming invia anche ("samples", blocco) man mano che l'audio è pronto.
+    """
+    stages = buffer_stages()
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    # Core dedicati (solo Linux): i worker non si contendono le stesse cache
+    if pin_cores and hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        mine = cores[index * threads:(index + 1) * threads]
+        if len(mine) == threads:
+            os.sched_setaffinity(0, mine)
+
+    from app.tts.coqui_engine import XttsEngine
+    engine = XttsEngine(policy=XttsEngine.POLICY_ALWAYS)
+    conn.send(("ready", None, engine.get_stats(), stages[:]))
+    stages.clear()
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+
+        method, args = message
+        try:
+            if method == "stream_audio":
+                result = engine.stream_audio(args[0], lambda samples: conn.send(("samples", samples, None, None)))
+            else:
+                result = getattr(engine, method)(*args)
+            conn.send(("result", result, engine.get_stats(), stages[:]))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}", engine.get_stats(), stages[:]))
+        stages.clear()
+
+    engine.shutdown()
+
+
+class _WorkerSlot:
+    """Un processo worker e il thread che gli passa i lavori"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.busy = False
+        self.jobs = 0
+        self.restarts = 0
+        self.start_failures = 0 # Avvii falliti di fila (azzerato al primo avvio riuscito)
+        self.engine_stats = {}
+
+
+class TtsProcessPool:
+    """
+    Gestore di K processi XTTS per i nodi senza GPU.
+    Su CPU il threading intra-op di PyTorch scala poco: conviene avere più modelli con pochi thread ciascuno
+    (K x thread ≈ core fisici) invece di uno solo con tutti i core.
+    - I lavori passano da una coda comune: il primo worker libero li prende.
+    - Un worker che muore (OOM, crash nativo) viene riavviato; il lavoro che stava eseguendo fallisce.
+    - Se i worker non riescono ad avviarsi (max_start_failures volte di fila, nessuno pronto) i lavori in coda
+      falliscono subito invece di restare in attesa; ogni lavoro attende comunque al massimo job_timeout secondi.
+    Espone la stessa interfaccia bloccante di XttsEngine, da chiamare da tts_executor (con almeno K thread).
+    """
+
+    name = "xtts"
+
+    def __init__(self, workers: int = TTS_PROCESS_WORKERS, threads: int = TTS_WORKER_THREADS,
+                 pin_cores: bool = TTS_WORKER_PIN_CORES, job_timeout: float = TTS_JOB_TIMEOUT,
+                 max_start_failures: int = TTS_WORKER_MAX_START_FAILURES):
+        self.workers = workers
+        self.threads = threads
+        self.pin_cores = pin_cores
+        self.job_timeout = job_timeout
+        self.max_start_failures = max_start_failures
+        print(f"Avvio pool TTS: {workers} processi x {threads} thread...")
+
+        # spawn: fork con PyTorch già inizializzato non è sicuro (e su Windows è l'unica opzione)
+        self._context = mp.get_context("spawn")
+        self._jobs = queue.Queue()
+        self._stopping = threading.Event()
+
+        self._slots = [_WorkerSlot(i) for i in range(workers)]
+        self._threads = []
+        for slot in self._slots:
+            thread = threading.Thread(target=self._slot_loop, args=(slot,), name=f"tts-pool-{slot.index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # --- CICLO DI VITA DEI WORKER ---
+
+    def _start_worker(self, slot: _WorkerSlot):
+        parent_conn, child_conn = self._context.Pipe()
+        slot.process = self._context.Process(
+            target=_worker_main, args=(child_conn, slot.index, self.threads, self.pin_cores),
+            name=f"xtts-worker-{slot.index}", daemon=True
+        )
+        slot.process.start()
+        child_conn.close()
+        slot.conn = parent_conn
+
+        # Attesa del caricamento del modello
+        _, _, stats, stages = self._receive(slot, timeout=TTS_WORKER_START_TIMEOUT)
+        slot.engine_stats = stats
+        self._observe_stages(stages)
+        slot.ready = True
+        print(f"Worker TTS {slot.index} pronto (pid {slot.process.pid})")
+
+    def _stop_worker(self, slot: _WorkerSlot):
+        slot.ready = False
+        if slot.process is None:
+            return
+        try:
+            slot.conn.send(None)
+        except Exception:
+            pass
+        slot.process.join(timeout=10)
+        if slot.process.is_alive():
+            slot.process.terminate()
+            slot.process.join()
+        slot.conn.close()
+        slot.process = None
+
+    def _receive(self, slot: _WorkerSlot, timeout: float = None) -> tuple:
+        """Attende il prossimo messaggio del worker; solleva RuntimeError se il processo muore (o oltre timeout secondi)"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not slot.conn.poll(0.5):
+            if not slot.process.is_alive():
+                raise RuntimeError(f"Worker TTS {slot.index} terminato (exit code {slot.process.exitcode})")
+            if deadline is not None and time.monotonic() > deadline:
+                raise RuntimeError(f"Worker TTS {slot.index} non risponde da {timeout}s")
+        try:
+            return slot.conn.recv()
+        except EOFError:
+            raise RuntimeError(f"Worker TTS {slot.index} terminato")
+
+    @staticmethod
+    def _observe_stages(stages: list):
+        for stage, seconds in stages:
+            observe_stage(stage, seconds)
+
+    def _unavailable(self) -> bool:
+        """True se nessun worker è pronto e tutti hanno fallito l'avvio max_start_failures volte di fila"""
+        return all(not slot.ready and slot.start_failures >= self.max_start_failures for slot in self._slots)
+
+    def _fail_queued(self, message: str):
+        """Fa fallire i lavori ancora in coda"""
+        while True:
+            try:
+                _, _, _, future = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError(message))
+
+    def _slot_loop(self, slot: _WorkerSlot):
+        while not self._stopping.is_set():
+            # (Ri)avvio del processo se necessario
+            # (un worker che ha chiuso la pipe può risultare ancora vivo per qualche istante: conta ready)
+            if slot.process is None or not slot.ready or not slot.process.is_alive():
+                if slot.process is not None:
+                    slot.restarts += 1
+                    print(f"Worker TTS {slot.index} morto, riavvio ({slot.restarts})...")
+                    self._stop_worker(slot)
+                    time.sleep(TTS_WORKER_RESTART_DELAY)
+                try:
+                    self._start_worker(slot)
+                    slot.start_failures = 0
+                except Exception as e:
+                    slot.start_failures += 1
+                    print(f"Avvio worker TTS {slot.index} fallito ({slot.start_failures} di fila): {e}")
+                    if self._unavailable():
+                        # Nessun worker si avvia: chi è in coda riceve l'errore invece di aspettare all'infinito
+                        self._fail_queued(f"Pool TTS non disponibile: {e}")
+                    continue
+
+            try:
+                method, args, on_samples, future = self._jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            slot.busy = True
+            try:
+                slot.conn.send((method, args))
+                while True:
+                    kind, payload, stats, stages = self._receive(slot)
+                    if kind == "samples":
+                        on_samples(payload)
+                        continue
+                    slot.engine_stats = stats
+                    self._observe_stages(stages)
+                    if kind == "error":
+                        future.set_exception(RuntimeError(payload))
+                    else:
+                        future.set_result(payload)
+                    break
+            except Exception as e:
+                # Worker crashato durante il lavoro: il lavoro fallisce, il processo verrà riavviato al prossimo giro
+                slot.ready = False
+                future.set_exception(e)
+            finally:
+                slot.busy = False
+                slot.jobs += 1
+
+        self._stop_worker(slot)
+
+    # --- INTERFACCIA (come XttsEngine) ---
+
+    def _call(self, method: str, *args, on_samples: Callable = None):
+        if self._stopping.is_set():
+            raise RuntimeError("Pool TTS in chiusura")
+        if self._unavailable():
+            raise RuntimeError("Pool TTS non disponibile: i worker non riescono ad avviarsi")
+        future = Future()
+        self._jobs.put((method, args, on_samples, future))
+        try:
+            return future.result(timeout=self.job_timeout)
+        except FutureTimeoutError: # Su Python < 3.11 non è il TimeoutError builtin
+            # Ancora in coda: non verrà più eseguito. Già in esecuzione: il risultato verrà scartato
+            future.cancel()
+            raise RuntimeError(f"Pool TTS: nessun risultato entro {self.job_timeout}s")
+
+    def generate_audio(self, text: str, output_filename: str) -> bool:
+        return self._call("generate_audio", text, output_filename)
+
+    def generate_audio_bytes(self, text: str, audio_format: str = "mp3") -> Optional[bytes]:
+        return self._call("generate_audio_bytes", text, audio_format)
+
+    def generate_batch(self, jobs: List[Tuple[str, str]]) -> List[bool]:
+        return self._call("generate_batch", jobs)
+
+    def generate_batch_bytes(self, texts: List[str], audio_format: str = "mp3") -> List[Optional[bytes]]:
+        return self._call("generate_batch_bytes", texts, audio_format)
+
+    def stream_audio(self, text: str, on_samples: Callable[[np.ndarray], None]) -> bool:
+        return self._call("stream_audio", text, on_samples=on_samples)
+
+    def cache_fingerprint(self) -> dict:
+        # I worker usano XttsEngine con la stessa configurazione
+        from app.tts.coqui_engine import XttsEngine
+        return XttsEngine.cache_fingerprint()
+
+    def is_loaded(self) -> bool:
+        return any(slot.ready for slot in self._slots)
+
+    def get_stats(self) -> dict:
+        return {
+            "mode": "process_pool",
+            "workers": self.workers,
+            "threads_per_worker": self.threads,
+            "queued": self._jobs.qsize(),
+            "model_loaded": self.is_loaded(),
+            "worker_stats": [
+                {
+                    "index": slot.index,
+                    "pid": slot.process.pid if slot.process is not None else None,
+                    "ready": slot.ready,
+                    "busy": slot.busy,
+                    "jobs": slot.jobs,
+                    "restarts": slot.restarts,
+                    "engine": slot.engine_stats,
+                }
+                for slot in self._slots
+            ],
+        }
+
+    def shutdown(self):
+        """Ferma i worker; i lavori ancora in coda falliscono"""
+        self._stopping.set()
+        self._fail_queued("Pool TTS in chiusura")
+        for thread in self._threads:
+            thread.join(timeout=15)
\ No newline at end of file
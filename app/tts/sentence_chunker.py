@@ -0,0 +1,135 @@
+import re
+from typing import List
+
+from app.config import TTS_CHUNK_MAX_CHARS, TTS_CHUNK_MIN_CHARS
+
+
+class SentenceChunker:
+    """
+    Splitter/packer deterministico per l'italiano che garantisce il limite di caratteri per chunk TTS.
+    - I chunk entro il limite restano intatti (l'LLM di solito li divide bene).
+    - Quelli oltre il limite vengono divisi in frasi e ricomposti fino a max_chars;
+      una frase ancora troppo lunga si spezza ai confini di proposizione (; : , congiunzioni), poi agli spazi.
+    - I frammenti minuscoli vengono uniti al vicino se il risultato sta nel limite.
+    """
+
+    # Parole che terminano con un punto senza chiudere la frase
+    ABBREVIATIONS = {
+        "sec", "secc", "ecc", "es", "p", "pp", "sig", "sigg", "dott", "prof", "mons", "s", "ss", "sant",
+        "n", "nr", "ca", "cfr", "vol", "fig", "art", "cap", "d.c", "a.c", "p.es", "c.a", "vd", "tel",
+    }
+
+    SENTENCE_END_RE = re.compile(r'[.!?…]+["»”’)\]]*\s+')
+    WORD_BEFORE_RE = re.compile(r'(\S+?)[.!?…]+["»”’)\]]*$')
+
+    # Punti di taglio dentro una frase, dal più "naturale" al meno
+    CLAUSE_RES = (
+        re.compile(r'[;:]\s+'),
+        re.compile(r',\s+'),
+        re.compile(r'\s+(?=(?:e|ed|ma|però|mentre|perché|poiché|quando|dove|oppure|che)\s)', re.IGNORECASE),
+        re.compile(r'\s+'),
+    )
+
+    SPACES_RE = re.compile(r'\s+')
+
+    def __init__(self, max_chars: int = TTS_CHUNK_MAX_CHARS, min_chars: int = TTS_CHUNK_MIN_CHARS):
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+
+    def _is_abbreviation(self, text_before: str) -> bool:
+        match = self.WORD_BEFORE_RE.search(text_before)
+        if match is None:
+            return False
+        word = match.group(1).lower().strip("(\"'«")
+        # Iniziali puntate (es. "G. Verdi")
+        if len(word) == 1 and word.isalpha():
+            return True
+        return word in self.ABBREVIATIONS
+
+    def split_sentences(self, text: str) -> List[str]:
+        """Divide un testo in frasi, ignorando i punti delle abbreviazioni (d.C., sec., ecc.)"""
+        text = self.SPACES_RE.sub(" ", text).strip()
+        sentences = []
+        start = 0
+        for match in self.SENTENCE_END_RE.finditer(text):
+            end = match.end()
+            if self._is_abbreviation(text[start:match.end()].rstrip()):
+                continue
+            sentences.append(text[start:end].strip())
+            start = end
+        if start < len(text):
+            sentences.append(text[start:].strip())
+        return [s for s in sentences if s]
+
+    def _split_long(self, sentence: str) -> List[str]:
+        """Spezza una frase oltre il limite al miglior confine di proposizione disponibile"""
+        pieces = []
+        while len(sentence) > self.max_chars:
+            cut = None
+            for clause_re in self.CLAUSE_RES:
+                # Ultimo confine che lascia a sinistra un pezzo entro il limite (e non minuscolo)
+                candidates = [m for m in clause_re.finditer(sentence)
+                              if self.min_chars <= len(sentence[:m.end()].rstrip()) <= self.max_chars]
+                if candidates:
+                    cut = candidates[-1]
+                    break
+
+            if cut is not None:
+                left, sentence = sentence[:cut.end()].rstrip(), sentence[cut.end():].lstrip()
+            else:
+                # Nessun confine utile (parola lunghissima): taglio netto
+                left, sentence = sentence[:self.max_chars], sentence[self.max_chars:].lstrip()
+            pieces.append(left)
+
+        if sentence:
+            pieces.append(sentence)
+        return pieces
+
+    def _pack(self, sentences: List[str]) -> List[str]:
+        """Ricompone frasi consecutive in chunk il più possibile vicini al limite"""
+        packed = []
+        for sentence in sentences:
+            if packed and len(packed[-1]) + 1 + len(sentence) <= self.max_chars:
+                packed[-1] = f"{packed[-1]} {sentence}"
+            else:
+                packed.append(sentence)
+        return packed
+
+    def merge_next(self, merged: List[str], chunk: str):
+        """Un passo di _merge_small: unisce chunk all'ultimo di merged se uno dei due è minuscolo e c'è spazio"""
+        if merged and (len(chunk) < self.min_chars or len(merged[-1]) < self.min_chars) \
+                and len(merged[-1]) + 1 + len(chunk) <= self.max_chars:
+            merged[-1] = f"{merged[-1]} {chunk}"
+        else:
+            merged.append(chunk)
+
+    def _merge_small(self, chunks: List[str]) -> List[str]:
+        """Unisce i frammenti più corti di min_chars al chunk precedente (o successivo) se c'è spazio"""
+        merged = []
+        for chunk in chunks:
+            self.merge_next(merged, chunk)
+        return merged
+
+    def split_text(self, text: str) -> List[str]:
+        """Testo libero (es. fallback con il testo originale) -> chunk entro il limite"""
+        return self.rechunk([text])
+
+    def split_chunk(self, chunk: str) -> List[str]:
+        """Un chunk dell'LLM -> pezzi entro il limite, senza unire i frammenti minuscoli (vedi merge_next)"""
+        chunk = self.SPACES_RE.sub(" ", chunk).strip()
+        if not chunk:
+            return []
+        if len(chunk) <= self.max_chars:
+            return [chunk]
+
+        sentences = []
+        for sentence in self.split_sentences(chunk):
+            sentences.extend(self._split_long(sentence))
+        return self._pack(sentences)
+
+    def rechunk(self, chunks: List[str]) -> List[str]:
+        """Valida i chunk dell'LLM: ri-divide quelli oltre il limite e unisce i frammenti minuscoli"""
+        result = []
+        for chunk in chunks:
+            result.extend(self.split_chunk(chunk))
+        return self._merge_small(result)
\ No newline at end of file
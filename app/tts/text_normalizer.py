@@ -1,6 +1,11 @@
 import re
 
 class TextNormalizer:
+    # Pattern fissi di clean_text, compilati una volta sola
+    MARKDOWN_RE = re.compile(r'[\*\#\[\]\_\-]')
+    EMOJI_RE = re.compile(r'[^\w\s\.,!\?;:àèéìòùÀÈÉÌÒÙ\'"]')
+    SPACES_RE = re.compile(r'\s+')
+
     def __init__(self):
         self.replacements = {}
         
@@ -91,39 +96,53 @@ class TextNormalizer:
             "sec.": "secolo",
         })
 
-    def _apply_replacements(self, text: str) -> str:
-        """Applica le sostituzioni dal dizionario usando Regex intelligenti"""
+        # Regex del dizionario compilate UNA volta (vedi _compile_replacements)
+        self._compile_replacements()
+
+    def _compile_replacements(self):
+        """
+        Precompila una regex per voce del dizionario, applicate nello stesso ordine del dizionario
+        (l'ordine conta: "s.p.q.r.item" -> "esse pi qu erreitem", dove "item" non è più una parola a sé).
+        In più un'unica alternanza di tutte le voci, usata solo per saltare il ciclo quando il testo
+        non contiene nessuna voce (il caso più comune).
+        Va richiamato se self.replacements viene modificato dopo la costruzione.
+        """
+        self._patterns = []
         for original, phonetic in self.replacements.items():
-            pattern = r'(?i)' # Case insensitive
-            
-            # Se inizia con alfanumerico, usa boundary \b per non sostituire parti di parola
-            if original[0].isalnum():
-                pattern += r'\b'
-            
-            pattern += re.escape(original)
-            
-            # Se finisce con alfanumerico, usa boundary \b.
+            pattern = re.escape(original)
+            # Se inizia/finisce con alfanumerico, usa boundary \b per non sostituire parti di parola.
             # Se finisce con punto (es "d.c."), NON usiamo \b perché il punto è già un delimitatore
+            if original[0].isalnum():
+                pattern = r'\b' + pattern
             if original[-1].isalnum():
                 pattern += r'\b'
-            
-            text = re.sub(pattern, phonetic, text)
+            self._patterns.append((re.compile(pattern, re.IGNORECASE), phonetic))
+
+        self._any_replacement_re = re.compile("|".join(p.pattern for p, _ in self._patterns), re.IGNORECASE) if self._patterns else None
+
+    def _apply_replacements(self, text: str) -> str:
+        """Applica le sostituzioni dal dizionario, in ordine, con le regex precompilate"""
+        # Nessuna voce presente: nessuna sostituzione può scattare
+        if self._any_replacement_re is None or not self._any_replacement_re.search(text):
+            return text
+        for pattern, phonetic in self._patterns:
+            text = pattern.sub(phonetic, text)
         return text
 
     def clean_text(self, text: str) -> str:
         """Pipeline principale di pulizia"""
         
         # 1. RIMOZIONE MARKDOWN E EMOJI
-        text = re.sub(r'[\*\#\[\]\_\-]', '', text) # Via markdown (*, #, _, -)
+        text = self.MARKDOWN_RE.sub('', text) # Via markdown (*, #, _, -)
         
         # Mantiene solo lettere, numeri e punteggiatura base. Via Emoji.
-        text = re.sub(r'[^\w\s\.,!\?;:àèéìòùÀÈÉÌÒÙ\'"]', '', text)
+        text = self.EMOJI_RE.sub('', text)
 
         # 2. NORMALIZZAZIONE DIZIONARIO (Latino, date, tech)
         text = self._apply_replacements(text)
 
         # 3. PULIZIA SPAZI
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = self.SPACES_RE.sub(' ', text).strip()
         
         # 4. GESTIONE PUNTEGGIATURA FINALE (Specifico per XTTS)
         # Se finisce con un punto, lo togliamo e mettiamo un a capo
@@ -0,0 +1,127 @@
+import os
+import hashlib
+import tempfile
+import torch
+
+from app.config import VOICE_PROFILE_DIR
+
+
+class VoiceProfile:
+    """Latenti di condizionamento XTTS pre-calcolati per una voce di riferimento"""
+
+    def __init__(self, voice_hash: str, gpt_cond_len: int, gpt_cond_latent: torch.Tensor, speaker_embedding: torch.Tensor,
+                 settings: dict):
+        self.voice_hash = voice_hash
+        self.gpt_cond_len = gpt_cond_len
+        self.settings = settings # Altri parametri di get_conditioning_latents (vedi VoiceProfileStore.conditioning_settings)
+        self.gpt_cond_latent = gpt_cond_latent
+        self.speaker_embedding = speaker_embedding
+
+    def to(self, device) -> "VoiceProfile":
+        """Copia dei latenti sul device del modello (cpu/cuda)"""
+        return VoiceProfile(
+            self.voice_hash,
+            self.gpt_cond_len,
+            self.gpt_cond_latent.to(device),
+            self.speaker_embedding.to(device),
+            self.settings,
+        )
+
+
+class VoiceProfileStore:
+    """
+    Archivio su disco dei profili voce.
+    Chiave: hash del file WAV di riferimento + GPT_COND_LEN; nel file anche gli altri parametri di condizionamento
+    (dalla config del modello), verificati al caricamento del modello.
+    I latenti si calcolano UNA volta sola, poi vengono riletti da un piccolo file .pt.
+    """
+
+    FORMAT_VERSION = 2 # v1: latenti calcolati con i default del metodo invece che con la config
+
+    def __init__(self, profile_dir: str = VOICE_PROFILE_DIR):
+        self.profile_dir = profile_dir
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_file(wav_path: str) -> str:
+        """SHA-256 del contenuto del file (cambia la voce -> cambia la chiave)"""
+        digest = hashlib.sha256()
+        with open(wav_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _profile_path(self, voice_hash: str, gpt_cond_len: int) -> str:
+        return os.path.join(self.profile_dir, f"{voice_hash[:16]}_gcl{gpt_cond_len}_v{self.FORMAT_VERSION}.pt")
+
+    @staticmethod
+    def conditioning_settings(config) -> dict:
+        """Parametri di condizionamento che Xtts.synthesize prende dalla config (oltre a gpt_cond_len)"""
+        return {
+            "gpt_cond_chunk_len": config.gpt_cond_chunk_len,
+            "max_ref_length": config.max_ref_len,
+            "sound_norm_refs": config.sound_norm_refs,
+        }
+
+    def load(self, wav_path: str, gpt_cond_len: int, settings: dict = None):
+        """
+        Legge il profilo dal disco. Ritorna None se non è mai stato calcolato (o è illeggibile).
+        Con settings, anche se è stato calcolato con parametri di condizionamento diversi.
+        """
+        voice_hash = self.hash_file(wav_path)
+        path = self._profile_path(voice_hash, gpt_cond_len)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            data = torch.load(path, map_location="cpu")
+            if (data.get("voice_hash") != voice_hash or data.get("gpt_cond_len") != gpt_cond_len
+                    or (settings is not None and data.get("settings") != settings)):
+                print(f"Profilo voce non coerente, verrà ricalcolato: {path}")
+                return None
+
+            print(f"Profilo voce caricato da disco: {path}")
+            return VoiceProfile(voice_hash, gpt_cond_len, data["gpt_cond_latent"], data["speaker_embedding"], data["settings"])
+        except Exception as e:
+            print(f"Errore lettura profilo voce {path}: {e}")
+            return None
+
+    def compute(self, model, wav_path: str, gpt_cond_len: int, settings: dict) -> VoiceProfile:
+        """Calcola i latenti con il modello XTTS (stessi parametri di Xtts.synthesize) e li salva su disco"""
+        print(f"Calcolo latenti di condizionamento per {wav_path}...")
+        voice_hash = self.hash_file(wav_path)
+
+        with torch.no_grad():
+            gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
+                audio_path=[wav_path],
+                gpt_cond_len=gpt_cond_len,
+                **settings,
+            )
+
+        profile = VoiceProfile(voice_hash, gpt_cond_len, gpt_cond_latent.detach().cpu(), speaker_embedding.detach().cpu(), settings)
+
+        path = self._profile_path(voice_hash, gpt_cond_len)
+        # File temporaneo unico nella stessa cartella: i worker del pool TTS possono calcolare il profilo insieme
+        fd, tmp_path = tempfile.mkstemp(dir=self.profile_dir, prefix=".tmp_", suffix=".pt")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                torch.save({
+                    "voice_hash": voice_hash,
+                    "gpt_cond_len": gpt_cond_len,
+                    "gpt_cond_latent": profile.gpt_cond_latent,
+                    "speaker_embedding": profile.speaker_embedding,
+                    "settings": settings,
+                }, f)
+            os.replace(tmp_path, path) # Scrittura atomica
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        print(f"Profilo voce salvato: {path}")
+
+        return profile
+
+    def get_or_compute(self, model, wav_path: str, gpt_cond_len: int, settings: dict) -> VoiceProfile:
+        profile = self.load(wav_path, gpt_cond_len, settings)
+        if profile is None:
+            profile = self.compute(model, wav_path, gpt_cond_len, settings)
+        return profile
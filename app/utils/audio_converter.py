@@ -1,5 +1,10 @@
 import os
+import io
 import sys
+import subprocess
+import threading
+import numpy as np
+from typing import Callable, Optional
 from pydub import AudioSegment, AudioSegment
 
 class AudioConverter:
@@ -17,6 +22,51 @@ class AudioConverter:
         # Cerco FFMPEG nel sistema
         print("AudioConverter: FFmpeg locale non trovato in 'bin'. Provo quello di sistema...")
 
+    # Formati supportati dalla codifica in memoria: argomenti ffmpeg, content-type, estensione
+    FORMATS = {
+        "mp3": (["-c:a", "libmp3lame", "-q:a", "2", "-f", "mp3"], "audio/mpeg", ".mp3"),
+        "opus": (["-c:a", "libopus", "-b:a", "64k", "-f", "ogg"], "audio/ogg", ".ogg"),
+    }
+
+    @staticmethod
+    def content_type_for(audio_format: str) -> str:
+        return AudioConverter.FORMATS[audio_format][1]
+
+    @staticmethod
+    def extension_for(audio_format: str) -> str:
+        return AudioConverter.FORMATS[audio_format][2]
+
+    @staticmethod
+    def encode_samples(samples: np.ndarray, sample_rate: int, audio_format: str = "mp3") -> Optional[bytes]:
+        """
+        Codifica campioni mono float32 direttamente in MP3/Opus passando per le pipe di ffmpeg.
+        Nessun file su disco. Se la pipe fallisce ripiega su pydub (che usa file temporanei).
+        """
+        codec_args = AudioConverter.FORMATS[audio_format][0]
+        pcm = np.ascontiguousarray(samples, dtype="<f4").tobytes()
+
+        command = [
+            AudioSegment.converter, "-hide_banner", "-loglevel", "error",
+            "-f", "f32le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+            *codec_args, "pipe:1"
+        ]
+        try:
+            result = subprocess.run(command, input=pcm, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            return result.stdout
+        except Exception as e:
+            detail = e.stderr.decode("utf-8", errors="ignore") if isinstance(e, subprocess.CalledProcessError) else e
+            print(f"Codifica in memoria fallita ({detail}), uso il percorso pydub...")
+
+        try:
+            pcm16 = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+            audio = AudioSegment(data=pcm16, sample_width=2, frame_rate=sample_rate, channels=1)
+            buffer = io.BytesIO()
+            audio.export(buffer, format="mp3" if audio_format == "mp3" else "ogg", codec=None if audio_format == "mp3" else "libopus")
+            return buffer.getvalue()
+        except Exception as e:
+            print(f"Errore critico codifica audio: {e}")
+            return None
+
     @staticmethod
     def convert_wav_to_mp3(wav_path: str, bitrate: str = "192k") -> str:
         """
@@ -53,6 +103,64 @@ class AudioConverter:
             # Se fallisce, ritorniamo il wav
             return wav_path
 
+class StreamingEncoder:
+    """
+    Codificatore incrementale: riceve blocchi PCM float32 mentre il modello li produce
+    e restituisce i frame MP3/Opus appena ffmpeg li emette (callback on_data, da un thread lettore).
+    Pitch e ricampionamento sono fatti da ffmpeg in modo continuo, senza artefatti tra un blocco e l'altro.
+    """
+
+    def __init__(self, sample_rate: int, audio_format: str = "mp3", on_data: Callable[[bytes], None] = None,
+                 output_rate: int = 44100, pitch_steps: float = 0.0):
+        codec_args = AudioConverter.FORMATS[audio_format][0]
+
+        # Pitch shift "streaming": asetrate alza/abbassa il tono, atempo riporta la durata originale
+        filters = []
+        if pitch_steps != 0:
+            factor = 2 ** (pitch_steps / 12)
+            filters += [f"asetrate={sample_rate * factor:.0f}", f"aresample={output_rate}", f"atempo={1 / factor:.6f}"]
+        else:
+            filters.append(f"aresample={output_rate}")
+
+        command = [
+            AudioSegment.converter, "-hide_banner", "-loglevel", "error",
+            "-fflags", "nobuffer", "-probesize", "32", "-analyzeduration", "0",
+            "-f", "f32le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+            "-af", ",".join(filters), "-ar", str(output_rate),
+            *codec_args, "-flush_packets", "1", "pipe:1"
+        ]
+        self.on_data = on_data
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        fd = self.process.stdout.fileno()
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                break
+            if self.on_data is not None:
+                self.on_data(data)
+
+    def write(self, samples: np.ndarray):
+        """Accoda un blocco di campioni mono float32"""
+        self.process.stdin.write(np.ascontiguousarray(samples, dtype="<f4").tobytes())
+        self.process.stdin.flush()
+
+    def close(self) -> bool:
+        """Chiude l'input, attende gli ultimi frame e ritorna True se ffmpeg è terminato correttamente"""
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        self._reader.join()
+        return self.process.wait() == 0
+
+    def abort(self):
+        self.process.kill()
+        self.close()
+
 if __name__ == "__main__":
     # Test rapido
     print(f"Root Progetto stimata: {AudioConverter.PROJECT_ROOT}")
\ No newline at end of file
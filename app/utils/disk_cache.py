@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+
+class DiskLRUCache:
+    """
+    Cache su disco locale limitata in byte (LRU), per gli oggetti immutabili (chiave = nome dell'oggetto).
+    L'ordine LRU è tenuto in memoria: un hit non tocca il disco. All'avvio (load) si ricostruisce
+    dai file presenti, ordinati per data di modifica.
+    Thread-safe: le scritture avvengono dai worker degli executor.
+    """
+
+    TEMP_PREFIX = ".tmp_"
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root).resolve()
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # nome oggetto -> dimensione in byte
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def path_for(self, object_name: str) -> Path:
+        path = (self.root / object_name).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f"Nome oggetto non valido: {object_name}")
+        return path
+
+    def load(self) -> int:
+        """Indicizza i file già presenti (es. dopo un riavvio) e rientra nel budget. Ritorna quanti ne ha trovati"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in self.root.rglob("*"):
+            if not path.is_file():
+                continue
+            if path.name.startswith(self.TEMP_PREFIX):
+                # Scrittura interrotta da un riavvio
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            found.append((stat.st_mtime, path.relative_to(self.root).as_posix(), stat.st_size))
+
+        with self._lock:
+            for _, object_name, size in sorted(found):
+                self._entries[object_name] = size
+                self._size += size
+        self._evict()
+        print(f"Cache audio locale: {len(found)} file, {self._size / 1024 / 1024:.1f} MB")
+        return len(found)
+
+    def get(self, object_name: str) -> Optional[Tuple[Path, os.stat_result]]:
+        """
+        Percorso locale dell'oggetto e stat del file (per servirlo senza rileggerlo dal disco), oppure None
+        se non è in cache o se il file non c'è più (es. rimosso dall'LRU mentre lo cercavamo).
+        Conta un hit o un miss: da usare una sola volta per richiesta servita.
+        """
+        path = self.path_for(object_name)
+        with self._lock:
+            if object_name not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(object_name)
+
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            with self._lock:
+                # Sparito dal disco ma ancora indicizzato (es. cancellato a mano): l'indice si riallinea
+                size = self._entries.pop(object_name, None)
+                if size is not None:
+                    self._size -= size
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return path, stat
+
+    def __contains__(self, object_name: str) -> bool:
+        """Presenza in cache, senza contare hit/miss né aggiornare l'ordine LRU"""
+        with self._lock:
+            return object_name in self._entries
+
+    def record_miss(self, count: int = 1):
+        """Miss di richieste servite da un altro livello (l'oggetto non è in locale, quindi get non viene chiamato)"""
+        with self._lock:
+            self.misses += count
+
+    def put_bytes(self, object_name: str, data: bytes):
+        self._put(object_name, len(data), lambda f: f.write(data))
+
+    def put_file(self, object_name: str, file_path: str):
+        with open(file_path, "rb") as source:
+            self._put(object_name, os.path.getsize(file_path), lambda f: shutil.copyfileobj(source, f))
+
+    def _put(self, object_name: str, size: int, write):
+        if size > self.max_bytes:
+            return
+        path = self.path_for(object_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Scrittura atomica: un file servito non è mai a metà
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=self.TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._size += size - self._entries.pop(object_name, 0)
+            self._entries[object_name] = size
+            self.writes += 1
+        self._evict()
+
+    def _evict(self):
+        """Rimuove gli oggetti usati meno di recente finché non si rientra nel budget"""
+        while True:
+            with self._lock:
+                if self._size <= self.max_bytes or not self._entries:
+                    return
+                object_name, size = self._entries.popitem(last=False)
+                self._size -= size
+                self.evictions += 1
+            self.path_for(object_name).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "items": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
\ No newline at end of file
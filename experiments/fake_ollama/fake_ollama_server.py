@@ -0,0 +1,113 @@
+"""
+Server Ollama finto per test e benchmark offline del backend.
+Implementa /api/chat (anche in streaming NDJSON) con risposte JSON valide per i servizi titolo e descrizione.
+
+Avvio:
+    python experiments/fake_ollama/fake_ollama_server.py
+    OLLAMA_HOST=http://localhost:11435 uvicorn app.main:app
+
+Variabili d'ambiente:
+    FAKE_OLLAMA_PORT       porta (default 11435)
+    FAKE_OLLAMA_DELAY      secondi di "generazione" per risposta (default 0.5)
+    FAKE_OLLAMA_FAIL_RATE  frazione di richieste che rispondono 503, per provare i retry (default 0)
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PORT = int(os.getenv("FAKE_OLLAMA_PORT", "11435"))
+DELAY = float(os.getenv("FAKE_OLLAMA_DELAY", "0.5"))
+FAIL_RATE = float(os.getenv("FAKE_OLLAMA_FAIL_RATE", "0"))
+
+TITLE_ANSWER = {
+    "options": ["Il Gigante di Pietra", "Dove Ruggivano i Leoni", "Sai chi sedeva qui?"],
+    "best_option": "Il Gigante di Pietra",
+}
+
+DESCRIPTION_CHUNKS = [
+    "Alzate lo sguardo: davanti a voi si innalza uno dei monumenti più celebri del mondo antico.",
+    "Le sue arcate di travertino, una sopra l'altra, catturano la luce del sole in ogni momento del giorno.",
+    "Qui, quasi duemila anni fa, decine di migliaia di spettatori si radunavano per assistere ai giochi.",
+    "Osservate i dettagli della pietra: ogni blocco racconta la maestria dei costruttori romani.",
+]
+
+app = FastAPI(title="Fake Ollama")
+stats = {"requests": 0, "running": 0, "max_running": 0, "failures": 0}
+
+
+def answer_for(prompt: str, schema=None) -> str:
+    if "best_option" in prompt:
+        answer = TITLE_ANSWER
+    else:
+        answer = {"full_text_optimized": " ".join(DESCRIPTION_CHUNKS), "tts_chunks": DESCRIPTION_CHUNKS}
+
+    # Come il decoding vincolato di Ollama: le chiavi escono nell'ordine dello schema passato in "format"
+    if isinstance(schema, dict) and "properties" in schema:
+        answer = {key: answer[key] for key in schema["properties"] if key in answer}
+    return json.dumps(answer, ensure_ascii=False)
+
+
+def final_message(model: str, content: str, started: float, prompt: str) -> dict:
+    eval_count = max(1, len(content) // 4)
+    return {
+        "model": model,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "message": {"role": "assistant", "content": content},
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": int((time.perf_counter() - started) * 1e9),
+        "prompt_eval_count": max(1, len(prompt) // 4),
+        "eval_count": eval_count,
+        "eval_duration": int(DELAY * 1e9) or 1,
+    }
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    started = time.perf_counter()
+    stats["requests"] += 1
+
+    if random.random() < FAIL_RATE:
+        stats["failures"] += 1
+        return JSONResponse(status_code=503, content={"error": "server busy"})
+
+    model = body.get("model", "fake")
+    prompt = body["messages"][-1]["content"]
+    content = answer_for(prompt, body.get("format"))
+
+    stats["running"] += 1
+    stats["max_running"] = max(stats["max_running"], stats["running"])
+
+    if not body.get("stream", True):
+        try:
+            await asyncio.sleep(DELAY)
+            return final_message(model, content, started, prompt)
+        finally:
+            stats["running"] -= 1
+
+    async def tokens():
+        try:
+            pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+            for piece in pieces:
+                await asyncio.sleep(DELAY / len(pieces))
+                yield json.dumps({"model": model, "message": {"role": "assistant", "content": piece}, "done": False}) + "\n"
+            yield json.dumps(final_message(model, "", started, prompt)) + "\n"
+        finally:
+            stats["running"] -= 1
+
+    return StreamingResponse(tokens(), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=PORT)
\ No newline at end of file
@@ -0,0 +1,403 @@
+"""
+Load test end-to-end dell'API, offline e riproducibile.
+Gira in processo contro app.main:app (httpx + ASGITransport, nessuna rete) con:
+  - motore XTTS finto (latenza simulata proporzionale alla lunghezza della frase e al batch),
+  - LLM finto (le risposte di experiments/fake_ollama, senza server),
+  - FilesystemStorage, cache LLM e coda di pre-render in una cartella temporanea (DATA_DIR, ogni run parte a cache vuota).
+Il run non deve lasciare nulla nel repository: se trova file nuovi o modificati (a parte i risultati) esce con codice 2.
+
+Traffico simulato:
+  - Visitatori: arrivano a gruppi (burst) su una tappa scelta con popolarità Zipf; ogni visitatore
+    ascolta le frasi della tappa in ordine, con probabilità di abbandono crescente.
+  - Autori: richieste /optimize/title e /optimize/description su un piccolo insieme di testi (in parte ripetuti).
+
+Risultati: p50/p95/p99, throughput, errori e hit ratio per endpoint, salvati in JSON insieme al commit.
+Con LOADTEST_BASELINE=<file.json> confronta con un run precedente ed esce con codice 1 se c'è una regressione.
+
+Avvio:
+    python experiments/load_test/api_load_test.py
+    LOADTEST_BASELINE=experiments/load_test/results/load_test_<commit>.json python experiments/load_test/api_load_test.py
+"""
+import os
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import asyncio
+import tempfile
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+
+# --- CONFIGURAZIONE ---
+SEED = int(os.getenv("LOADTEST_SEED", "42"))
+POIS = 40                   # Tappe del catalogo
+SENTENCES_PER_POI = 6
+ZIPF_EXPONENT = 1.1         # Popolarità delle tappe: poche molto visitate, coda lunga di tappe rare
+BURSTS = int(os.getenv("LOADTEST_BURSTS", "80"))
+BURST_RATE = float(os.getenv("LOADTEST_BURST_RATE", "4"))  # Gruppi in arrivo al secondo (processo di Poisson)
+GROUP_SIZE = (1, 8)         # Visitatori per gruppo
+GROUP_SPREAD = 1.0          # Secondi entro cui arrivano i visitatori di uno stesso gruppo
+LISTEN_DROP = 0.85          # Probabilità di ascoltare la frase successiva
+THINK_TIME = 0.05           # Secondi tra una frase e la successiva (prefetch dell'app)
+
+AUTHORING_RATE = float(os.getenv("LOADTEST_AUTHORING_RATE", "1"))  # Richieste /optimize al secondo
+AUTHORING_TEXTS = 8         # Testi distinti degli autori (le ripetizioni sono cache hit dell'LLM)
+
+TTS_BASE_MS = float(os.getenv("LOADTEST_TTS_BASE_MS", "40"))      # Latenza fissa del motore finto per batch
+TTS_MS_PER_CHAR = float(os.getenv("LOADTEST_TTS_MS_PER_CHAR", "1.5"))
+TTS_BATCH_OVERHEAD = 0.15   # Costo di ogni frase in più nello stesso batch, rispetto alla prima
+LLM_DELAY = float(os.getenv("LOADTEST_LLM_DELAY", "0.3"))         # Secondi per risposta dell'LLM finto
+LOCAL_CACHE = os.getenv("LOADTEST_LOCAL_CACHE", "0") == "1"       # Attiva il livello su disco locale
+
+REGRESSION_THRESHOLD = 0.10 # +10% di p95 o -10% di throughput rispetto alla baseline
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+OUTPUT = os.getenv("LOADTEST_OUTPUT")
+BASELINE = os.getenv("LOADTEST_BASELINE")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "experiments", "fake_ollama"))
+
+# Risposte dell'LLM finto: le stesse del server di experiments/fake_ollama
+os.environ["FAKE_OLLAMA_DELAY"] = str(LLM_DELAY)
+from fake_ollama_server import answer_for, final_message
+
+
+# --- MOTORE TTS FINTO ---
+
+class StubXttsEngine:
+    """
+    Stessa interfaccia di XttsEngine, senza modello: attende un tempo proporzionale al testo
+    (un batch costa la frase più lunga più TTS_BATCH_OVERHEAD per ogni frase in più) e produce byte finti.
+    """
+
+    name = "xtts"
+    PITCH_STEPS = -0.5
+    POLICY_ALWAYS = "always"
+
+    def __init__(self, *args, max_batch_size: int = 4, **kwargs):
+        self.max_batch_size = max_batch_size
+        self.request_count = 0
+        self.batch_count = 0
+
+    @classmethod
+    def cache_fingerprint(cls) -> dict:
+        return {"voice": "stub", "pitch": cls.PITCH_STEPS}
+
+    def _synthesize(self, texts):
+        from app.metrics import stage_timer
+        with stage_timer("synthesis"):
+            seconds = (TTS_BASE_MS + TTS_MS_PER_CHAR * max(len(t) for t in texts)) / 1000
+            time.sleep(seconds * (1 + TTS_BATCH_OVERHEAD * (len(texts) - 1)))
+        self.request_count += len(texts)
+        self.batch_count += 1
+        # ~1 KB di "MP3" ogni 10 caratteri: lo storage lavora con oggetti di dimensione realistica
+        return [b"ID3" + text.encode("utf-8") * 100 for text in texts]
+
+    def generate_audio_bytes(self, text: str, audio_format: str = "mp3"):
+        return self._synthesize([text])[0]
+
+    def generate_batch_bytes(self, texts, audio_format: str = "mp3"):
+        groups = [texts[start:start + self.max_batch_size] for start in range(0, len(texts), self.max_batch_size)]
+        return [data for group in groups for data in self._synthesize(group)]
+
+    def generate_audio(self, text: str, output_filename: str) -> bool:
+        with open(output_filename, "wb") as f:
+            f.write(self.generate_audio_bytes(text))
+        return True
+
+    def generate_batch(self, jobs):
+        return [self.generate_audio(text, output_filename) for text, output_filename in jobs]
+
+    def is_loaded(self) -> bool:
+        return True
+
+    def get_stats(self) -> dict:
+        return {"mode": "stub", "model_loaded": True, "request_count": self.request_count, "batch_count": self.batch_count}
+
+    def shutdown(self):
+        pass
+
+
+class StubOllamaClient:
+    """Al posto di ollama.AsyncClient: risposte del server finto, senza HTTP"""
+
+    async def chat(self, model: str, messages: list, keep_alive=None, stream: bool = False, format=None, **kwargs):
+        started = time.perf_counter()
+        prompt = messages[-1]["content"]
+        content = answer_for(prompt, format)
+        if not stream:
+            await asyncio.sleep(LLM_DELAY)
+            return final_message(model, content, started, prompt)
+
+        async def parts():
+            pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+            for piece in pieces:
+                await asyncio.sleep(LLM_DELAY / len(pieces))
+                yield {"model": model, "message": {"role": "assistant", "content": piece}, "done": False}
+            yield final_message(model, "", started, prompt)
+        return parts()
+
+
+def load_app(workdir: str):
+    """Importa app.main con i motori finti e tutto lo stato persistente sotto workdir"""
+    # La configurazione viene letta all'import: i percorsi dei dati vanno impostati prima
+    os.environ.update({
+        "DATA_DIR": workdir,
+        "STORAGE_BACKEND": "filesystem",
+        "STORAGE_FS_BASE_URL": "", # URL file://, niente StaticFiles
+        "LOCAL_CACHE_ENABLED": "1" if LOCAL_CACHE else "0",
+        "LOCAL_CACHE_MAX_BYTES": str(512 * 1024 ** 2),
+    })
+
+    # Il vero XttsEngine importa Coqui TTS e PyTorch: lo sostituiamo prima dell'import di app.main
+    stub_module = types.ModuleType("app.tts.coqui_engine")
+    stub_module.XttsEngine = StubXttsEngine
+    sys.modules["app.tts.coqui_engine"] = stub_module
+
+    import app.main as main
+
+    main.TTS_ENABLE_PIPER = False
+    stub_ollama = StubOllamaClient()
+    main.ollama_client._get_client = lambda: stub_ollama
+    return main
+
+
+# --- TRAFFICO ---
+
+def build_catalog(rng: random.Random) -> list:
+    """Frasi per tappa, diverse tra loro (ogni frase è un oggetto audio distinto)"""
+    subjects = ["l'abside", "il portico", "la cripta", "il chiostro", "l'arena", "la torre", "il mosaico", "la fontana"]
+    verbs = ["racconta", "custodisce", "nasconde", "ricorda", "mostra", "celebra"]
+    objects = ["secoli di storia", "un segreto dei costruttori", "la vita quotidiana degli antichi",
+               "il lavoro di mille artigiani", "una leggenda locale", "l'ingegno dei romani"]
+    return [
+        [
+            f"Tappa {poi + 1}: {rng.choice(subjects)} {rng.choice(verbs)} {rng.choice(objects)}, frase {i + 1}."
+            + " Guardate con attenzione i dettagli." * rng.randint(0, 3)
+            for i in range(SENTENCES_PER_POI)
+        ]
+        for poi in range(POIS)
+    ]
+
+
+def build_schedule(rng: random.Random, catalog: list) -> list:
+    """Lista ordinata di (istante, tipo, dati): visitatori (tappa, frasi da ascoltare) e richieste degli autori"""
+    weights = [1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(POIS)]
+    pois = list(range(POIS))
+    rng.shuffle(pois) # Le tappe popolari non sono per forza le prime del catalogo
+
+    schedule = []
+    now = 0.0
+    for _ in range(BURSTS):
+        now += rng.expovariate(BURST_RATE)
+        poi = rng.choices(pois, weights=weights)[0]
+        for _ in range(rng.randint(*GROUP_SIZE)):
+            listened = 1
+            while listened < SENTENCES_PER_POI and rng.random() < LISTEN_DROP:
+                listened += 1
+            schedule.append((now + rng.uniform(0, GROUP_SPREAD), "visitor", catalog[poi][:listened]))
+
+    duration = now
+    texts = [f"Descrizione della tappa {i + 1}: un monumento antico con una lunga storia da raccontare." for i in range(AUTHORING_TEXTS)]
+    now = 0.0
+    while AUTHORING_RATE > 0:
+        now += rng.expovariate(AUTHORING_RATE)
+        if now > duration:
+            break
+        schedule.append((now, rng.choice(["title", "description"]), rng.choice(texts)))
+
+    schedule.sort(key=lambda event: event[0])
+    return schedule
+
+
+# --- ESECUZIONE ---
+
+async def timed_post(client, samples: dict, endpoint: str, payload: dict) -> dict:
+    start = time.perf_counter()
+    body = {}
+    try:
+        response = await client.post(endpoint, json=payload)
+        status = response.status_code
+        body = response.json() if status == 200 else {}
+        cached = body.get("cached")
+    except Exception as e:
+        print(f"Errore {endpoint}: {e}")
+        status, cached = 0, None
+    samples[endpoint].append((time.perf_counter() - start, status, cached))
+    return body
+
+
+async def timed_download(client, samples: dict, url: str):
+    """Ascolto di un audio servito dall'API (cache locale): è qui che la cache conta l'hit"""
+    start = time.perf_counter()
+    try:
+        status = (await client.get(url)).status_code
+    except Exception as e:
+        print(f"Errore {url}: {e}")
+        status = 0
+    samples["GET /audio"].append((time.perf_counter() - start, status, None))
+
+
+async def visitor(client, samples: dict, sentences: list):
+    for text in sentences:
+        audio_url = (await timed_post(client, samples, "/generate-audio", {"text": text})).get("audio_url", "")
+        if audio_url.startswith("/"):
+            await timed_download(client, samples, audio_url)
+        await asyncio.sleep(THINK_TIME)
+
+
+async def replay(main, schedule: list) -> tuple:
+    import httpx
+
+    samples = defaultdict(list)
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120) as client:
+            tasks = []
+            start = time.perf_counter()
+            for at, kind, data in schedule:
+                delay = at - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if kind == "visitor":
+                    tasks.append(asyncio.create_task(visitor(client, samples, data)))
+                elif kind == "title":
+                    tasks.append(asyncio.create_task(timed_post(client, samples, "/optimize/title", {"original_title": data})))
+                else:
+                    tasks.append(asyncio.create_task(timed_post(client, samples, "/optimize/description", {"original_text": data})))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+
+            status = (await client.get("/tts/status")).json()
+    return samples, elapsed, status
+
+
+def percentile(values: list, q: float) -> float:
+    """Percentile con interpolazione lineare tra i campioni"""
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    summary = {}
+    for endpoint, rows in sorted(samples.items()):
+        latencies = sorted(latency for latency, status, _ in rows if status == 200)
+        statuses = defaultdict(int)
+        for _, status, _ in rows:
+            statuses[str(status)] += 1
+        cached = [c for _, status, c in rows if status == 200 and c is not None]
+        summary[endpoint] = {
+            "requests": len(rows),
+            "ok": len(latencies),
+            "errors": len(rows) - len(latencies),
+            "status": dict(statuses),
+            "throughput_rps": round(len(latencies) / elapsed, 3),
+            "mean_ms": round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            "p50_ms": round(1000 * percentile(latencies, 50), 2),
+            "p95_ms": round(1000 * percentile(latencies, 95), 2),
+            "p99_ms": round(1000 * percentile(latencies, 99), 2),
+            "max_ms": round(1000 * latencies[-1], 2) if latencies else 0.0,
+            "cache_hit_ratio": round(sum(cached) / len(cached), 3) if cached else 0.0,
+        }
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def repo_snapshot(exclude: list) -> set:
+    """File modificati, nuovi o ignorati del repository (bytecode e percorsi in exclude esclusi); None senza git"""
+    try:
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--ignored", "--untracked-files=all"],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+    except Exception:
+        return None
+    excluded = [os.path.relpath(path, ROOT).replace(os.sep, "/") for path in exclude]
+    return {
+        line for line in status.splitlines()
+        if "__pycache__" not in line and not any(line[3:].startswith(path) for path in excluded)
+    }
+
+
+def compare(results: dict, baseline: dict) -> bool:
+    """Stampa le differenze con la baseline; True se almeno un endpoint è peggiorato oltre la soglia"""
+    print(f"\n--- CONFRONTO CON {baseline['commit']} ---")
+    regression = False
+    for endpoint, current in results["endpoints"].items():
+        previous = baseline["endpoints"].get(endpoint)
+        if previous is None or not previous["p95_ms"] or not previous["throughput_rps"]:
+            continue
+        p95_delta = current["p95_ms"] / previous["p95_ms"] - 1
+        rps_delta = current["throughput_rps"] / previous["throughput_rps"] - 1
+        worse = p95_delta > REGRESSION_THRESHOLD or rps_delta < -REGRESSION_THRESHOLD
+        regression |= worse
+        print(f"{endpoint:<24} p95 {p95_delta:+7.1%} | throughput {rps_delta:+7.1%}{'  <-- REGRESSIONE' if worse else ''}")
+    return regression
+
+
+def main():
+    rng = random.Random(SEED)
+    catalog = build_catalog(rng)
+    schedule = build_schedule(rng, catalog)
+    visitors = sum(1 for _, kind, _ in schedule if kind == "visitor")
+    print(f"--- LOAD TEST: {BURSTS} gruppi, {visitors} visitatori, {len(schedule) - visitors} richieste autori, seed {SEED} ---")
+
+    output = OUTPUT or os.path.join(OUTPUT_DIR, f"load_test_{git_commit()}.json")
+    before = repo_snapshot([OUTPUT_DIR, output])
+    workdir = tempfile.mkdtemp(prefix="xrtour_loadtest_")
+    try:
+        app_main = load_app(workdir)
+        samples, elapsed, status = asyncio.run(replay(app_main, schedule))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    after = repo_snapshot([OUTPUT_DIR, output])
+    if before is not None and after != before:
+        print("ERRORE: il load test ha modificato il repository:")
+        for line in sorted(after ^ before):
+            print(f"  {line}")
+        sys.exit(2)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "seed": SEED, "pois": POIS, "sentences_per_poi": SENTENCES_PER_POI, "zipf_exponent": ZIPF_EXPONENT,
+            "bursts": BURSTS, "burst_rate": BURST_RATE, "group_size": GROUP_SIZE, "authoring_rate": AUTHORING_RATE,
+            "tts_base_ms": TTS_BASE_MS, "tts_ms_per_char": TTS_MS_PER_CHAR, "llm_delay": LLM_DELAY, "local_cache": LOCAL_CACHE,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "endpoints": summarize(samples, elapsed),
+        "server": {key: status.get(key) for key in ("executors", "singleflight", "batcher", "cache_tiers")},
+    }
+
+    print(f"\n{'endpoint':<24}{'req':>6}{'err':>5}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'hit':>7}")
+    for endpoint, row in results["endpoints"].items():
+        print(f"{endpoint:<24}{row['requests']:>6}{row['errors']:>5}{row['throughput_rps']:>8.2f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['cache_hit_ratio']:>7.1%}")
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nRisultati salvati in {output}")
+
+    if BASELINE:
+        with open(BASELINE, encoding="utf-8") as f:
+            if compare(results, json.load(f)):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
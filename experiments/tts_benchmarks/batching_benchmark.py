@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import asyncio
+import statistics
+import torch
+
+# Permette di lanciare lo script dalla sua cartella
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from app.tts.coqui_engine import XttsEngine
+from app.micro_batcher import MicroBatcher
+from app.executors import tts_executor
+
+# --- CONFIGURAZIONE ---
+BATCH_SIZES = [1, 2, 4, 8]
+WAIT_MS = [0, 10, 50]       # Finestre di attesa del micro-batcher (throughput vs latenza)
+CONCURRENT_REQUESTS = 8     # Richieste simultanee nella prova del micro-batcher
+AUDIO_FORMAT = "mp3"
+THREADS = int(os.getenv("BENCH_THREADS", torch.get_num_threads()))
+
+SENTENCES = [
+    "Benvenuti nel cuore di Roma, davanti al Colosseo, il più grande anfiteatro mai costruito.",
+    "Fu inaugurato nell'ottanta dopo Cristo dall'imperatore Tito, con cento giorni di giochi.",
+    "Alzate lo sguardo: le arcate in travertino si ripetono su tre ordini sovrapposti.",
+    "Qui potevano sedere oltre cinquantamila spettatori, divisi per rango sociale.",
+    "Sotto l'arena si snodava l'ipogeo, un labirinto di corridoi e montacarichi.",
+    "Gli animali e i gladiatori comparivano all'improvviso, tra lo stupore del pubblico.",
+    "Nel Medioevo il monumento divenne una cava di pietra per nuovi palazzi.",
+    "Oggi il Colosseo è il simbolo di Roma e una delle meraviglie del mondo moderno.",
+]
+
+
+def check_batch_of_one(engine: XttsEngine):
+    """Un batch da una frase deve dare lo stesso audio di Xtts.inference (stesso seed -> stessi codici GPT)"""
+    print(f"--- CONTROLLO: batch da 1 vs inference() ---")
+    profile = engine._device_profile
+    for text in SENTENCES[:3]:
+        with engine._lock, torch.no_grad():
+            torch.manual_seed(0)
+            batch_wav = engine._infer_batch([text])[0].reshape(-1)
+            torch.manual_seed(0)
+            single_wav = torch.as_tensor(engine.model.inference(
+                engine.normalizer.clean_text(text), "it", profile.gpt_cond_latent, profile.speaker_embedding,
+                speed=engine.GEN_SPEED, temperature=engine.TEMP, repetition_penalty=engine.REP_PENALTY,
+                top_k=engine.TOP_K, top_p=engine.TOP_P, enable_text_splitting=False, do_sample=True
+            )["wav"]).reshape(-1).cpu()
+
+        status = "OK" if batch_wav.shape == single_wav.shape else "LUNGHEZZA DIVERSA"
+        difference = (batch_wav - single_wav).abs().max().item() if status == "OK" else float("nan")
+        print(f"{status:<17} campioni batch {batch_wav.numel():>7} | inference {single_wav.numel():>7} | "
+              f"differenza massima {difference:.2e}")
+
+
+def bench_engine(engine: XttsEngine):
+    """Throughput del motore: tutte le frasi in gruppi da batch_size"""
+    print(f"--- XTTS su CPU: {len(SENTENCES)} frasi, {THREADS} thread ---")
+    results = {}
+    for batch_size in BATCH_SIZES:
+        engine.max_batch_size = batch_size
+        start = time.perf_counter()
+        blobs = engine.generate_batch_bytes(SENTENCES, AUDIO_FORMAT)
+        elapsed = time.perf_counter() - start
+
+        assert all(blobs), "Generazione fallita"
+        results[batch_size] = len(SENTENCES) / elapsed
+        # Ogni frase di un batch è pronta solo a fine batch: è la latenza vista dal client
+        batch_latency = elapsed / -(-len(SENTENCES) // batch_size)
+        print(f"batch {batch_size:>2}: {results[batch_size]:6.3f} frasi/s | {elapsed:7.2f}s totali | latenza per batch {batch_latency:6.2f}s")
+
+    base = results[BATCH_SIZES[0]]
+    for batch_size, throughput in results.items():
+        print(f"Speedup batch {batch_size}: x{throughput / base:.2f}")
+
+
+async def bench_scheduler(engine: XttsEngine):
+    """Micro-batcher: CONCURRENT_REQUESTS richieste simultanee con finestre di attesa diverse"""
+    print(f"\n--- MICRO-BATCHER: {CONCURRENT_REQUESTS} richieste simultanee ---")
+    engine.max_batch_size = max(BATCH_SIZES)
+    texts = (SENTENCES * CONCURRENT_REQUESTS)[:CONCURRENT_REQUESTS]
+
+    for batch_size in BATCH_SIZES:
+        for wait_ms in WAIT_MS:
+            batcher = MicroBatcher(
+                lambda items: tts_executor.run(engine.generate_batch_bytes, items, AUDIO_FORMAT),
+                max_batch_size=batch_size, max_wait_ms=wait_ms
+            )
+
+            async def timed(text):
+                start = time.perf_counter()
+                await batcher.submit(text)
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*[timed(text) for text in texts])
+            elapsed = time.perf_counter() - start
+
+            print(f"max_batch {batch_size:>2}, attesa {wait_ms:>3} ms: {len(texts) / elapsed:6.3f} frasi/s | "
+                  f"latenza mediana {statistics.median(latencies):6.2f}s | max {max(latencies):6.2f}s | "
+                  f"batch {batcher.stats()['batch_sizes']}")
+
+
+if __name__ == "__main__":
+    torch.set_num_threads(THREADS)
+    torch.manual_seed(0)
+
+    engine = XttsEngine(policy=XttsEngine.POLICY_ALWAYS)
+    # Riscaldamento (prima inferenza lenta per allocazioni e JIT)
+    engine.generate_batch_bytes(SENTENCES[:1], AUDIO_FORMAT)
+
+    check_batch_of_one(engine)
+    bench_engine(engine)
+    asyncio.run(bench_scheduler(engine))
+    engine.shutdown()
+    tts_executor.shutdown()
\ No newline at end of file
@@ -0,0 +1,138 @@
+import os
+import re
+import sys
+import time
+import random
+
+# Permette di lanciare lo script dalla sua cartella
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from app.tts.text_normalizer import TextNormalizer
+
+# --- CONFIGURAZIONE ---
+CORPUS_SIZE = 20000
+SEED = 42
+
+TOUR_SENTENCES = [
+    "Benvenuti nel 2024 d.C. alla Domus.",
+    "Il Wi-Fi si trova nella hall.",
+    "Opus reticulatum del I sec. a.C.",
+    "XRTourGuide è online!",
+    "Alzate lo sguardo verso l'abside: l'affresco racconta la vita del santo.",
+    "Nel Forum si incrociavano il cardus e il decumanus, cuore del castrum romano.",
+    "Il frigidarium, il tepidarium e il calidarium scandivano il rito delle terme.",
+    "Sulla lapide leggiamo HIC IACET e la sigla S.P.Q.R. incisa nel marmo.",
+    "La navata centrale conduce al presbiterio, oltre il transetto e sopra la cripta.",
+    "Questo ex voto fu donato alla pieve nel XII sec. d.C, dopo una grave pestilenza.",
+    "Nel tablinum e nel triclinium della domus restano tracce di opus incertum.",
+    "Il velarium proteggeva la cavea dal sole; oggi il Colosseo è touch friendly.",
+    "Anno Domini 1300: il Duomo e la Cattedrale si riempiono di pellegrini.",
+    "Prenotate il ticket, fate il check-in e attivate la modalità offline della location.",
+    "**Curiosità**: il [vomitorium] NON era dove si vomitava! 🙂",
+    "Ante Christum e Post Christum: le date dell'insula e delle insulae.",
+    "Il Gloria e il Magnificat risuonavano nell'ecclesia; poi il Requiem.",
+    "Pater, Filius et Spiritus Sanctus: Amen.",
+    "Dal 44 AC al 14 DC Roma cambia volto; item, ibidem, lapidarium.",
+    "Basilica, atrium, nartece: l'esperienza XR inizia qui.",
+]
+
+# Output attesi scritti a mano: voci attaccate, dove conta l'ordine delle sostituzioni
+# (dopo "s.p.q.r." la voce seguente non è più una parola a sé e non va sostituita)
+EXPECTED = {
+    "s.p.q.r.item": "esse pi qu erreitem\n",
+    "s.p.q.r.d.c.": "esse pi qu erred.c\n",
+    "s.p.q.r.a.c.": "esse pi qu errea.c\n",
+    "s.p.q.r.ibidem": "esse pi qu erreibidem\n",
+    "S.P.Q.R.ex voto": "esse pi qu erreex voto\n",
+    "ex voto.item": "ecs vòto.ìtem\n",
+    "sec.item": "secoloìtem\n",
+    "d.c.item": "dopo cristoìtem\n",
+    "a.c.ibidem": "avanti cristoibìdem\n",
+    "Nel 44 a.c.ex voto": "Nel 44 avanti cristoecs vòto\n",
+}
+
+
+class LegacyTextNormalizer(TextNormalizer):
+    """Implementazione storica (una re.sub per voce del dizionario), usata come riferimento golden"""
+
+    def _apply_replacements(self, text: str) -> str:
+        for original, phonetic in self.replacements.items():
+            pattern = r'(?i)'
+            if original[0].isalnum():
+                pattern += r'\b'
+            pattern += re.escape(original)
+            if original[-1].isalnum():
+                pattern += r'\b'
+            text = re.sub(pattern, phonetic, text)
+        return text
+
+    def clean_text(self, text: str) -> str:
+        text = re.sub(r'[\*\#\[\]\_\-]', '', text)
+        text = re.sub(r'[^\w\s\.,!\?;:àèéìòùÀÈÉÌÒÙ\'"]', '', text)
+        text = self._apply_replacements(text)
+        text = re.sub(r'\s+', ' ', text).strip()
+        if text.endswith((".", "!", "?")):
+            text = text[:-1]
+        return text + "\n"
+
+
+def build_golden_cases(keys):
+    """Ogni voce del dizionario in più grafie e contesti (inizio, fine, attaccata a punteggiatura o ad altre voci)"""
+    cases = list(TOUR_SENTENCES)
+    for key in keys:
+        for variant in (key, key.upper(), key.title()):
+            cases += [
+                variant,
+                f"{variant}.",
+                f"Ecco {variant}, poi altro.",
+                f"({variant})",
+                f"pre{variant} {variant}post",
+                f"{variant}{variant}",
+                f"{variant} {random.choice(keys)} {variant}!",
+            ]
+    # Tutte le coppie di voci, attaccate e separate da spazio
+    for first in keys:
+        for second in keys:
+            cases += [f"{first}{second}", f"{first} {second}", f"{first}.{second}"]
+    return cases
+
+
+def build_corpus(keys, size):
+    """Frasi di tour sintetiche: frasi reali mescolate con voci del dizionario"""
+    corpus = []
+    for _ in range(size):
+        words = random.choice(TOUR_SENTENCES).split()
+        for _ in range(random.randint(0, 3)):
+            words.insert(random.randint(0, len(words)), random.choice(keys))
+        corpus.append(" ".join(words))
+    return corpus
+
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    current = TextNormalizer()
+    legacy = LegacyTextNormalizer()
+    keys = list(current.replacements)
+
+    # --- GOLDEN: output attesi e output identico all'implementazione storica ---
+    mismatches = [(t, expected, current.clean_text(t)) for t, expected in EXPECTED.items() if current.clean_text(t) != expected]
+    golden = build_golden_cases(keys)
+    mismatches += [(t, legacy.clean_text(t), current.clean_text(t)) for t in golden if legacy.clean_text(t) != current.clean_text(t)]
+    golden += list(EXPECTED)
+    print(f"--- GOLDEN: {len(golden)} casi, {len(mismatches)} differenze ---")
+    for text, expected, got in mismatches[:20]:
+        print(f"IN : {text!r}\nOLD: {expected!r}\nNEW: {got!r}\n")
+
+    # --- BENCHMARK ---
+    corpus = build_corpus(keys, CORPUS_SIZE)
+    timings = {}
+    for name, normalizer in (("Storico (una regex per voce)", legacy), ("Regex precompilate in ordine", current)):
+        start = time.perf_counter()
+        for sentence in corpus:
+            normalizer.clean_text(sentence)
+        timings[name] = time.perf_counter() - start
+        print(f"{name:<30} {timings[name]:7.3f}s totali | {timings[name] / CORPUS_SIZE * 1e6:8.1f} µs/frase")
+
+    old, new = timings.values()
+    print(f"\nSpeedup: x{old / new:.1f}")
+
+    sys.exit(1 if mismatches else 0)
\ No newline at end of file
@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+import statistics
+
+# Permette di lanciare lo script dalla sua cartella
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from app.tts.piper_engine import PiperEngine
+
+# --- CONFIGURAZIONE ---
+ITERATIONS = 10
+AUDIO_FORMAT = "mp3"
+SENTENCE = "Benvenuti nel cuore di Roma, davanti al Colosseo, il più grande anfiteatro mai costruito."
+
+
+def measure(name, engine):
+    engine.generate_audio_bytes(SENTENCE, AUDIO_FORMAT) # Riscaldamento
+
+    timings = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        data = engine.generate_audio_bytes(SENTENCE, AUDIO_FORMAT)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert data, "Generazione fallita"
+
+    print(f"{name:<12} media {statistics.mean(timings):8.1f} ms | mediana {statistics.median(timings):8.1f} ms | min {min(timings):8.1f} ms")
+    return statistics.mean(timings)
+
+
+if __name__ == "__main__":
+    print(f"--- PIPER: frase da {len(SENTENCE)} caratteri, {ITERATIONS} iterazioni, formato {AUDIO_FORMAT} ---")
+    subprocess_ms = measure("Subprocess", PiperEngine(mode=PiperEngine.MODE_SUBPROCESS))
+    resident_ms = measure("Residente", PiperEngine(mode=PiperEngine.MODE_RESIDENT))
+
+    print(f"\nSpeedup: x{subprocess_ms / resident_ms:.2f}")
\ No newline at end of file
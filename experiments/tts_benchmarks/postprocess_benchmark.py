@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import statistics
+import torch
+import torchaudio.transforms as T
+
+# Permette di lanciare lo script dalla sua cartella
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from app.tts.postprocess import AudioPostProcessor
+
+# --- CONFIGURAZIONE ---
+INPUT_RATE = 24000
+PITCH_STEPS = -0.5
+SENTENCE_SECONDS = 8 # Durata tipica di un tts_chunk da 180 caratteri
+ITERATIONS = 30
+WARMUP = 3
+
+
+def legacy_postprocess(wav):
+    """Post-processing storico di XttsEngine: trasformazioni ricreate ad ogni frase"""
+    wav_tensor = torch.tensor(wav).unsqueeze(0)
+
+    if PITCH_STEPS != 0:
+        pitch_shifter = T.PitchShift(sample_rate=INPUT_RATE, n_steps=PITCH_STEPS)
+        wav_tensor = pitch_shifter(wav_tensor)
+
+    max_val = torch.abs(wav_tensor).max()
+    if max_val > 0: wav_tensor = wav_tensor / max_val * 0.95
+
+    resampler = T.Resample(orig_freq=INPUT_RATE, new_freq=44100, dtype=torch.float32)
+    return resampler(wav_tensor).detach().cpu()
+
+
+def measure(name, fn, wav):
+    with torch.no_grad():
+        for _ in range(WARMUP):
+            fn(wav)
+
+        timings = []
+        for _ in range(ITERATIONS):
+            start = time.perf_counter()
+            fn(wav)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    print(f"{name:<32} media {statistics.mean(timings):8.2f} ms | mediana {statistics.median(timings):8.2f} ms | min {min(timings):8.2f} ms")
+    return statistics.mean(timings)
+
+
+if __name__ == "__main__":
+    torch.manual_seed(0)
+    wav = (torch.randn(INPUT_RATE * SENTENCE_SECONDS) * 0.3).numpy()
+
+    print(f"--- POST-PROCESSING XTTS: frase da {SENTENCE_SECONDS}s, {ITERATIONS} iterazioni, {torch.get_num_threads()} thread ---")
+    legacy = measure("Storico (transform per frase)", legacy_postprocess, wav)
+    postprocessor = AudioPostProcessor(INPUT_RATE, PITCH_STEPS, 44100)
+    cached = measure("Pipeline in cache (44.1 kHz)", postprocessor, wav)
+    native = measure("Pipeline in cache (24 kHz)", AudioPostProcessor(INPUT_RATE, PITCH_STEPS, INPUT_RATE), wav)
+
+    print(f"\nSpeedup 44.1 kHz: x{legacy / cached:.2f}")
+    print(f"Speedup 24 kHz:   x{legacy / native:.2f}")
+
+    # La pipeline in cache deve produrre lo stesso audio di quella storica (la chiave di cache non cambia)
+    with torch.no_grad():
+        difference = (legacy_postprocess(wav) - postprocessor(wav)).abs().max().item()
+    print(f"Differenza massima dallo storico: {difference:.2e}")
\ No newline at end of file